@@ -0,0 +1,196 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from knowledge_dedup import normalize_question
+
+
+def context_fingerprint(parts: Iterable[str]) -> str:
+    """Order-insensitive digest of what went into a prompt (chunk ids, KB ids, selection hashes...)."""
+    digest = hashlib.sha256()
+    for part in sorted(set(parts)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    context: dict
+    created_at: float
+    # kind ("document", "kb") -> ids this answer depends on
+    tags: Dict[str, Set[int]] = field(default_factory=dict)
+    hits: int = 0
+
+
+class AnswerCache:
+    """
+    In-process exact-answer cache for /ask, keyed by (model, normalized
+    question, context fingerprint). Entries expire after ``ttl`` seconds and
+    the least recently used are evicted past ``max_entries``. Each entry is
+    tagged with the documents and KB entries it was built from, so changes
+    to any of them drop it via ``invalidate``.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, str, str], CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(model: str, question: str, fingerprint: str) -> Tuple[str, str, str]:
+        return (model, normalize_question(question), fingerprint)
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[CachedAnswer]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry.created_at >= self.ttl:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            return entry
+
+    def put(self, key: Tuple[str, str, str], answer: str, context: dict, tags: Optional[Dict[str, Iterable[int]]] = None):
+        if not self.max_entries:
+            return
+        entry = CachedAnswer(
+            answer=answer,
+            context=context,
+            created_at=self._clock(),
+            tags={kind: set(ids) for kind, ids in (tags or {}).items()},
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, kind: str, ids: Iterable[int]) -> int:
+        """Drop entries that depend on any of ``ids`` of the given kind."""
+        ids = set(ids)
+        if not ids:
+            return 0
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.tags.get(kind, set()) & ids]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def invalidate_question(self, question: str) -> int:
+        """Drop every entry for ``question`` (any model or context), e.g. after a correction."""
+        normalized = normalize_question(question)
+        with self._lock:
+            stale = [key for key in self._entries if key[1] == normalized]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def jaccard(a: Iterable[str], b: Iterable[str]) -> float:
+    a, b = set(a), set(b)
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def pick_semantic_match(
+    candidates: Iterable[dict],
+    context_keys: Iterable[str],
+    max_distance: float,
+    min_overlap: float,
+) -> Optional[dict]:
+    """
+    First candidate (nearest first, each with "distance" and "context_keys")
+    close enough in question embedding and sharing enough retrieved context.
+    The match is returned with its "overlap" filled in.
+    """
+    context_keys = set(context_keys)
+    for candidate in candidates:
+        if candidate["distance"] > max_distance:
+            break
+        overlap = jaccard(candidate.get("context_keys") or (), context_keys)
+        if overlap >= min_overlap:
+            return dict(candidate, overlap=overlap)
+    return None
+
+
+class SemanticCacheMetrics:
+    """Hit/miss/opt-out counters and lookup latency for the semantic answer cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.opt_outs = 0
+        self.errors = 0
+        self._lookups = 0
+        self._lookup_seconds = 0.0
+        self._max_lookup_seconds = 0.0
+
+    def record_lookup(self, seconds: float, hit: bool):
+        with self._lock:
+            self._lookups += 1
+            self._lookup_seconds += seconds
+            self._max_lookup_seconds = max(self._max_lookup_seconds, seconds)
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_opt_out(self):
+        with self._lock:
+            self.opt_outs += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / self._lookups, 3) if self._lookups else None,
+                "opt_outs": self.opt_outs,
+                "errors": self.errors,
+                "avg_lookup_ms": round(self._lookup_seconds / self._lookups * 1000, 2) if self._lookups else None,
+                "max_lookup_ms": round(self._max_lookup_seconds * 1000, 2),
+            }
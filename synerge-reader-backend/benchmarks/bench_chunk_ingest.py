@@ -0,0 +1,84 @@
+"""
+Benchmark chunk ingestion: row-by-row INSERT vs. binary COPY.
+
+Runs against DB_CONNECTION_STRING inside transactions that are rolled back,
+so nothing is left behind. Usage:
+
+    python benchmarks/bench_chunk_ingest.py --rows 600 --repeat 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dbSetup import connect_to_postgres, copy_document_chunks
+
+
+def _insert_document(cursor) -> int:
+    cursor.execute(
+        """
+        INSERT INTO documents (filename, upload_timestamp, content)
+        VALUES (%s, %s, %s)
+        RETURNING id
+        """,
+        ("__bench__.txt", "1970-01-01T00:00:00", ""),
+    )
+    return cursor.fetchone()[0]
+
+
+def insert_row_by_row(conn, chunks, embeddings) -> float:
+    c = conn.cursor()
+    doc_id = _insert_document(c)
+    started = time.perf_counter()
+    for i, (chunk, emb) in enumerate(zip(chunks, embeddings)):
+        c.execute(
+            """
+            INSERT INTO document_chunks
+            (document_id, chunk_text, chunk_index, embedding)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (doc_id, chunk, i, emb),
+        )
+    elapsed = time.perf_counter() - started
+    conn.rollback()
+    return elapsed
+
+
+def insert_with_copy(conn, chunks, embeddings) -> float:
+    c = conn.cursor()
+    doc_id = _insert_document(c)
+    started = time.perf_counter()
+    copy_document_chunks(conn, doc_id, chunks, embeddings)
+    elapsed = time.perf_counter() - started
+    conn.rollback()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=600)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    conn = connect_to_postgres()
+    if conn is None:
+        sys.exit("Could not connect to PostgreSQL (check DB_CONNECTION_STRING)")
+
+    rng = random.Random(0)
+    chunks = [" ".join(f"word{rng.randint(0, 9999)}" for _ in range(80)) for _ in range(args.rows)]
+    embeddings = [[rng.uniform(-1, 1) for _ in range(args.dim)] for _ in range(args.rows)]
+
+    try:
+        for name, fn in (("row-by-row INSERT", insert_row_by_row), ("binary COPY", insert_with_copy)):
+            best = min(fn(conn, chunks, embeddings) for _ in range(args.repeat))
+            print(f"{name:>18}: {args.rows / best:10.0f} rows/sec  (best of {args.repeat}: {best * 1000:.1f} ms)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Micro-benchmark: legacy word-list chunk_text vs. chunking.iter_chunks.
+
+Uses the sample documents in ../tests (PDFs need pdfplumber) plus a
+synthetic document at the 300,000-character extraction limit. Usage:
+
+    python benchmarks/bench_chunking.py --repeat 5
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from chunking import iter_chunks
+from document_parser import MAX_EXTRACTED_CHARS, ExtractionError, extract_text_from_upload
+
+REPO_TESTS = os.path.join(os.path.dirname(__file__), "..", "..", "tests")
+
+
+def legacy_chunk_text(text: str, max_chunk_size: int = 500) -> list:
+    """The pre-chunking.py implementation, kept here as the baseline."""
+    if not text.strip():
+        return []
+
+    words = text.split()
+    chunks = []
+    current = []
+
+    for word in words:
+        current_size = sum(len(w) for w in current) + len(current) - 1
+        if current_size + len(word) + 1 <= max_chunk_size:
+            current.append(word)
+        else:
+            if current:
+                chunks.append(" ".join(current))
+            current = [word]
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def load_documents() -> dict:
+    docs = {}
+    paths = glob.glob(os.path.join(REPO_TESTS, "Documents", "*")) + glob.glob(
+        os.path.join(REPO_TESTS, "*.txt")
+    )
+    for path in sorted(paths):
+        with open(path, "rb") as f:
+            content = f.read()
+        try:
+            docs[os.path.basename(path)] = extract_text_from_upload(path, content).text
+        except ExtractionError as e:
+            print(f"skipping {os.path.basename(path)}: {e.user_message}")
+
+    rng = random.Random(0)
+    words, size = [], 0
+    while size < MAX_EXTRACTED_CHARS:
+        word = "x" * rng.randint(1, 12) + ("." if rng.random() < 0.06 else "")
+        words.append(word)
+        size += len(word) + 1
+    docs["synthetic-300k"] = " ".join(words)[:MAX_EXTRACTED_CHARS]
+    return docs
+
+
+def best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--size", type=int, default=500)
+    parser.add_argument("--overlap", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'document':<36}{'chars':>9}{'legacy ms':>11}{'new ms':>9}{'chunks':>14}")
+    for name, text in load_documents().items():
+        legacy = best_of(args.repeat, lambda: legacy_chunk_text(text, args.size))
+        new = best_of(
+            args.repeat, lambda: list(iter_chunks(text, args.size, overlap=args.overlap))
+        )
+        counts = f"{len(legacy_chunk_text(text, args.size))}/{len(list(iter_chunks(text, args.size, overlap=args.overlap)))}"
+        print(f"{name[:35]:<36}{len(text):>9}{legacy * 1000:>11.1f}{new * 1000:>9.1f}{counts:>14}")
+
+
+if __name__ == "__main__":
+    main()
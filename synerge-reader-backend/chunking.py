@@ -0,0 +1,112 @@
+import re
+from typing import Iterable, Iterator, List, Tuple, Union
+
+# A word followed by the whitespace that separates it from the next one.
+_WORD_RE = re.compile(r"(\S+)(\s*)")
+# Terminal punctuation, optionally followed by closing quotes/brackets.
+_SENTENCE_END_RE = re.compile(r"[.!?][\"'”’)\]]*$")
+
+
+def _iter_words(source: Union[str, Iterable[str]]) -> Iterator[Tuple[str, bool, bool]]:
+    """
+    Yield (word, ends_sentence, ends_paragraph) for every word in ``source``.
+
+    ``source`` is either one string or an iterable of text segments (e.g.
+    pages as they come out of extraction); a segment end counts as a
+    paragraph break.
+    """
+    segments = (source,) if isinstance(source, str) else source
+    for segment in segments:
+        pending = None
+        for match in _WORD_RE.finditer(segment):
+            if pending is not None:
+                yield pending
+            word, gap = match.group(1), match.group(2)
+            ends_paragraph = gap.count("\n") >= 2
+            ends_sentence = ends_paragraph or bool(_SENTENCE_END_RE.search(word))
+            pending = (word, ends_sentence, ends_paragraph)
+        if pending is not None:
+            yield (pending[0], True, True)
+
+
+def _overlap_tail(words: List[str], overlap: int) -> List[str]:
+    """Trailing words of a finished chunk that fit in ``overlap`` characters."""
+    if overlap <= 0:
+        return []
+    size = -1
+    start = len(words)
+    while start > 0 and size + len(words[start - 1]) + 1 <= overlap:
+        start -= 1
+        size += len(words[start]) + 1
+    return words[start:]
+
+
+def iter_chunks(
+    source: Union[str, Iterable[str]],
+    max_chunk_size: int = 500,
+    overlap: int = 0,
+    min_fill: float = 0.5,
+) -> Iterator[str]:
+    """
+    Stream chunks of at most ``max_chunk_size`` characters.
+
+    Chunks are cut at the last paragraph break, else the last sentence end,
+    as long as that keeps the chunk at least ``min_fill`` full; otherwise at
+    the last word that fits. Each chunk after the first starts with up to
+    ``overlap`` characters of trailing words from the previous one.
+
+    Lengths are tracked incrementally, so the work is linear in the input
+    and only the words of the chunk being built are held in memory.
+    """
+    if max_chunk_size <= 0:
+        raise ValueError("max_chunk_size must be positive")
+    if not 0 <= overlap < max_chunk_size:
+        raise ValueError("overlap must be between 0 and max_chunk_size")
+
+    min_length = max_chunk_size * min_fill
+    words: List[str] = []
+    length = 0
+    carried = 0  # leading words copied from the previous chunk as overlap
+    sentence_cut = paragraph_cut = 0
+    sentence_len = paragraph_len = 0
+
+    for word, ends_sentence, ends_paragraph in _iter_words(source):
+        added = len(word) + (1 if words else 0)
+        if words and length + added > max_chunk_size and len(words) > carried:
+            if paragraph_cut > carried and paragraph_len >= min_length:
+                cut = paragraph_cut
+            elif sentence_cut > carried and sentence_len >= min_length:
+                cut = sentence_cut
+            else:
+                cut = len(words)
+
+            chunk = words[:cut]
+            yield " ".join(chunk)
+
+            rest = words[cut:]
+            tail = _overlap_tail(chunk, overlap)
+            rest_len = len(" ".join(rest))
+            tail_len = len(" ".join(tail))
+            length = tail_len + rest_len + (1 if tail and rest else 0)
+            if tail and length + len(word) + 1 > max_chunk_size:
+                tail, length = [], rest_len
+            words = tail + rest
+            carried = len(tail)
+            paragraph_cut = paragraph_len = 0
+            if sentence_cut > cut:
+                # A sentence ended after the paragraph break we cut at; keep it.
+                sentence_cut += carried - cut
+                sentence_len = len(" ".join(words[:sentence_cut]))
+            else:
+                sentence_cut = sentence_len = 0
+            added = len(word) + (1 if words else 0)
+
+        words.append(word)
+        length += added
+        if ends_sentence:
+            sentence_cut, sentence_len = len(words), length
+        if ends_paragraph:
+            paragraph_cut, paragraph_len = len(words), length
+
+    if len(words) > carried:
+        yield " ".join(words)
@@ -1,20 +1,192 @@
+import io
 import os
+import struct
+import tempfile
+import threading
+import time
 import psycopg2
+import psycopg2.pool
 import sys
+from contextlib import contextmanager
 from dotenv import load_dotenv
 from pgvector.psycopg2 import register_vector
+from knowledge_dedup import question_hash
+
+load_dotenv()
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections idle for longer than this are pinged before being handed out.
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30"))
+# How many pooled connections to try before giving up on a broken pool
+DB_POOL_CHECKOUT_ATTEMPTS = int(os.getenv("DB_POOL_CHECKOUT_ATTEMPTS", "3"))
+
+# Approximate nearest-neighbour indexes on embedding columns ("hnsw" or "ivfflat").
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").strip().lower()
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "16"))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "64"))
+VECTOR_IVFFLAT_LISTS = int(os.getenv("VECTOR_IVFFLAT_LISTS", "100"))
+# Query-time recall/speed trade-off, applied to every pooled connection.
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "40"))
+VECTOR_IVFFLAT_PROBES = int(os.getenv("VECTOR_IVFFLAT_PROBES", "10"))
+
+# (table, column) -> index name for every managed vector index.
+VECTOR_INDEXES = {
+    ("document_chunks", "embedding"): "document_chunks_embedding_idx",
+    ("knowledge_base", "embedding"): "knowledge_base_embedding_idx",
+    ("chat_history", "question_embedding"): "chat_history_question_embedding_idx",
+}
+
+# Text search configuration for the generated tsvector columns and queries.
+TEXT_SEARCH_CONFIG = "english"
+
+# table -> (tsvector column, source expression) for full-text search.
+FULL_TEXT_COLUMNS = {
+    "document_chunks": ("chunk_tsv", "chunk_text"),
+    "chat_history": ("question_tsv", "coalesce(question, '') || ' ' || coalesce(selected_text, '')"),
+    "knowledge_base": ("question_tsv", "coalesce(question, '') || ' ' || coalesce(corrected_answer, '')"),
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = None
+_last_used = {}
+
+
+class VectorConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """Threaded pool whose connections come ready for pgvector queries."""
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        register_vector(conn)
+        apply_vector_search_settings(conn)
+        conn.commit()
+        return conn
+
+
+def apply_vector_search_settings(conn):
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute("SET hnsw.ef_search = %s", (VECTOR_HNSW_EF_SEARCH,))
+            cursor.execute("SET ivfflat.probes = %s", (VECTOR_IVFFLAT_PROBES,))
+        except psycopg2.Error as error:
+            print(f"Could not apply vector search settings: {error}")
+            conn.rollback()
+
+
+def _ensure_vector_extension(connection_string: str):
+    # Runs once per process; new pooled connections only need the type registered.
+    connection = psycopg2.connect(connection_string)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS vector;')
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def init_pool():
+    """Create the shared connection pool (idempotent)."""
+    global _pool, _pool_slots
+    if _pool is not None:
+        return _pool
+    with _pool_lock:
+        if _pool is None:
+            connection_string = os.getenv("DB_CONNECTION_STRING")
+            print('Connecting to the PostgreSQL database...')
+            _ensure_vector_extension(connection_string)
+            max_size = max(1, DB_POOL_MAX_SIZE)
+            min_size = max(0, min(DB_POOL_MIN_SIZE, max_size))
+            _pool_slots = threading.BoundedSemaphore(max_size)
+            _pool = VectorConnectionPool(min_size, max_size, connection_string)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+
+def _is_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    last_used = _last_used.get(id(conn), 0)
+    if time.monotonic() - last_used < DB_POOL_HEALTH_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def db_connection():
+    """
+    Borrow a pooled connection for the duration of a ``with`` block.
+
+    Callers commit explicitly; anything left uncommitted (or an exception)
+    is rolled back before the connection goes back to the pool.
+    """
+    pool = init_pool()
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise psycopg2.pool.PoolError("Timed out waiting for a database connection")
+    conn = None
+    try:
+        # Stale connections are discarded; replacements are checked the same way
+        for _ in range(max(1, DB_POOL_CHECKOUT_ATTEMPTS)):
+            conn = pool.getconn()
+            if _is_healthy(conn):
+                break
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            conn = None
+        if conn is None:
+            raise psycopg2.pool.PoolError("No healthy database connection available")
+        yield conn
+    finally:
+        if conn is not None:
+            broken = conn.closed != 0
+            if not broken:
+                try:
+                    conn.rollback()
+                    _last_used[id(conn)] = time.monotonic()
+                except psycopg2.Error:
+                    broken = True
+            if broken:
+                _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=broken)
+        _pool_slots.release()
+
+
+def pool_status() -> dict:
+    """Snapshot of pool usage for diagnostics."""
+    if _pool is None:
+        return {"initialized": False}
+    return {
+        "initialized": True,
+        "min_size": _pool.minconn,
+        "max_size": _pool.maxconn,
+        "in_use": len(_pool._used),
+        "idle": len(_pool._pool),
+    }
 
 
 def connect_to_postgres():
-    load_dotenv()
-    connection = None
-    cursor = None
+    """Open a standalone (unpooled) connection, e.g. for scripts."""
     try:
         connection_string = os.getenv("DB_CONNECTION_STRING")
         print('Connecting to the PostgreSQL database...')
         connection = psycopg2.connect(connection_string)
-        cursor = connection.cursor()
-        cursor.execute('CREATE EXTENSION IF NOT EXISTS vector;')
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS vector;')
         connection.commit()
         register_vector(connection)
         return connection
@@ -22,9 +194,107 @@ def connect_to_postgres():
     except psycopg2.DatabaseError as error:
         print(f"Database error: {error}")
         return None
-    finally:
-        if cursor is not None and not cursor.closed:
-            cursor.close()
+
+
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_COPY_TRAILER = struct.pack("!h", -1)
+
+
+def _write_chunk_rows(buf, rows):
+    """Append (document_id, chunk_text, chunk_index, embedding) tuples as binary COPY tuples."""
+    for document_id, chunk, chunk_index, embedding in rows:
+        text = chunk.replace("\x00", "").encode("utf-8")
+        buf.write(struct.pack("!hii", 4, 4, document_id))
+        buf.write(struct.pack("!i", len(text)))
+        buf.write(text)
+        buf.write(struct.pack("!ii", 4, chunk_index))
+        if embedding is None:
+            buf.write(struct.pack("!i", -1))
+        else:
+            dim = len(embedding)
+            buf.write(struct.pack(f"!ihh{dim}f", 4 + 4 * dim, dim, 0, *embedding))
+
+
+def _encode_chunk_rows(rows) -> io.BytesIO:
+    """
+    Encode (document_id, chunk_text, chunk_index, embedding) rows in
+    PostgreSQL's binary COPY format. Vectors use pgvector's binary layout:
+    int16 dimensions, int16 unused, then float4 values.
+    """
+    buf = io.BytesIO()
+    buf.write(_COPY_SIGNATURE)
+    _write_chunk_rows(buf, rows)
+    buf.write(_COPY_TRAILER)
+    buf.seek(0)
+    return buf
+
+
+def copy_document_chunks(conn, document_id: int, chunks: list, embeddings: list, start_index: int = 0) -> int:
+    """
+    Bulk-load chunk rows and their vectors with a single binary COPY.
+    Runs inside the caller's transaction; the caller commits.
+    """
+    rows = [
+        (document_id, chunk, start_index + i, emb)
+        for i, (chunk, emb) in enumerate(zip(chunks, embeddings))
+    ]
+    if not rows:
+        return 0
+    with conn.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY document_chunks (document_id, chunk_text, chunk_index, embedding) "
+            "FROM STDIN WITH (FORMAT binary)",
+            _encode_chunk_rows(rows),
+        )
+    return len(rows)
+
+
+class ChunkSpool:
+    """
+    One document's chunk rows, encoded for binary COPY as they are embedded
+    and staged in a temp file (in memory up to ``max_memory`` bytes). Lets
+    ingestion embed without holding a pooled connection, then load every
+    chunk in one COPY inside a short final transaction.
+    """
+
+    def __init__(self, document_id: int, max_memory: int = 8 * 1024 * 1024):
+        self.document_id = document_id
+        self.rows = 0
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        self._file.write(_COPY_SIGNATURE)
+
+    def add(self, chunks: list, embeddings: list) -> int:
+        rows = [
+            (self.document_id, chunk, self.rows + i, emb)
+            for i, (chunk, emb) in enumerate(zip(chunks, embeddings))
+        ]
+        _write_chunk_rows(self._file, rows)
+        self.rows += len(rows)
+        return len(rows)
+
+    def copy_into(self, conn) -> int:
+        """COPY the staged rows in the caller's transaction; the caller commits."""
+        if not self.rows:
+            return 0
+        self._file.write(_COPY_TRAILER)
+        self._file.seek(0)
+        with conn.cursor() as cursor:
+            cursor.copy_expert(
+                "COPY document_chunks (document_id, chunk_text, chunk_index, embedding) "
+                "FROM STDIN WITH (FORMAT binary)",
+                self._file,
+            )
+        return self.rows
+
+    def close(self):
+        self._file.close()
+
+
+def reserve_document_id(conn) -> int:
+    """Take the next documents.id without inserting the row yet."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence('documents', 'id'))")
+        return cursor.fetchone()[0]
 
 
 def test_postgres_connection():
@@ -49,11 +319,18 @@ def test_postgres_connection():
 
 
 def init_db():
-    conn = connect_to_postgres()
-    if conn is None:
+    try:
+        init_pool()
+    except psycopg2.Error as error:
+        print(f"Database error: {error}")
         print(" Failed to connect to PostgreSQL. Exiting")
         sys.exit(1)
 
+    with db_connection() as conn:
+        _create_schema(conn)
+
+
+def _create_schema(conn):
     cursor = conn.cursor()
 
 
@@ -146,6 +423,25 @@ def init_db():
         FOREIGN KEY (user_id) REFERENCES users (id)
     )
     """)
+    cursor.execute("""
+    ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS question_embedding vector(768)
+    """)
+    # Model, retrieved-context keys and context scope (source + header digest)
+    # of each answer, for the semantic answer cache
+    cursor.execute("""
+    ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS model TEXT
+    """)
+    cursor.execute("""
+    ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS context_keys TEXT[]
+    """)
+    cursor.execute("""
+    ALTER TABLE chat_history ADD COLUMN IF NOT EXISTS context_scope TEXT
+    """)
+    # Per-user history scans, newest first
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS chat_history_user_id_idx
+    ON chat_history (user_id, id DESC)
+    """)
 
     # Knowledge base — with semantic matching, source attribution, usage tracking
     cursor.execute("""
@@ -169,6 +465,7 @@ def init_db():
         ("corrected_by", "TEXT"),
         ("usage_count", "INTEGER DEFAULT 0"),
         ("embedding", "vector(768)"),
+        ("question_hash", "TEXT"),
     ]:
         try:
             cursor.execute(f"""
@@ -177,13 +474,259 @@ def init_db():
         except Exception as e:
             print(f"Column {col} may already exist: {e}")
             conn.rollback()
-    
 
+    # Exact-duplicate lookups for KB writes (see knowledge_dedup.py)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS knowledge_base_question_hash_idx
+    ON knowledge_base (question_hash)
+    """)
+    cursor.execute("SELECT id, question FROM knowledge_base WHERE question_hash IS NULL")
+    missing = cursor.fetchall()
+    if missing:
+        cursor.executemany(
+            "UPDATE knowledge_base SET question_hash = %s WHERE id = %s",
+            [(question_hash(question), entry_id) for entry_id, question in missing],
+        )
 
-  
+    ensure_full_text_columns(cursor)
 
+    # Time-bucketed KB usage, written in batches by usage_aggregator.py
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS kb_usage_history (
+        entry_id INTEGER NOT NULL REFERENCES knowledge_base (id) ON DELETE CASCADE,
+        bucket_start TIMESTAMPTZ NOT NULL,
+        uses INTEGER NOT NULL,
+        PRIMARY KEY (entry_id, bucket_start)
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS kb_usage_history_bucket_idx
+    ON kb_usage_history (bucket_start)
+    """)
 
+    # Precomputed map-reduce summaries: one row per section plus one
+    # document-level row (section_index -1), written by the summary job
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS document_summaries (
+        document_id INTEGER NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
+        level TEXT NOT NULL CHECK (level IN ('section', 'document')),
+        section_index INTEGER NOT NULL,
+        summary TEXT NOT NULL,
+        model TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (document_id, level, section_index)
+    )
+    """)
+
+    # Content-addressed embedding cache (persistent tier). The vector column is
+    # left undimensioned so entries for any embedding model can live side by side.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        model TEXT NOT NULL,
+        text_sha256 TEXT NOT NULL,
+        embedding vector NOT NULL,
+        created_at TIMESTAMPTZ DEFAULT now(),
+        PRIMARY KEY (model, text_sha256)
+    )
+    """)
+
+    # Durable background job queue (see job_queue.py). Workers claim rows
+    # with FOR UPDATE SKIP LOCKED; the partial index covers claimable rows.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS background_jobs (
+        id BIGSERIAL PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+        priority INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        run_after TIMESTAMPTZ NOT NULL DEFAULT now(),
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        started_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ,
+        locked_by TEXT,
+        locked_until TIMESTAMPTZ,
+        last_error TEXT,
+        result JSONB
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS background_jobs_claim_idx
+    ON background_jobs (priority DESC, run_after, id)
+    WHERE status IN ('queued', 'running')
+    """)
 
     conn.commit()
-    conn.close()
+
+    ensure_vector_indexes(conn)
+
+
+def ensure_full_text_columns(cursor):
+    """
+    Add a generated tsvector column with a GIN index to every table in
+    FULL_TEXT_COLUMNS. Adding the column rewrites the table once.
+    """
+    for table, (column, source) in FULL_TEXT_COLUMNS.items():
+        cursor.execute(f"""
+            ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} tsvector
+            GENERATED ALWAYS AS (to_tsvector('{TEXT_SEARCH_CONFIG}', {source})) STORED
+        """)
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table}_{column}_idx
+            ON {table} USING GIN ({column})
+        """)
+
+
+def _vector_index_options() -> dict:
+    if VECTOR_INDEX_TYPE == "ivfflat":
+        return {"lists": VECTOR_IVFFLAT_LISTS}
+    return {"m": VECTOR_HNSW_M, "ef_construction": VECTOR_HNSW_EF_CONSTRUCTION}
+
+
+def ensure_vector_indexes(conn):
+    """
+    Create (or rebuild, if the configured type/parameters changed) the
+    cosine-distance ANN index on every column in VECTOR_INDEXES.
+    """
+    if VECTOR_INDEX_TYPE not in ("hnsw", "ivfflat"):
+        print(f"Unknown VECTOR_INDEX_TYPE '{VECTOR_INDEX_TYPE}', skipping vector indexes")
+        return
+
+    options = _vector_index_options()
+    expected_options = sorted(f"{k}={v}" for k, v in options.items())
+    with_clause = ", ".join(f"{k} = {int(v)}" for k, v in options.items())
+    cursor = conn.cursor()
+
+    for (table, column), index_name in VECTOR_INDEXES.items():
+        try:
+            cursor.execute(
+                """
+                SELECT am.amname, COALESCE(cls.reloptions, '{}'), idx.indisvalid
+                FROM pg_class cls
+                JOIN pg_index idx ON idx.indexrelid = cls.oid
+                JOIN pg_am am ON am.oid = cls.relam
+                WHERE cls.relname = %s
+                """,
+                (index_name,),
+            )
+            row = cursor.fetchone()
+            if row:
+                method, reloptions, is_valid = row
+                if method == VECTOR_INDEX_TYPE and sorted(reloptions) == expected_options and is_valid:
+                    continue
+                print(f"Rebuilding {index_name} ({method} {reloptions} -> {VECTOR_INDEX_TYPE} {expected_options})")
+                cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+
+            print(f"Building {VECTOR_INDEX_TYPE} index {index_name} on {table}.{column}")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} "
+                f"USING {VECTOR_INDEX_TYPE} ({column} vector_cosine_ops) WITH ({with_clause})"
+            )
+            conn.commit()
+        except psycopg2.Error as error:
+            print(f"Failed to build vector index {index_name}: {error}")
+            conn.rollback()
+
+
+def vector_index_status(conn) -> list:
+    """Describe each managed vector index: method, build options, validity, size."""
+    cursor = conn.cursor()
+    statuses = []
+    for (table, column), index_name in VECTOR_INDEXES.items():
+        cursor.execute(
+            """
+            SELECT am.amname, COALESCE(cls.reloptions, '{}'), idx.indisvalid,
+                   pg_relation_size(cls.oid), tbl.reltuples::bigint
+            FROM pg_class cls
+            JOIN pg_index idx ON idx.indexrelid = cls.oid
+            JOIN pg_am am ON am.oid = cls.relam
+            JOIN pg_class tbl ON tbl.oid = idx.indrelid
+            WHERE cls.relname = %s
+            """,
+            (index_name,),
+        )
+        row = cursor.fetchone()
+        status = {"table": table, "column": column, "index": index_name, "exists": row is not None}
+        if row:
+            method, reloptions, is_valid, size_bytes, estimated_rows = row
+            status.update({
+                "method": method,
+                "options": list(reloptions),
+                "valid": is_valid,
+                "size_bytes": size_bytes,
+                "estimated_rows": max(estimated_rows, 0),
+            })
+        statuses.append(status)
+
+    cursor.execute(
+        "SELECT current_setting('hnsw.ef_search', true), current_setting('ivfflat.probes', true)"
+    )
+    ef_search, probes = cursor.fetchone()
+    conn.rollback()
+    return [dict(s, ef_search=ef_search, probes=probes) for s in statuses]
+
+
+def measure_vector_recall(conn, table: str, column: str, sample_size: int = 20, top_k: int = 10) -> dict:
+    """
+    Estimate recall@k of the ANN index by replaying stored vectors as queries
+    and comparing index results against an exact (sequential) scan.
+
+    An HNSW scan returns at most ef_search rows, so ef_search is raised to
+    top_k for the measurement when it is lower.
+    """
+    if (table, column) not in VECTOR_INDEXES:
+        raise ValueError(f"{table}.{column} is not a managed vector column")
+
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY random() LIMIT %s",
+        (sample_size,),
+    )
+    queries = [r[0] for r in cursor.fetchall()]
+    conn.rollback()
+    if not queries:
+        return {"table": table, "column": column, "samples": 0, "recall": None}
+
+    knn_sql = (
+        f"SELECT id FROM {table} WHERE {column} IS NOT NULL "
+        f"ORDER BY {column} <=> %s::vector LIMIT %s"
+    )
+
+    ef_search = max(VECTOR_HNSW_EF_SEARCH, top_k)
+
+    def run(query_vec, exact: bool):
+        try:
+            cursor.execute("SET LOCAL hnsw.ef_search = %s", (ef_search,))
+        except psycopg2.Error:
+            conn.rollback()
+        if exact:
+            cursor.execute("SET LOCAL enable_indexscan = off")
+            cursor.execute("SET LOCAL enable_bitmapscan = off")
+        started = time.perf_counter()
+        cursor.execute(knn_sql, (query_vec, top_k))
+        ids = [r[0] for r in cursor.fetchall()]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        conn.rollback()
+        return ids, elapsed_ms
+
+    recalls, ann_ms, exact_ms = [], [], []
+    for query_vec in queries:
+        approx_ids, approx_elapsed = run(query_vec, exact=False)
+        exact_ids, exact_elapsed = run(query_vec, exact=True)
+        if exact_ids:
+            recalls.append(len(set(approx_ids) & set(exact_ids)) / len(exact_ids))
+        ann_ms.append(approx_elapsed)
+        exact_ms.append(exact_elapsed)
+
+    return {
+        "table": table,
+        "column": column,
+        "samples": len(queries),
+        "top_k": top_k,
+        "ef_search": ef_search,
+        "recall": round(sum(recalls) / len(recalls), 4) if recalls else None,
+        "ann_avg_ms": round(sum(ann_ms) / len(ann_ms), 2),
+        "exact_avg_ms": round(sum(exact_ms) / len(exact_ms), 2),
+    }
 
@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+
+from kb_seeding import section_windows
+
+SECTION_SUMMARY_PROMPT = """Summarize the following section of a document in 3-5 sentences.
+Keep names, numbers, definitions and conclusions; leave out examples and filler.
+Do not add any intro text, headings or bullet points.
+
+Section {part} of {parts}:
+{excerpt}
+
+Summary:"""
+
+DOCUMENT_SUMMARY_PROMPT = """Below are summaries of consecutive parts of a document titled "{title}".
+Combine them into one summary of the whole document in one or two short paragraphs.
+Cover the main topic, the key points in order, and any conclusions.
+Do not add any intro text, headings or bullet points.
+
+{summaries}
+
+Summary:"""
+
+
+def group_summaries(summaries: List[str], max_chars: int) -> List[List[str]]:
+    """Split consecutive summaries into groups whose joined text fits ``max_chars``."""
+    groups: List[List[str]] = []
+    size = 0
+    for summary in summaries:
+        if groups and size + len(summary) <= max_chars:
+            groups[-1].append(summary)
+            size += len(summary)
+        else:
+            groups.append([summary])
+            size = len(summary)
+    return groups
+
+
+def summarize_document(
+    text: str,
+    title: str,
+    generate: Callable[[str], str],
+    window_chars: int = 6000,
+    max_sections: int = 24,
+    reduce_chars: int = 8000,
+    concurrency: int = 2,
+) -> dict:
+    """
+    Map-reduce summary of a document. Each section window is summarized
+    (map, ``concurrency`` calls at a time). Section summaries are then
+    combined group by group until one document summary remains (reduce).
+    ``generate`` takes a prompt and returns the model's text.
+
+    Returns {"sections": [section summaries in order], "document": summary}.
+    Raises if every section call fails; failed sections are left out.
+    """
+    windows = section_windows(text, window_chars, max_sections)
+    if not windows:
+        return {"sections": [], "document": ""}
+
+    def summarize_section(part: int, excerpt: str) -> str:
+        return generate(
+            SECTION_SUMMARY_PROMPT.format(part=part, parts=len(windows), excerpt=excerpt)
+        ).strip()
+
+    sections = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="summary") as executor:
+        futures = [executor.submit(summarize_section, i + 1, w) for i, w in enumerate(windows)]
+        for i, future in enumerate(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                print(f"[summary] Section {i + 1} failed: {e}")
+                continue
+            if summary:
+                sections.append(summary)
+    if not sections:
+        raise RuntimeError(f"All {len(windows)} section summaries failed")
+
+    level = sections
+    while True:
+        groups = group_summaries(level, reduce_chars)
+        if len(level) > 1 and len(groups) == len(level):
+            # Oversized summaries: pair them up so every round still shrinks
+            groups = [level[i:i + 2] for i in range(0, len(level), 2)]
+        level = [
+            generate(
+                DOCUMENT_SUMMARY_PROMPT.format(title=title, summaries="\n\n".join(group))
+            ).strip()
+            for group in groups
+        ]
+        if len(level) == 1:
+            return {"sections": sections, "document": level[0]}
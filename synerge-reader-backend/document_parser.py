@@ -1,11 +1,22 @@
 import io
+import os
+import threading
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass, field
 from pathlib import Path
 
 MAX_FILE_BYTES = 50 * 1024 * 1024
 MAX_PDF_PAGES = 150
 MAX_EXTRACTED_CHARS = 300_000
+# Worker processes for PDF page extraction; 0 or 1 extracts serially in-process.
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# PDFs shorter than this are not worth the inter-process round trip.
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+
+_pdf_executor = None
+_pdf_executor_lock = threading.Lock()
 
 
 class ExtractionError(Exception):
@@ -91,6 +102,76 @@ def sanitize_filename(filename: "str | None") -> str:
     return name[:255] or "untitled"
 
 
+def _page_ranges(page_count: int, workers: int) -> list:
+    """Split pages into contiguous [start, end) ranges, a couple per worker."""
+    if page_count <= 0:
+        return []
+    pieces = max(1, min(page_count, workers * 2))
+    size, extra = divmod(page_count, pieces)
+    ranges = []
+    start = 0
+    for i in range(pieces):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _extract_pages(pdf, start: int, end: int) -> list:
+    """Extract pages [start, end) of an open PDF as "[Page N]" parts."""
+    parts = []
+    for i in range(start, end):
+        page_text = pdf.pages[i].extract_text()
+        if page_text and page_text.strip():
+            parts.append(f"\n\n[Page {i + 1}]\n\n{page_text}")
+    return parts
+
+
+def _extract_pdf_page_range(content: bytes, start: int, end: int) -> list:
+    """Worker-process entry point: open the PDF and extract pages [start, end)."""
+    import pdfplumber
+
+    with pdfplumber.open(io.BytesIO(content)) as pdf:
+        return _extract_pages(pdf, start, end)
+
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            _pdf_executor = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS)
+        return _pdf_executor
+
+
+def shutdown_pdf_executor():
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is not None:
+            _pdf_executor.shutdown(wait=False, cancel_futures=True)
+            _pdf_executor = None
+
+
+def _use_parallel_extraction(page_count: int) -> bool:
+    return PDF_EXTRACT_WORKERS > 1 and page_count >= PDF_PARALLEL_MIN_PAGES
+
+
+def _iter_pdf_parts_parallel(content: bytes, page_count: int):
+    """Yield page parts in page order from ranges extracted by worker processes."""
+    ranges = _page_ranges(page_count, PDF_EXTRACT_WORKERS)
+    try:
+        # map() hands results back in submission order, i.e. page order.
+        for parts in _get_pdf_executor().map(
+            _extract_pdf_page_range,
+            [content] * len(ranges),
+            [start for start, _ in ranges],
+            [end for _, end in ranges],
+        ):
+            yield from parts
+    except BrokenProcessPool:
+        shutdown_pdf_executor()
+        raise
+
+
 def _extract_pdf(content: bytes, filename: str) -> ExtractionResult:
     try:
         import pdfplumber
@@ -98,40 +179,39 @@ def _extract_pdf(content: bytes, filename: str) -> ExtractionResult:
         raise ExtractionError("PDF processing is not available on the server.", 500) from e
 
     with pdfplumber.open(io.BytesIO(content)) as pdf:
-        pages = pdf.pages
-        if len(pages) > MAX_PDF_PAGES:
+        page_count = len(pdf.pages)
+        if page_count > MAX_PDF_PAGES:
             raise ExtractionError(
                 f"PDF exceeds the {MAX_PDF_PAGES}-page limit. Please upload a shorter document.",
                 422,
             )
+        parallel = _use_parallel_extraction(page_count)
+        parts = [] if parallel else _extract_pages(pdf, 0, page_count)
 
-        parts = []
-        for i, page in enumerate(pages, start=1):
-            page_text = page.extract_text()
-            if page_text and page_text.strip():
-                parts.append(f"\n\n[Page {i}]\n\n{page_text}")
+    if parallel:
+        parts = list(_iter_pdf_parts_parallel(content, page_count))
 
-        if not parts:
-            raise ExtractionError(
-                "This PDF appears to be scanned or image-based. Text extraction is not supported for image-only PDFs.",
-                422,
-            )
-
-        text = "".join(parts)
-        truncated = False
-        if len(text) > MAX_EXTRACTED_CHARS:
-            text = text[:MAX_EXTRACTED_CHARS]
-            truncated = True
-
-        return ExtractionResult(
-            text=text,
-            file_type="pdf",
-            page_count=len(pages),
-            char_count=len(text),
-            truncated=truncated,
-            warnings=["Document truncated to 300,000 characters."] if truncated else [],
+    if not parts:
+        raise ExtractionError(
+            "This PDF appears to be scanned or image-based. Text extraction is not supported for image-only PDFs.",
+            422,
         )
 
+    text = "".join(parts)
+    truncated = False
+    if len(text) > MAX_EXTRACTED_CHARS:
+        text = text[:MAX_EXTRACTED_CHARS]
+        truncated = True
+
+    return ExtractionResult(
+        text=text,
+        file_type="pdf",
+        page_count=page_count,
+        char_count=len(text),
+        truncated=truncated,
+        warnings=["Document truncated to 300,000 characters."] if truncated else [],
+    )
+
 
 def _extract_docx(content: bytes, filename: str) -> ExtractionResult:
     try:
@@ -185,7 +265,8 @@ def _extract_text(content: bytes, filename: str) -> ExtractionResult:
     )
 
 
-def extract_text_from_upload(filename: str, content: bytes) -> ExtractionResult:
+def validate_upload(filename: str, content: bytes) -> str:
+    """Cheap up-front checks; returns the detected file type."""
     if len(content) == 0:
         raise ExtractionError("Uploaded file is empty.", 422)
     if len(content) > MAX_FILE_BYTES:
@@ -195,6 +276,11 @@ def extract_text_from_upload(filename: str, content: bytes) -> ExtractionResult:
 
     if file_type == "unknown":
         raise UnsupportedFileTypeError()
+    return file_type
+
+
+def extract_text_from_upload(filename: str, content: bytes) -> ExtractionResult:
+    file_type = validate_upload(filename, content)
 
     try:
         if file_type == "pdf":
@@ -209,3 +295,75 @@ def extract_text_from_upload(filename: str, content: bytes) -> ExtractionResult:
         raise ExtractionError(
             "Failed to extract text from this file. The file may be corrupted.", 422
         )
+
+
+class ExtractionStream:
+    """
+    Iterate over extracted text segment by segment (one per page for PDFs)
+    so downstream chunking can start before extraction finishes. Joining
+    the segments gives the same text, markers and truncation as
+    extract_text_from_upload; page_count/char_count/truncated/warnings
+    are filled in as iteration proceeds.
+    """
+
+    def __init__(self, filename: str, content: bytes):
+        self.filename = filename
+        self.content = content
+        self.file_type = validate_upload(filename, content)
+        self.page_count = 0
+        self.char_count = 0
+        self.truncated = False
+        self.warnings = []
+
+    def _segments(self):
+        if self.file_type != "pdf":
+            extract = _extract_docx if self.file_type == "docx" else _extract_text
+            result = extract(self.content, self.filename)
+            self.truncated = result.truncated
+            self.warnings = list(result.warnings)
+            yield result.text
+            return
+
+        try:
+            import pdfplumber
+        except ImportError as e:
+            raise ExtractionError("PDF processing is not available on the server.", 500) from e
+
+        with pdfplumber.open(io.BytesIO(self.content)) as pdf:
+            self.page_count = len(pdf.pages)
+            if self.page_count > MAX_PDF_PAGES:
+                raise ExtractionError(
+                    f"PDF exceeds the {MAX_PDF_PAGES}-page limit. Please upload a shorter document.",
+                    422,
+                )
+            if not _use_parallel_extraction(self.page_count):
+                for i in range(self.page_count):
+                    yield from _extract_pages(pdf, i, i + 1)
+                return
+        yield from _iter_pdf_parts_parallel(self.content, self.page_count)
+
+    def __iter__(self):
+        try:
+            for segment in self._segments():
+                remaining = MAX_EXTRACTED_CHARS - self.char_count
+                if len(segment) > remaining:
+                    segment = segment[:remaining]
+                    self.truncated = True
+                    self.warnings = ["Document truncated to 300,000 characters."]
+                if segment:
+                    self.char_count += len(segment)
+                    yield segment
+                if self.truncated:
+                    break
+        except ExtractionError:
+            raise
+        except Exception:
+            raise ExtractionError(
+                "Failed to extract text from this file. The file may be corrupted.", 422
+            )
+
+        if self.file_type == "pdf" and self.char_count == 0:
+            raise ExtractionError(
+                "This PDF appears to be scanned or image-based. Text extraction is not supported for image-only PDFs.",
+                422,
+            )
@@ -0,0 +1,162 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List
+
+
+class EmbeddingBatcher:
+    """
+    Coalesce embedding requests from concurrent callers into batched calls.
+
+    Texts are queued with a future each. A dispatcher thread waits until
+    ``max_batch_size`` texts for one model are pending, or the oldest has
+    waited ``max_wait_ms``, then sends them in one ``fetch(texts, model)``
+    call on a small executor and resolves the futures. Identical texts
+    pending at the same time are embedded once.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[List[str], str], List[List[float]]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5,
+        concurrency: int = 2,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self._fetch = fetch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending = deque()  # (model, text, future, enqueued_at)
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, concurrency), thread_name_prefix="embed-batch"
+        )
+        self._closed = False
+        self._dispatcher = None
+        self._batches = 0
+        self._texts = 0
+        self._coalesced = 0
+        self._errors = 0
+        self._wait_total = 0.0
+
+    def submit(self, model: str, texts: List[str]) -> List[Future]:
+        futures = [Future() for _ in texts]
+        now = time.monotonic()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher is closed")
+            self._ensure_dispatcher()
+            for text, future in zip(texts, futures):
+                self._pending.append((model, text, future, now))
+            self._cond.notify()
+        return futures
+
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        return [future.result() for future in self.submit(model, texts)]
+
+    def close(self):
+        """
+        Stop accepting texts. Batches already sent finish; texts still
+        queued fail with RuntimeError so no caller waits forever.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._dispatcher:
+            self._dispatcher.join(timeout=5)
+        with self._cond:
+            pending, self._pending = self._pending, deque()
+        error = RuntimeError("EmbeddingBatcher is closed")
+        for _, _, future, _ in pending:
+            if not future.done():
+                future.set_exception(error)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "batches": self._batches,
+                "texts": self._texts,
+                "coalesced_duplicates": self._coalesced,
+                "errors": self._errors,
+                "pending": len(self._pending),
+                "avg_batch_size": (
+                    round((self._texts - self._coalesced) / self._batches, 2) if self._batches else 0.0
+                ),
+                "avg_wait_ms": round(self._wait_total / self._texts * 1000, 2) if self._texts else 0.0,
+            }
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(
+                target=self._dispatch_loop, name="embed-batcher", daemon=True
+            )
+            self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return  # close() fails whatever is still pending
+                # Hold the batch open until it is full or the oldest text has waited long enough
+                deadline = self._pending[0][3] + self.max_wait
+                while (
+                    not self._closed
+                    and len(self._pending) < self.max_batch_size
+                    and time.monotonic() < deadline
+                ):
+                    self._cond.wait(timeout=max(0.0, deadline - time.monotonic()))
+                batch = self._take_batch()
+            try:
+                self._executor.submit(self._run_batch, *batch)
+            except RuntimeError as e:  # executor already shut down
+                self._fail_waiters(batch[1], e)
+
+    def _take_batch(self):
+        model = self._pending[0][0]
+        waiters = {}
+        kept = deque()
+        now = time.monotonic()
+        while self._pending and len(waiters) < self.max_batch_size:
+            item = self._pending.popleft()
+            if item[0] != model:
+                kept.append(item)
+                continue
+            _, text, future, enqueued_at = item
+            if text in waiters:
+                self._coalesced += 1
+            waiters.setdefault(text, []).append(future)
+            self._wait_total += now - enqueued_at
+            self._texts += 1
+        # Other models' texts keep their place at the front of the queue
+        self._pending.extendleft(reversed(kept))
+        self._batches += 1
+        return model, waiters
+
+    def _run_batch(self, model: str, waiters: dict):
+        texts = list(waiters)
+        try:
+            embeddings = self._fetch(texts, model)
+            if len(embeddings) != len(texts):
+                raise RuntimeError(
+                    f"Expected {len(texts)} embeddings, got {len(embeddings)}"
+                )
+        except Exception as e:
+            with self._cond:
+                self._errors += 1
+            self._fail_waiters(waiters, e)
+            return
+        for text, embedding in zip(texts, embeddings):
+            for future in waiters[text]:
+                future.set_result(embedding)
+
+    @staticmethod
+    def _fail_waiters(waiters: dict, error: Exception):
+        for futures in waiters.values():
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
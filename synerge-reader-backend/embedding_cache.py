@@ -0,0 +1,147 @@
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_usable_embedding(embedding) -> bool:
+    # embed_chunks falls back to all-zero vectors when Ollama fails; never cache those.
+    return bool(embedding) and any(v != 0 for v in embedding)
+
+
+class PostgresEmbeddingStore:
+    """Persistent tier backed by the embedding_cache table."""
+
+    def __init__(self, connection_factory: Callable):
+        self._connection_factory = connection_factory
+
+    def get_many(self, model: str, digests: List[str]) -> Dict[str, List[float]]:
+        with self._connection_factory() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                SELECT text_sha256, embedding
+                FROM embedding_cache
+                WHERE model = %s AND text_sha256 = ANY(%s)
+                """,
+                (model, digests),
+            )
+            rows = c.fetchall()
+        return {
+            digest: emb.tolist() if hasattr(emb, "tolist") else list(emb)
+            for digest, emb in rows
+        }
+
+    def put_many(self, model: str, embeddings: Dict[str, List[float]]):
+        from psycopg2.extras import execute_values
+
+        with self._connection_factory() as conn:
+            c = conn.cursor()
+            execute_values(
+                c,
+                """
+                INSERT INTO embedding_cache (model, text_sha256, embedding)
+                VALUES %s
+                ON CONFLICT (model, text_sha256) DO NOTHING
+                """,
+                [(model, digest, list(emb)) for digest, emb in embeddings.items()],
+                template="(%s, %s, %s::vector)",
+            )
+            conn.commit()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model, sha256(text)).
+
+    A bounded in-process LRU sits in front of an optional persistent store;
+    vectors are kept as float32 arrays to keep the memory tier compact.
+    """
+
+    def __init__(self, max_entries: int = 10000, store: Optional[PostgresEmbeddingStore] = None):
+        self.max_entries = max(0, max_entries)
+        self.store = store
+        self._entries: "OrderedDict[tuple, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.store_errors = 0
+
+    def _remember(self, key: tuple, embedding):
+        if not self.max_entries:
+            return
+        self._entries[key] = array("f", embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[str, List[float]]:
+        """Return cached embeddings for whichever of ``texts`` are known."""
+        found = {}
+        pending = {}
+        with self._lock:
+            for text in dict.fromkeys(texts):
+                key = (model, text_digest(text))
+                cached = self._entries.get(key)
+                if cached is not None:
+                    self._entries.move_to_end(key)
+                    found[text] = list(cached)
+                    self.memory_hits += 1
+                else:
+                    pending[key[1]] = text
+
+        if pending and self.store is not None:
+            try:
+                stored = self.store.get_many(model, list(pending))
+            except Exception as e:
+                print(f"[EmbeddingCache] Persistent lookup failed: {e}")
+                self.store_errors += 1
+                stored = {}
+            with self._lock:
+                for digest, embedding in stored.items():
+                    text = pending.pop(digest)
+                    found[text] = embedding
+                    self._remember((model, digest), embedding)
+                    self.store_hits += 1
+
+        with self._lock:
+            self.misses += len(pending)
+        return found
+
+    def put_many(self, model: str, embeddings: Dict[str, List[float]]):
+        usable = {
+            text_digest(text): emb
+            for text, emb in embeddings.items()
+            if is_usable_embedding(emb)
+        }
+        if not usable:
+            return
+        with self._lock:
+            for digest, emb in usable.items():
+                self._remember((model, digest), emb)
+        if self.store is not None:
+            try:
+                self.store.put_many(model, usable)
+            except Exception as e:
+                print(f"[EmbeddingCache] Persistent write failed: {e}")
+                self.store_errors += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.store_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "persistent": self.store is not None,
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "store_errors": self.store_errors,
+                "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+            }
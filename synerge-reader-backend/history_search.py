@@ -0,0 +1,109 @@
+from typing import Callable, List, Optional, Tuple
+
+from embedding_cache import is_usable_embedding
+
+# Vector matches below this question similarity are not worth fusing
+MIN_VECTOR_SIMILARITY = 0.5
+
+
+def _owner_filter(user_id) -> Tuple[str, list]:
+    # Signed-out questions are stored with user_id NULL and only match each other
+    return ("user_id = %s", [user_id]) if user_id else ("user_id IS NULL", [])
+
+
+def history_row(row) -> dict:
+    id_, ts, sel, q, a, sim = row[:6]
+    return {
+        "id": id_,
+        "timestamp": ts,
+        "selected_text": sel,
+        "question": q,
+        "answer": a,
+        "similarity": float(sim) if sim is not None else None,
+    }
+
+
+def vector_history_candidates(cursor, user_id, q_vec, limit: int) -> List[dict]:
+    """
+    The owner's past questions nearest to ``q_vec``. Rows without a
+    question_embedding (stored while embedding was down, or before the
+    column existed and not yet backfilled) are only found lexically.
+    """
+    owner, params = _owner_filter(user_id)
+    # Materializing the user's rows (via chat_history_user_id_idx) keeps this
+    # an exact search over their own history rather than a filtered ANN scan.
+    cursor.execute(
+        f"""
+        WITH mine AS MATERIALIZED (
+            SELECT id, ts, selected_text, question, answer, question_embedding
+            FROM chat_history
+            WHERE {owner} AND question_embedding IS NOT NULL
+        )
+        SELECT id, ts, selected_text, question, answer,
+               1 - (question_embedding <=> %s::vector) AS similarity
+        FROM mine
+        ORDER BY question_embedding <=> %s::vector
+        LIMIT %s
+        """,
+        params + [q_vec, q_vec, limit],
+    )
+    return [history_row(row) for row in cursor.fetchall() if row[5] >= MIN_VECTOR_SIMILARITY]
+
+
+def lexical_history_candidates(
+    cursor, user_id, query_text: str, q_vec, limit: int, tsquery: str
+) -> List[dict]:
+    """
+    The owner's past questions matching ``query_text`` under ``tsquery`` (a
+    SQL expression with one %s for the text), best ts_rank_cd first.
+    Similarity is None when either side has no embedding.
+    """
+    owner, params = _owner_filter(user_id)
+    cursor.execute(
+        f"""
+        SELECT id, ts, selected_text, question, answer,
+               1 - (question_embedding <=> %s::vector) AS similarity,
+               ts_rank_cd(question_tsv, q) AS rank
+        FROM chat_history, {tsquery} AS q
+        WHERE {owner} AND question_tsv @@ q
+        ORDER BY rank DESC, id DESC
+        LIMIT %s
+        """,
+        [q_vec, query_text] + params + [limit],
+    )
+    return [dict(history_row(row), lexical_rank=float(row[6])) for row in cursor.fetchall()]
+
+
+def backfill_question_embeddings(
+    cursor, embed: Callable[[List[str]], List[List[float]]], after_id: int = 0, batch_size: int = 64
+) -> Optional[int]:
+    """
+    Embed the next ``batch_size`` chat_history questions (by id, after
+    ``after_id``) that have no question_embedding and store the usable
+    vectors. Returns the last id looked at, or None when there is nothing
+    left. Rows that still fail to embed are skipped, not retried.
+    """
+    cursor.execute(
+        """
+        SELECT id, question FROM chat_history
+        WHERE question_embedding IS NULL AND id > %s
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+        """,
+        (after_id, batch_size),
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    embeddings = embed([question or "" for _, question in rows])
+    updates = [
+        (embedding, id_)
+        for (id_, _), embedding in zip(rows, embeddings)
+        if is_usable_embedding(embedding)
+    ]
+    if updates:
+        cursor.executemany(
+            "UPDATE chat_history SET question_embedding = %s WHERE id = %s", updates
+        )
+    return rows[-1][0]
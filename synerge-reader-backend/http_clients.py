@@ -0,0 +1,81 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class UpstreamClient:
+    """
+    Keep-alive HTTP client for one upstream service.
+
+    Wraps a requests.Session whose adapter keeps up to ``pool_maxsize``
+    idle connections per host, so repeated calls skip the TCP (and TLS)
+    handshake. Safe to share between threads for plain request/response use.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pool_connections: int = 4,
+        pool_maxsize: int = 32,
+        headers: dict = None,
+    ):
+        self.name = name
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0,
+        )
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        with self._lock:
+            self._requests += 1
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        """Requests sent vs. connections opened, overall and per host."""
+        hosts = []
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "requests": pool.num_requests,
+                "connections_opened": pool.num_connections,
+                "idle_connections": pool.pool.qsize() if pool.pool else 0,
+            })
+        opened = sum(h["connections_opened"] for h in hosts)
+        sent = sum(h["requests"] for h in hosts)
+        with self._lock:
+            return {
+                "name": self.name,
+                "requests": self._requests,
+                "errors": self._errors,
+                "connections_opened": opened,
+                "connection_reuse_ratio": round(1 - opened / sent, 3) if sent else 0.0,
+                "hosts": hosts,
+            }
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,114 @@
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+@dataclass
+class IngestJob:
+    id: str
+    filename: str
+    status: str = "queued"          # queued, running, completed, failed
+    stage: str = "queued"           # queued, extracting, embedding, finalizing, done
+    progress: dict = field(default_factory=dict)
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    events: List[dict] = field(default_factory=list)
+
+    def snapshot(self) -> dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class IngestJobRegistry:
+    """
+    In-memory registry of upload ingestion jobs. Every update is recorded as
+    an event so clients can poll the latest snapshot or follow the stream.
+    """
+
+    def __init__(self, retention_seconds: float = 3600, max_jobs: int = 500):
+        self.retention_seconds = retention_seconds
+        self.max_jobs = max_jobs
+        self._jobs: Dict[str, IngestJob] = {}
+        self._cond = threading.Condition()
+
+    def create(self, filename: str) -> IngestJob:
+        job = IngestJob(id=uuid.uuid4().hex, filename=filename)
+        with self._cond:
+            self._prune()
+            self._jobs[job.id] = job
+            self._record(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return job.snapshot() if job else None
+
+    def update(self, job_id: str, *, progress: Optional[dict] = None, **fields):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            for name, value in fields.items():
+                setattr(job, name, value)
+            if progress:
+                job.progress.update(progress)
+            job.updated_at = time.time()
+            self._record(job)
+            self._cond.notify_all()
+
+    def follow(self, job_id: str, heartbeat: float = 15.0) -> Iterator[dict]:
+        """
+        Yield every event for a job (past and future) until it finishes.
+        Emits {"type": "heartbeat"} after ``heartbeat`` idle seconds.
+        """
+        seen = 0
+        while True:
+            with self._cond:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return
+                if seen >= len(job.events) and job.status not in TERMINAL_STATUSES:
+                    self._cond.wait(timeout=heartbeat)
+                new_events = job.events[seen:]
+                seen = len(job.events)
+                finished = job.status in TERMINAL_STATUSES
+            if new_events:
+                yield from new_events
+            elif not finished:
+                yield {"type": "heartbeat", "job_id": job_id}
+            if finished:
+                return
+
+    def _record(self, job: IngestJob):
+        event = job.snapshot()
+        event["type"] = "progress"
+        event["seq"] = len(job.events)
+        job.events.append(event)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        finished = sorted(
+            (j for j in self._jobs.values() if j.status in TERMINAL_STATUSES),
+            key=lambda j: j.updated_at,
+        )
+        excess = len(self._jobs) - self.max_jobs + 1
+        for job in finished:
+            if job.updated_at < cutoff or excess > 0:
+                del self._jobs[job.id]
+                excess -= 1
@@ -0,0 +1,317 @@
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Dict, Optional
+
+# Built-in priorities: higher runs first.
+PRIORITY_LOW = 0
+PRIORITY_NORMAL = 5
+PRIORITY_HIGH = 10
+
+
+def retry_delay(attempts: int, base: float, cap: float) -> float:
+    """Exponential backoff after the given number of failed attempts."""
+    return min(cap, base * (2 ** max(0, attempts - 1)))
+
+
+class JobQueue:
+    """
+    Durable background job queue on the background_jobs table.
+
+    Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number
+    of threads (or processes) can share the table. A claim holds a lease
+    that a heartbeat renews while the handler runs; jobs whose worker died
+    are picked up again once the lease expires, or failed if that was their
+    last attempt. Only the current lease holder can finish or fail a job.
+    Failed jobs are retried with exponential backoff up to max_attempts.
+    """
+
+    def __init__(
+        self,
+        connection_factory: Callable,
+        workers: int = 2,
+        poll_interval: float = 2.0,
+        lease_seconds: float = 900,
+        backoff_base: float = 10,
+        backoff_cap: float = 900,
+        retention_days: int = 7,
+    ):
+        self._connection_factory = connection_factory
+        self.workers = max(0, workers)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retention_days = retention_days
+        self._handlers: Dict[str, Callable] = {}
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._last_prune = 0.0
+
+    def register(self, kind: str, handler: Callable[[dict], Optional[dict]]):
+        """Register the function that runs jobs of ``kind``; it may return a result dict."""
+        self._handlers[kind] = handler
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: dict,
+        priority: int = PRIORITY_NORMAL,
+        max_attempts: int = 3,
+        conn=None,
+    ) -> int:
+        """
+        Add a job. Pass ``conn`` to enqueue inside the caller's transaction
+        (the caller commits); otherwise a pooled connection is used.
+        """
+        def insert(connection) -> int:
+            c = connection.cursor()
+            c.execute(
+                """
+                INSERT INTO background_jobs (kind, payload, priority, max_attempts)
+                VALUES (%s, %s::jsonb, %s, %s)
+                RETURNING id
+                """,
+                (kind, json.dumps(payload), priority, max_attempts),
+            )
+            return c.fetchone()[0]
+
+        if conn is not None:
+            job_id = insert(conn)
+        else:
+            with self._connection_factory() as connection:
+                job_id = insert(connection)
+                connection.commit()
+        self._wake.set()
+        return job_id
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"job-worker-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Stop the workers, waiting up to ``timeout`` seconds each (None: until their job ends)."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"[jobs] Claim failed: {e}")
+                job = None
+            if job is None:
+                self._maybe_prune()
+                self._wake.wait(timeout=self.poll_interval)
+                self._wake.clear()
+                continue
+            self._execute(*job)
+
+    def _claim(self):
+        locked_by = f"{self._worker_id}:{uuid.uuid4().hex[:12]}"
+        with self._connection_factory() as conn:
+            c = conn.cursor()
+            # Jobs that crashed their worker on the last attempt are not retried
+            c.execute(
+                """
+                UPDATE background_jobs
+                SET status = 'failed', finished_at = now(), locked_until = NULL,
+                    last_error = 'Lease expired on the final attempt'
+                WHERE status = 'running' AND locked_until < now() AND attempts >= max_attempts
+                """
+            )
+            c.execute(
+                """
+                UPDATE background_jobs
+                SET status = 'running',
+                    attempts = attempts + 1,
+                    started_at = now(),
+                    locked_by = %s,
+                    locked_until = now() + make_interval(secs => %s)
+                WHERE id = (
+                    SELECT id FROM background_jobs
+                    WHERE (status = 'queued' AND run_after <= now())
+                       OR (status = 'running' AND locked_until < now() AND attempts < max_attempts)
+                    ORDER BY priority DESC, run_after, id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, kind, payload, attempts, max_attempts, locked_by
+                """,
+                (locked_by, self.lease_seconds),
+            )
+            row = c.fetchone()
+            conn.commit()
+        return row
+
+    def _execute(self, job_id, kind, payload, attempts, max_attempts, locked_by):
+        handler = self._handlers.get(kind)
+        stop_heartbeat = threading.Event()
+        threading.Thread(
+            target=self._heartbeat, args=(job_id, locked_by, stop_heartbeat),
+            name=f"job-heartbeat-{job_id}", daemon=True,
+        ).start()
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job kind '{kind}'")
+            result = handler(payload or {})
+        except Exception as e:
+            print(f"[jobs] Job {job_id} ({kind}) attempt {attempts}/{max_attempts} failed: {e}")
+            self._fail(job_id, attempts, max_attempts, traceback.format_exc(limit=5), locked_by)
+            return
+        finally:
+            stop_heartbeat.set()
+        self._finish(job_id, result, locked_by)
+
+    def _heartbeat(self, job_id, locked_by, stop: threading.Event):
+        """Renew the lease every third of its length until ``stop`` is set."""
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                with self._connection_factory() as conn:
+                    c = conn.cursor()
+                    c.execute(
+                        """
+                        UPDATE background_jobs
+                        SET locked_until = now() + make_interval(secs => %s)
+                        WHERE id = %s AND status = 'running' AND locked_by = %s
+                        """,
+                        (self.lease_seconds, job_id, locked_by),
+                    )
+                    renewed = c.rowcount
+                    conn.commit()
+            except Exception as e:
+                print(f"[jobs] Lease renewal for job {job_id} failed: {e}")
+                continue
+            if not renewed:
+                print(f"[jobs] Job {job_id} lease was taken over; its result will be discarded")
+                return
+
+    def _update_owned(self, job_id, locked_by, assignments: str, params: tuple) -> bool:
+        """Apply ``assignments`` to a job only while this claim still holds its lease."""
+        with self._connection_factory() as conn:
+            c = conn.cursor()
+            c.execute(
+                f"""
+                UPDATE background_jobs SET {assignments}
+                WHERE id = %s AND status = 'running' AND locked_by = %s
+                """,
+                params + (job_id, locked_by),
+            )
+            updated = c.rowcount
+            conn.commit()
+        if not updated:
+            print(f"[jobs] Job {job_id} is no longer leased by this worker; update dropped")
+        return bool(updated)
+
+    def _finish(self, job_id, result, locked_by) -> bool:
+        return self._update_owned(
+            job_id,
+            locked_by,
+            """
+            status = 'done', finished_at = now(), locked_until = NULL,
+            last_error = NULL, result = %s::jsonb
+            """,
+            (json.dumps(result) if result is not None else None,),
+        )
+
+    def _fail(self, job_id, attempts, max_attempts, error: str, locked_by) -> bool:
+        exhausted = attempts >= max_attempts
+        delay = retry_delay(attempts, self.backoff_base, self.backoff_cap)
+        return self._update_owned(
+            job_id,
+            locked_by,
+            """
+            status = %s,
+            run_after = now() + make_interval(secs => %s),
+            finished_at = CASE WHEN %s THEN now() END,
+            locked_until = NULL,
+            last_error = %s
+            """,
+            ("failed" if exhausted else "queued", delay, exhausted, error[-4000:]),
+        )
+
+    def _maybe_prune(self):
+        if time.monotonic() - self._last_prune < 3600:
+            return
+        self._last_prune = time.monotonic()
+        try:
+            with self._connection_factory() as conn:
+                c = conn.cursor()
+                c.execute(
+                    """
+                    DELETE FROM background_jobs
+                    WHERE status = 'done' AND finished_at < now() - make_interval(days => %s)
+                    """,
+                    (self.retention_days,),
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"[jobs] Prune failed: {e}")
+
+    def stats(self) -> dict:
+        """Queue depth per kind/status and wait/run latency over the last hour."""
+        with self._connection_factory() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                SELECT kind, status, COUNT(*),
+                       EXTRACT(EPOCH FROM now() - MIN(created_at) FILTER (WHERE status = 'queued'))
+                FROM background_jobs
+                GROUP BY kind, status
+                ORDER BY kind, status
+                """
+            )
+            depth = [
+                {
+                    "kind": kind,
+                    "status": status,
+                    "count": count,
+                    "oldest_queued_seconds": round(float(oldest), 1) if oldest is not None else None,
+                }
+                for kind, status, count, oldest in c.fetchall()
+            ]
+            c.execute(
+                """
+                SELECT kind, COUNT(*),
+                       AVG(EXTRACT(EPOCH FROM started_at - created_at)),
+                       AVG(EXTRACT(EPOCH FROM finished_at - started_at)),
+                       MAX(EXTRACT(EPOCH FROM finished_at - started_at))
+                FROM background_jobs
+                WHERE status = 'done' AND finished_at > now() - interval '1 hour'
+                GROUP BY kind
+                ORDER BY kind
+                """
+            )
+            latency = [
+                {
+                    "kind": kind,
+                    "completed_last_hour": count,
+                    "avg_wait_seconds": round(float(wait), 2) if wait is not None else None,
+                    "avg_run_seconds": round(float(run), 2) if run is not None else None,
+                    "max_run_seconds": round(float(max_run), 2) if max_run is not None else None,
+                }
+                for kind, count, wait, run, max_run in c.fetchall()
+            ]
+        return {
+            "workers": self.workers,
+            "running_threads": sum(t.is_alive() for t in self._threads),
+            "depth": depth,
+            "latency": latency,
+        }
@@ -0,0 +1,75 @@
+from typing import List
+
+from chunking import iter_chunks
+from knowledge_dedup import normalize_question
+
+QA_PROMPT = """Read the document excerpt below and write {pairs} question-answer pairs.
+
+Format — use EXACTLY this pattern for each pair, nothing else:
+Q: <your question here>
+A: <your answer here (2-3 sentences)>
+
+Q: <next question>
+A: <next answer>
+
+Rules:
+- Questions must be specific and answerable from the text
+- Answers must come directly from the text, 2-3 sentences each
+- Do not add any intro text, numbering, bullets, or JSON
+
+Document (part {part}):
+{excerpt}
+
+Start with Q:"""
+
+
+def section_windows(text: str, window_chars: int = 4000, max_windows: int = 12) -> List[str]:
+    """
+    Split the whole document into section-sized windows (paragraph/sentence
+    aware). Past ``max_windows``, keep an even spread across the document.
+    """
+    windows = [w for w in iter_chunks(text, max_chunk_size=window_chars) if len(w) >= 150]
+    if max_windows <= 0 or len(windows) <= max_windows:
+        return windows
+    step = len(windows) / max_windows
+    return [windows[int(i * step)] for i in range(max_windows)]
+
+
+def parse_qa_pairs(raw: str) -> List[dict]:
+    """Parse "Q: ... / A: ..." blocks; answers may continue over several lines."""
+    pairs = []
+    current_q = None
+    current_a_lines = []
+    for line in raw.splitlines():
+        line = line.strip()
+        if line.lower().startswith("q:"):
+            # Save previous pair if any
+            if current_q and current_a_lines:
+                pairs.append({"question": current_q, "answer": " ".join(current_a_lines).strip()})
+            current_q = line[2:].strip()
+            current_a_lines = []
+        elif line.lower().startswith("a:") and current_q:
+            current_a_lines = [line[2:].strip()]
+        elif current_a_lines and line:
+            # Continuation of the answer
+            current_a_lines.append(line)
+
+    # Don't forget last pair
+    if current_q and current_a_lines:
+        pairs.append({"question": current_q, "answer": " ".join(current_a_lines).strip()})
+    return pairs
+
+
+def select_pairs(pairs: List[dict], min_answer_chars: int = 20) -> List[dict]:
+    """Drop empty/short pairs and repeated questions (after normalization)."""
+    selected = []
+    seen = set()
+    for pair in pairs:
+        q = pair.get("question", "").strip()
+        a = pair.get("answer", "").strip()
+        key = normalize_question(q)
+        if not q or not a or len(a) < min_answer_chars or key in seen:
+            continue
+        seen.add(key)
+        selected.append({"question": q, "answer": a})
+    return selected
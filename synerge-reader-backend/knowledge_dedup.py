@@ -0,0 +1,74 @@
+import hashlib
+import math
+import re
+import unicodedata
+from typing import Optional, Sequence
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of a question."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def question_hash(text: str) -> str:
+    return hashlib.sha256(normalize_question(text).encode("utf-8")).hexdigest()
+
+
+def cosine_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def find_exact_duplicate(cursor, question: str, exclude_id: Optional[int] = None) -> Optional[int]:
+    """Id of an entry (other than ``exclude_id``) whose question normalizes to the same text, or None."""
+    cursor.execute(
+        "SELECT id FROM knowledge_base WHERE question_hash = %s AND id IS DISTINCT FROM %s ORDER BY id LIMIT 1",
+        (question_hash(question), exclude_id),
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def find_similar(cursor, embedding, threshold: float = 0.92, exclude_id: Optional[int] = None) -> Optional[int]:
+    """
+    Id of the entry (other than ``exclude_id``) nearest to ``embedding`` if
+    its cosine similarity exceeds ``threshold``, else None. The single
+    nearest neighbour is fetched with ORDER BY distance LIMIT 1, which the
+    ANN index serves, and only then compared against the threshold.
+    """
+    if not embedding:
+        return None
+    cursor.execute(
+        """
+        SELECT id, embedding <=> %s::vector AS distance
+        FROM knowledge_base
+        WHERE embedding IS NOT NULL AND id IS DISTINCT FROM %s
+        ORDER BY embedding <=> %s::vector
+        LIMIT 1
+        """,
+        (embedding, exclude_id, embedding),
+    )
+    row = cursor.fetchone()
+    if row and 1 - row[1] > threshold:
+        return row[0]
+    return None
+
+
+def find_duplicate(
+    cursor, question: str, embedding=None, threshold: float = 0.92
+) -> Optional[int]:
+    """
+    Id of an existing knowledge_base entry for the same question, or None:
+    an exact match from the question_hash index, else a near match by
+    embedding (see ``find_similar``).
+    """
+    exact = find_exact_duplicate(cursor, question)
+    if exact is not None:
+        return exact
+    return find_similar(cursor, embedding, threshold)
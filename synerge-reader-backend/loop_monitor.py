@@ -0,0 +1,18 @@
+import asyncio
+
+
+async def monitor_event_loop_lag(interval: float, warn_ms: float, report=print):
+    """
+    Report whenever the event loop wakes up noticeably later than scheduled.
+
+    Sleeps ``interval`` seconds at a time; an oversleep above ``warn_ms``
+    means something held the loop (blocking I/O or CPU work in an async
+    endpoint) and is passed to ``report``. Runs until cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag_ms = (loop.time() - scheduled) * 1000
+        if lag_ms > warn_ms:
+            report(f"[loop] Event loop blocked for {lag_ms:.0f} ms")
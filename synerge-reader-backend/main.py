@@ -1,5 +1,22 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from document_parser import extract_text_from_upload, ExtractionError, sanitize_filename
+from document_parser import ExtractionError, sanitize_filename, shutdown_pdf_executor
+from document_parser import ExtractionStream, validate_upload
+from ingest_jobs import IngestJobRegistry
+from job_queue import JobQueue, PRIORITY_LOW, PRIORITY_NORMAL
+from loop_monitor import monitor_event_loop_lag
+from history_search import backfill_question_embeddings, lexical_history_candidates, vector_history_candidates
+from usage_aggregator import UsageAggregator
+from chunking import iter_chunks
+from doc_summaries import summarize_document
+from kb_seeding import QA_PROMPT, parse_qa_pairs, section_windows, select_pairs
+from knowledge_dedup import (
+    cosine_similarity,
+    find_duplicate,
+    find_exact_duplicate,
+    find_similar,
+    normalize_question,
+    question_hash,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from schemas import AskRequest, AskResponse, CorrectionRequest, RatingRequest,GoogleLoginRequest,LoginRequest,RegisterRequest
@@ -7,11 +24,25 @@ from schemas import HistoryItem,HistoryRequest, KnowledgeItem,KnowledgeInsertReq
 import os
 import string
 import datetime
+import queue
 import re
+from collections import deque
+from threading import Event, Thread
 from typing import List, Optional
 from concurrent.futures import ThreadPoolExecutor
-from dbSetup import init_db,connect_to_postgres,test_postgres_connection
+from dbSetup import init_db,db_connection,close_pool,test_postgres_connection
+from dbSetup import ChunkSpool, VECTOR_INDEXES, vector_index_status, measure_vector_recall, reserve_document_id
+from dbSetup import TEXT_SEARCH_CONFIG
+from retrieval import contiguous_runs, fuse_candidates, neighbour_keys, select_with_neighbours, stitch_chunks
+from embedding_cache import EmbeddingCache, PostgresEmbeddingStore, is_usable_embedding, text_digest
+from answer_cache import AnswerCache, CachedAnswer, SemanticCacheMetrics, context_fingerprint, pick_semantic_match
+from embedding_batcher import EmbeddingBatcher
+from http_clients import UpstreamClient
+from ollama_router import OllamaRouter
+from model_registry import ModelRegistry, context_length_from_show
+from prompt_budget import PromptItem, TokenCounter, assemble
 import requests
+from psycopg2.extras import execute_values
 import json
 import time
 from pydantic import BaseModel
@@ -21,6 +52,8 @@ from dotenv import load_dotenv
 from google.auth.transport import requests as google_requests
 from google.oauth2 import id_token
 import resend 
+import asyncio
+from anyio import to_thread
 import subprocess
 import tempfile
 import shutil
@@ -41,6 +74,37 @@ app.add_middleware(
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "172.18.0.1")
 OLLAMA_PORT = os.getenv("OLLAMA_PORT", "11434")
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "").strip()
+# Comma-separated list of Ollama servers to load-balance across
+OLLAMA_BASE_URLS = [
+    url.strip().rstrip("/")
+    for url in os.getenv("OLLAMA_BASE_URLS", "").split(",")
+    if url.strip()
+]
+OLLAMA_PROBE_INTERVAL = float(os.getenv("OLLAMA_PROBE_INTERVAL", "10"))
+# Circuit breaker: consecutive failures before a backend is taken out, and
+# seconds before it is tried again
+OLLAMA_BREAKER_FAILURES = int(os.getenv("OLLAMA_BREAKER_FAILURES", "3"))
+OLLAMA_BREAKER_RESET_SECONDS = float(os.getenv("OLLAMA_BREAKER_RESET_SECONDS", "30"))
+OLLAMA_MODELS_TTL = float(os.getenv("OLLAMA_MODELS_TTL", "60"))
+# Preferred model for KB generation; the list below is tried if it isn't installed
+KB_GENERATION_MODEL = os.getenv("KB_GENERATION_MODEL", "saul-instruct:latest").strip()
+KB_GENERATION_FALLBACK_MODELS = [
+    "llama3.1:latest", "llama3.1:8b", "llama3:latest", "mistral:latest",
+    "qwen2.5:latest", "qwen2.5:7b", "phi3:latest", "gemma2:latest", "gemma:latest",
+]
+# KB seeding: section window size (chars), cap on sections per document,
+# pairs requested per section, and concurrent LLM calls per document
+KB_SECTION_CHARS = int(os.getenv("KB_SECTION_CHARS", "4000"))
+KB_MAX_SECTIONS = int(os.getenv("KB_MAX_SECTIONS", "12"))
+KB_PAIRS_PER_SECTION = int(os.getenv("KB_PAIRS_PER_SECTION", "5"))
+KB_GENERATION_CONCURRENCY = int(os.getenv("KB_GENERATION_CONCURRENCY", "2"))
+# Precomputed document summaries: map window size (chars), cap on sections,
+# and max chars of section summaries combined per reduce call
+SUMMARY_SECTION_CHARS = int(os.getenv("SUMMARY_SECTION_CHARS", "6000"))
+SUMMARY_MAX_SECTIONS = int(os.getenv("SUMMARY_MAX_SECTIONS", "24"))
+SUMMARY_REDUCE_CHARS = int(os.getenv("SUMMARY_REDUCE_CHARS", "8000"))
+# Cosine similarity above which two KB questions count as the same question
+KB_DEDUP_SIMILARITY = float(os.getenv("KB_DEDUP_SIMILARITY", "0.92"))
 OLLAMA_FALLBACK_HOSTS = [
     host.strip()
     for host in os.getenv(
@@ -53,6 +117,75 @@ OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "1.5"))
 OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "60"))
 OLLAMA_EMBED_CONCURRENCY = int(os.getenv("OLLAMA_EMBED_CONCURRENCY", "4"))
 OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Context window (tokens) requested for every generation; one value for all
+# calls so Ollama never reloads a model just to resize its context
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+# /ask prompt budget: tokens kept free for the answer, and the largest share
+# of the budget KB corrections and past conversation may take
+PROMPT_RESERVED_TOKENS = int(os.getenv("PROMPT_RESERVED_TOKENS", "1000"))
+PROMPT_KB_SHARE = float(os.getenv("PROMPT_KB_SHARE", "0.25"))
+PROMPT_HISTORY_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", "0.15"))
+# Token counts come from cl100k (or a length estimate), not the Ollama
+# model's own tokenizer, so they are approximate: keep this fraction of the
+# context window unused as a safety margin
+PROMPT_TOKEN_SAFETY_MARGIN = float(os.getenv("PROMPT_TOKEN_SAFETY_MARGIN", "0.1"))
+# Add a signed-in user's similar past Q&A to the /ask prompt
+ASK_INCLUDE_HISTORY = os.getenv("ASK_INCLUDE_HISTORY", "false").strip().lower() in ("1", "true", "yes")
+# Exact-answer cache for /ask: max entries (0 disables) and time to live (seconds)
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Semantic answer cache: reuse a stored answer to a paraphrased question when
+# the question embeddings are within SEMANTIC_CACHE_MAX_DISTANCE (cosine
+# distance) and the retrieved context overlaps by SEMANTIC_CACHE_MIN_OVERLAP
+# (Jaccard); lookups get SEMANTIC_CACHE_TIMEOUT_MS
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_MAX_DISTANCE = float(os.getenv("SEMANTIC_CACHE_MAX_DISTANCE", "0.08"))
+SEMANTIC_CACHE_MIN_OVERLAP = float(os.getenv("SEMANTIC_CACHE_MIN_OVERLAP", "0.6"))
+SEMANTIC_CACHE_TIMEOUT_MS = int(os.getenv("SEMANTIC_CACHE_TIMEOUT_MS", "150"))
+# Past Q&A is only added to the prompt above this question similarity
+HISTORY_MIN_SIMILARITY = float(os.getenv("HISTORY_MIN_SIMILARITY", "0.75"))
+# Sync endpoints and streaming generators run on anyio's worker threads; cap them.
+THREADPOOL_MAX_WORKERS = int(os.getenv("THREADPOOL_MAX_WORKERS", "40"))
+EVENT_LOOP_LAG_WARN_MS = float(os.getenv("EVENT_LOOP_LAG_WARN_MS", "100"))
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "0.5"))
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
+# Upload ingestion jobs: concurrent jobs, chunks per embedding call, and how
+# many embedding batches may be in flight per job ahead of the DB insert.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "32"))
+INGEST_MAX_INFLIGHT_BATCHES = int(os.getenv("INGEST_MAX_INFLIGHT_BATCHES", "2"))
+INGEST_SEGMENT_QUEUE_SIZE = 16
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "10000"))
+EMBED_CACHE_PERSIST = os.getenv("EMBED_CACHE_PERSIST", "true").strip().lower() in ("1", "true", "yes")
+# Cache misses from concurrent callers are coalesced into batched /api/embed calls
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "64"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+EMBED_BATCH_CONCURRENCY = int(os.getenv("EMBED_BATCH_CONCURRENCY", "2"))
+# Durable background jobs (KB generation, auto-save): worker threads per
+# process, idle poll interval, lease before a stuck job is reclaimed (renewed
+# every third of its length while the job runs), retries.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "900"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_BACKOFF_SECONDS = float(os.getenv("JOB_BACKOFF_SECONDS", "10"))
+# Hybrid retrieval: candidates fetched per ranker (x top_k) before RRF fusion,
+# and threads running the lexical and vector queries side by side
+HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "4"))
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "16"))
+# Questions about the open document: chunks retrieved from it, neighbouring
+# chunks added on each side, and the prompt token budget for the passages
+ACTIVE_DOC_TOP_K = int(os.getenv("ACTIVE_DOC_TOP_K", "6"))
+ACTIVE_DOC_NEIGHBOURS = int(os.getenv("ACTIVE_DOC_NEIGHBOURS", "1"))
+ACTIVE_DOC_TOKEN_BUDGET = int(os.getenv("ACTIVE_DOC_TOKEN_BUDGET", "3000"))
+# Latency budget (ms) for each relevant-history query
+HISTORY_QUERY_TIMEOUT_MS = int(os.getenv("HISTORY_QUERY_TIMEOUT_MS", "250"))
+# Questions embedded per transaction when backfilling chat_history.question_embedding
+HISTORY_BACKFILL_BATCH_SIZE = int(os.getenv("HISTORY_BACKFILL_BATCH_SIZE", "64"))
+# KB usage counts are buffered and flushed in batches; history bucket size
+KB_USAGE_FLUSH_INTERVAL = float(os.getenv("KB_USAGE_FLUSH_INTERVAL", "5"))
+KB_USAGE_BUCKET_SECONDS = int(os.getenv("KB_USAGE_BUCKET_SECONDS", "300"))
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "").strip()
 OPENROUTER_BASE_URL = os.getenv(
     "OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"
@@ -60,15 +193,64 @@ OPENROUTER_BASE_URL = os.getenv(
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "openrouter/auto").strip()
 OPENROUTER_HTTP_REFERER = os.getenv("OPENROUTER_HTTP_REFERER", "http://localhost")
 OPENROUTER_TITLE = os.getenv("OPENROUTER_TITLE", "SynergeReader")
-_ACTIVE_OLLAMA_BASE_URL = None
-_OLLAMA_HEALTH_CHECKED_AT = 0
+# Keep-alive connection pools: idle connections kept per upstream host
+OLLAMA_HTTP_POOL_SIZE = int(os.getenv("OLLAMA_HTTP_POOL_SIZE", "32"))
+OPENROUTER_HTTP_POOL_SIZE = int(os.getenv("OPENROUTER_HTTP_POOL_SIZE", "16"))
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
 resend.api_key = os.getenv("EMAIL_KEY")
+ingest_jobs = IngestJobRegistry()
+ollama_http = UpstreamClient(
+    "ollama",
+    pool_connections=max(4, len(OLLAMA_FALLBACK_HOSTS) + 1, len(OLLAMA_BASE_URLS)),
+    pool_maxsize=OLLAMA_HTTP_POOL_SIZE,
+)
+openrouter_http = UpstreamClient(
+    "openrouter", pool_connections=1, pool_maxsize=OPENROUTER_HTTP_POOL_SIZE
+)
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+ingest_embed_executor = ThreadPoolExecutor(
+    max_workers=max(1, INGEST_WORKERS * INGEST_MAX_INFLIGHT_BATCHES),
+    thread_name_prefix="ingest-embed",
+)
+embedding_cache = EmbeddingCache(
+    max_entries=EMBED_CACHE_MAX_ENTRIES,
+    store=PostgresEmbeddingStore(db_connection) if EMBED_CACHE_PERSIST else None,
+)
+embedding_batcher = EmbeddingBatcher(
+    lambda texts, model: fetch_ollama_embeddings(texts, model),
+    max_batch_size=EMBED_BATCH_MAX_SIZE,
+    max_wait_ms=EMBED_BATCH_MAX_WAIT_MS,
+    concurrency=EMBED_BATCH_CONCURRENCY,
+)
+answer_cache = AnswerCache(max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL)
+semantic_cache_metrics = SemanticCacheMetrics()
+retrieval_executor = ThreadPoolExecutor(
+    max_workers=max(2, RETRIEVAL_WORKERS), thread_name_prefix="retrieval"
+)
+# Whole history lookups for /ask run here, never on retrieval_executor: they
+# wait on their own sub-queries there, and nesting would starve that pool
+history_executor = ThreadPoolExecutor(
+    max_workers=max(1, RETRIEVAL_WORKERS), thread_name_prefix="history"
+)
+usage_aggregator = UsageAggregator(
+    db_connection,
+    flush_interval=KB_USAGE_FLUSH_INTERVAL,
+    bucket_seconds=KB_USAGE_BUCKET_SECONDS,
+)
+job_queue = JobQueue(
+    db_connection,
+    workers=JOB_WORKERS,
+    poll_interval=JOB_POLL_INTERVAL,
+    lease_seconds=JOB_LEASE_SECONDS,
+    backoff_base=JOB_BACKOFF_SECONDS,
+)
 # ------------------- Utilities -------------------
 
 
 def ollama_base_urls() -> list[str]:
     """Return Ollama base URLs in priority order."""
+    if OLLAMA_BASE_URLS:
+        return list(dict.fromkeys(OLLAMA_BASE_URLS))
     if OLLAMA_BASE_URL:
         return [OLLAMA_BASE_URL.rstrip("/")]
 
@@ -80,43 +262,55 @@ def ollama_base_urls() -> list[str]:
     return urls
 
 
-def get_active_ollama_base_url() -> str:
-    """Resolve and cache the first reachable Ollama endpoint."""
-    global _ACTIVE_OLLAMA_BASE_URL, _OLLAMA_HEALTH_CHECKED_AT
-
-    now = time.time()
-    if _ACTIVE_OLLAMA_BASE_URL and now - _OLLAMA_HEALTH_CHECKED_AT < 30:
-        return _ACTIVE_OLLAMA_BASE_URL
-
-    errors = []
-    for base_url in ollama_base_urls():
-        try:
-            resp = requests.get(
-                f"{base_url}/api/tags",
-                timeout=(OLLAMA_CONNECT_TIMEOUT, 5),
-            )
-            resp.raise_for_status()
-            _ACTIVE_OLLAMA_BASE_URL = base_url
-            _OLLAMA_HEALTH_CHECKED_AT = now
-            return base_url
-        except Exception as e:
-            errors.append(f"{base_url}: {e}")
-
-    _ACTIVE_OLLAMA_BASE_URL = None
-    _OLLAMA_HEALTH_CHECKED_AT = now
-    raise RuntimeError("Ollama is not reachable. Checked " + " | ".join(errors))
+ollama_router = OllamaRouter(
+    ollama_base_urls(),
+    ollama_http,
+    probe_interval=OLLAMA_PROBE_INTERVAL,
+    probe_timeout=(OLLAMA_CONNECT_TIMEOUT, 5),
+    failure_threshold=OLLAMA_BREAKER_FAILURES,
+    reset_timeout=OLLAMA_BREAKER_RESET_SECONDS,
+    # Only OLLAMA_BASE_URLS names distinct servers; the host fallbacks are
+    # aliases of one server, tried in order
+    balance=bool(OLLAMA_BASE_URLS),
+    retry_exceptions=(requests.ConnectionError, requests.Timeout),
+)
+# Installed models, from the router's background /api/tags probes
+model_registry = ModelRegistry(
+    ollama_router.available_models,
+    ttl=OLLAMA_MODELS_TTL,
+    fetch_context_length=lambda model: fetch_context_length(model),
+)
+token_counter = TokenCounter()
 
 
 def post_ollama(endpoint: str, payload: dict, *, stream: bool = False, timeout: int = 60):
-    base_url = get_active_ollama_base_url()
-    return requests.post(
-        f"{base_url}{endpoint}",
-        json=payload,
+    """POST to the least-loaded healthy Ollama backend for payload["model"]."""
+    return ollama_router.post(
+        endpoint,
+        payload,
         stream=stream,
         timeout=(OLLAMA_CONNECT_TIMEOUT, timeout or OLLAMA_READ_TIMEOUT),
     )
 
 
+def fetch_context_length(model: str) -> Optional[int]:
+    resp = post_ollama("/api/show", {"model": model}, timeout=10)
+    resp.raise_for_status()
+    return context_length_from_show(resp.json())
+
+
+def prompt_token_budget(model: str) -> int:
+    """
+    Prompt tokens available for a model: its context window, less the
+    safety margin for approximate counts, minus the answer reserve.
+    """
+    window = OLLAMA_NUM_CTX
+    model_window = model_registry.context_length(model)
+    if model_window:
+        window = min(window, model_window)
+    return int(window * (1 - PROMPT_TOKEN_SAFETY_MARGIN)) - PROMPT_RESERVED_TOKENS
+
+
 def stream_openrouter_chat(messages: list[dict], model: str = OPENROUTER_MODEL):
     if not OPENROUTER_API_KEY:
         raise RuntimeError("OPENROUTER_API_KEY is not configured")
@@ -135,7 +329,7 @@ def stream_openrouter_chat(messages: list[dict], model: str = OPENROUTER_MODEL):
         "max_tokens": 1000,
     }
 
-    with requests.post(
+    with openrouter_http.post(
         f"{OPENROUTER_BASE_URL}/chat/completions",
         headers=headers,
         json=payload,
@@ -160,28 +354,30 @@ def stream_openrouter_chat(messages: list[dict], model: str = OPENROUTER_MODEL):
                     continue
 
 
-def chunk_text(text: str, max_chunk_size: int = 500) -> list:
-    if not text.strip():
-        return []
+def chunk_text(text: str, max_chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list:
+    return list(iter_chunks(text, max_chunk_size=max_chunk_size, overlap=overlap))
 
-    words = text.split()
-    chunks = []
-    current = []
 
-    for word in words:
-        current_size = sum(len(w) for w in current) + len(current) - 1
-        if current_size + len(word) + 1 <= max_chunk_size:
-            current.append(word)
-        else:
-            if current:
-                chunks.append(" ".join(current))
-            current = [word]
-    if current:
-        chunks.append(" ".join(current))
-    return chunks
+def embed_chunks(
+    chunks: List[str], model: str = "nomic-embed-text:v1.5"
+) -> List[List[float]]:
+    """
+    Embed texts, serving repeats from the embedding cache. Misses go through
+    the shared batcher so concurrent callers share /api/embed round trips.
+    """
+    if not chunks:
+        return []
 
+    cached = embedding_cache.get_many(model, chunks)
+    missing = [text for text in dict.fromkeys(chunks) if text not in cached]
+    if missing:
+        fresh = dict(zip(missing, embedding_batcher.embed(model, missing)))
+        embedding_cache.put_many(model, fresh)
+        cached.update(fresh)
+    return [cached[text] for text in chunks]
 
-def embed_chunks(
+
+def fetch_ollama_embeddings(
     chunks: List[str], model: str = "nomic-embed-text:v1.5"
 ) -> List[List[float]]:
     if not chunks:
@@ -238,89 +434,335 @@ def embed_chunks(
         return list(executor.map(embed_one, chunks))
 
 
-def get_relevant_chunks(
-    question: str, top_k: int = 3, document_names: Optional[List[str]] = None
-) -> List[dict]:
-    """Get relevant chunks ranked by embedding similarity."""
-    conn = None
-    try:
-        conn = connect_to_postgres()
-        if conn is None:
-            return []
-        c = conn.cursor()
-        question_embedding = embed_chunks([question])[0]
-        if document_names:
-            c.execute(
-                """
-                SELECT
-                    dc.chunk_text,
-                    1 - (dc.embedding <=> %s::vector) AS similarity
-                FROM document_chunks dc
-                JOIN documents d ON d.id = dc.document_id
-                WHERE dc.embedding IS NOT NULL
-                  AND d.filename = ANY(%s)
-                ORDER BY dc.embedding <=> %s::vector
-                LIMIT %s
-                """,
-                (question_embedding, document_names, question_embedding, top_k),
-            )
-        else:
-            c.execute(
-                """
-                SELECT
-                    dc.chunk_text,
-                    1 - (dc.embedding <=> %s::vector) AS similarity
+def _usable_question_embedding(question: str, question_embedding=None):
+    """The question vector (embedded unless given), or None if embedding failed or returned zeros."""
+    if question_embedding is None:
+        try:
+            embeddings = embed_chunks([question])
+            question_embedding = embeddings[0] if embeddings else None
+        except Exception as e:
+            print(f"Question embedding failed, using lexical retrieval only: {e}")
+            return None
+    return question_embedding if is_usable_embedding(question_embedding) else None
+
+
+class AskContext:
+    """
+    Per-request state for /ask. The question is embedded at most once and
+    the vector is reused by chunk retrieval, KB retrieval and KB auto-save.
+    """
+
+    _UNSET = object()
+
+    def __init__(self, question: str):
+        self.question = question
+        self._question_embedding = self._UNSET
+
+    @property
+    def question_embedding(self) -> Optional[List[float]]:
+        """The usable question vector, or None (see _usable_question_embedding)."""
+        if self._question_embedding is self._UNSET:
+            self._question_embedding = _usable_question_embedding(self.question)
+        return self._question_embedding
+
+
+# OR-semantics full-text query: any question term may match, ranked by ts_rank_cd
+OR_TSQUERY = f"replace(plainto_tsquery('{TEXT_SEARCH_CONFIG}', %s)::text, '&', '|')::tsquery"
+# AND-semantics query for KB entries, which must contain every content word
+AND_TSQUERY = f"plainto_tsquery('{TEXT_SEARCH_CONFIG}', %s)"
+
+
+def _gather(futures: dict) -> dict:
+    """Wait for named retrieval futures; a failed ranker contributes no rows."""
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result() if future is not None else []
+        except Exception as e:
+            print(f"{name} search failed: {e}")
+            results[name] = []
+    return results
+
+
+def _vector_chunk_candidates(question_embedding, document_ids, limit: int) -> List[dict]:
+    if document_ids is not None:
+        # Materializing the documents' chunks makes this an exact search
+        # over them; a filtered HNSW scan would drop matches that fall outside
+        # the first ef_search neighbours of the whole table.
+        sql = """
+            WITH scoped AS MATERIALIZED (
+                SELECT dc.id, dc.document_id, dc.chunk_index, dc.chunk_text, dc.embedding
                 FROM document_chunks dc
-                WHERE dc.embedding IS NOT NULL
-                ORDER BY dc.embedding <=> %s::vector
-                LIMIT %s
-                """,
-                (question_embedding, question_embedding, top_k),
+                WHERE dc.embedding IS NOT NULL AND dc.document_id = ANY(%s)
             )
+            SELECT id, document_id, chunk_index, chunk_text,
+                   1 - (embedding <=> %s::vector) AS similarity
+            FROM scoped
+            ORDER BY embedding <=> %s::vector
+            LIMIT %s
+            """
+        params = [document_ids, question_embedding, question_embedding, limit]
+    else:
+        sql = """
+            SELECT dc.id, dc.document_id, dc.chunk_index, dc.chunk_text,
+                   1 - (dc.embedding <=> %s::vector) AS similarity
+            FROM document_chunks dc
+            WHERE dc.embedding IS NOT NULL
+            ORDER BY dc.embedding <=> %s::vector
+            LIMIT %s
+            """
+        params = [question_embedding, question_embedding, limit]
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute(sql, params)
         rows = c.fetchall()
+    return [
+        {"id": r[0], "document_id": r[1], "chunk_index": r[2], "text": r[3], "similarity": float(r[4])}
+        for r in rows
+    ]
 
-        scored = []
-        for text, similarity in rows:
-            scored.append({"text": text, "similarity": float(similarity)})
 
-        return scored
+def _lexical_chunk_candidates(question: str, question_embedding, document_ids, limit: int) -> List[dict]:
+    scope = "AND dc.document_id = ANY(%s)" if document_ids is not None else ""
+    params = [question_embedding, question] + ([document_ids] if document_ids is not None else []) + [limit]
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            f"""
+            SELECT dc.id, dc.document_id, dc.chunk_index, dc.chunk_text,
+                   1 - (dc.embedding <=> %s::vector) AS similarity,
+                   ts_rank_cd(dc.chunk_tsv, q) AS rank
+            FROM document_chunks dc, {OR_TSQUERY} AS q
+            WHERE dc.chunk_tsv @@ q {scope}
+            ORDER BY rank DESC
+            LIMIT %s
+            """,
+            params,
+        )
+        rows = c.fetchall()
+    return [
+        {"id": r[0], "document_id": r[1], "chunk_index": r[2], "text": r[3],
+         "similarity": float(r[4]) if r[4] is not None else 0.0, "lexical_rank": float(r[5])}
+        for r in rows
+    ]
+
+
+def get_relevant_chunks(
+    question: str,
+    top_k: int = 3,
+    document_names: Optional[List[str]] = None,
+    question_embedding: Optional[List[float]] = None,
+) -> List[dict]:
+    """
+    Get relevant chunks by hybrid search: cosine similarity and full-text
+    rank are queried in parallel and fused with reciprocal rank fusion.
+    Falls back to lexical-only results when the question can't be embedded.
+    ``document_names`` limit the search to the newest copy of each file.
+    """
+    try:
+        document_ids = None
+        if document_names:
+            document_ids = latest_document_ids(document_names)
+            if not document_ids:
+                return []
+        question_embedding = _usable_question_embedding(question, question_embedding)
+        candidates = max(top_k, top_k * HYBRID_CANDIDATE_MULTIPLIER)
+        results = _gather({
+            "Vector chunk": retrieval_executor.submit(
+                _vector_chunk_candidates, question_embedding, document_ids, candidates
+            ) if question_embedding else None,
+            "Lexical chunk": retrieval_executor.submit(
+                _lexical_chunk_candidates, question, question_embedding, document_ids, candidates
+            ),
+        })
+        return fuse_candidates(results["Vector chunk"], results["Lexical chunk"], top_k)
     except Exception as e:
         print(f"Error in get_relevant_chunks: {e}")
         return []
-    finally:
-        if conn is not None:
-            conn.close()
 
 
-def get_documents_by_filenames(document_names: List[str]) -> List[dict]:
-    if not document_names:
-        return []
-
-    conn = None
-    try:
-        conn = connect_to_postgres()
-        if conn is None:
-            return []
+def latest_document_ids(document_names: List[str]) -> List[int]:
+    """Ids of the newest uploaded copy of each named file."""
+    with db_connection() as conn:
         c = conn.cursor()
         c.execute(
             """
-            SELECT filename, title, content
+            SELECT DISTINCT ON (filename) id
             FROM documents
             WHERE filename = ANY(%s)
+            ORDER BY filename, id DESC
             """,
             (document_names,),
         )
-        rows = c.fetchall()
+        return [r[0] for r in c.fetchall()]
+
+
+def get_documents_by_filenames(document_names: List[str], include_content: bool = True) -> List[dict]:
+    """The newest uploaded copy of each named file."""
+    if not document_names:
+        return []
+
+    try:
+        with db_connection() as conn:
+            c = conn.cursor()
+            c.execute(
+                f"""
+                SELECT DISTINCT ON (filename) id, filename, title, {"content" if include_content else "NULL"}
+                FROM documents
+                WHERE filename = ANY(%s)
+                ORDER BY filename, id DESC
+                """,
+                (document_names,),
+            )
+            rows = c.fetchall()
         return [
-            {"filename": r[0], "title": r[1], "content": r[2]}
+            {"id": r[0], "filename": r[1], "title": r[2], "content": r[3]}
             for r in rows
         ]
     except Exception as e:
         print(f"Error retrieving documents by filename: {e}")
         return []
-    finally:
-        if conn is not None:
-            conn.close()
+
+
+def get_active_document_passages(
+    document_name: str, question: str, question_embedding: Optional[List[float]] = None
+) -> List[dict]:
+    """
+    Passages of one document for a question: the top ACTIVE_DOC_TOP_K chunks
+    plus their neighbours, fitted into ACTIVE_DOC_TOKEN_BUDGET and merged into
+    runs of adjacent chunks in document order. Empty if the document has no
+    chunks yet (e.g. ingestion still running).
+    """
+    hits = get_relevant_chunks(
+        question,
+        top_k=ACTIVE_DOC_TOP_K,
+        document_names=[document_name],
+        question_embedding=question_embedding,
+    )
+    if not hits:
+        return []
+
+    hit_keys = [(hit["document_id"], hit["chunk_index"]) for hit in hits]
+    texts = {key: hit["text"] for key, hit in zip(hit_keys, hits)}
+    similarity = {key: hit["similarity"] for key, hit in zip(hit_keys, hits)}
+    wanted = [key for key in neighbour_keys(hit_keys, ACTIVE_DOC_NEIGHBOURS) if key not in texts]
+    if wanted:
+        try:
+            with db_connection() as conn:
+                c = conn.cursor()
+                c.execute(
+                    """
+                    SELECT dc.document_id, dc.chunk_index, dc.chunk_text
+                    FROM document_chunks dc
+                    JOIN unnest(%s::int[], %s::int[]) AS k(document_id, chunk_index)
+                      ON dc.document_id = k.document_id AND dc.chunk_index = k.chunk_index
+                    """,
+                    ([key[0] for key in wanted], [key[1] for key in wanted]),
+                )
+                for document_id, chunk_index, text in c.fetchall():
+                    texts[(document_id, chunk_index)] = text
+        except Exception as e:
+            print(f"Error fetching neighbouring chunks: {e}")
+
+    selected = select_with_neighbours(
+        hit_keys, texts, ACTIVE_DOC_NEIGHBOURS, ACTIVE_DOC_TOKEN_BUDGET, count_tokens=token_counter.count
+    )
+    return [
+        {
+            "text": stitch_chunks([texts[key] for key in run], CHUNK_OVERLAP),
+            "similarity": max((similarity.get(key, 0.0) for key in run), default=0.0),
+            "document_id": run[0][0],
+            "chunk_indexes": [key[1] for key in run],
+        }
+        for run in contiguous_runs(selected)
+    ]
+
+
+def get_document_summaries(document_names: List[str]) -> dict:
+    """
+    filename -> {"title", "summary", "document_id"} for files whose newest
+    copy has been summarized. Summaries of older copies are never served.
+    """
+    if not document_names:
+        return {}
+
+    try:
+        with db_connection() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                SELECT d.filename, d.title, s.summary, d.id
+                FROM (
+                    SELECT DISTINCT ON (filename) id, filename, title
+                    FROM documents
+                    WHERE filename = ANY(%s)
+                    ORDER BY filename, id DESC
+                ) d
+                JOIN document_summaries s ON s.document_id = d.id AND s.level = 'document'
+                """,
+                (document_names,),
+            )
+            rows = c.fetchall()
+        return {r[0]: {"title": r[1], "summary": r[2], "document_id": r[3]} for r in rows}
+    except Exception as e:
+        print(f"Error retrieving document summaries: {e}")
+        return {}
+
+
+def find_semantic_answer(
+    model: str,
+    question_embedding: List[float],
+    context_keys: List[str],
+    context_scope: str,
+    token: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    A stored answer from the same model to a near-identical question whose
+    retrieved context overlaps this one's, or None. Nearest neighbours come
+    from the chat_history question_embedding index; low-rated answers are
+    never reused.
+
+    Candidates must share the context scope (same context source and
+    document header, so a selection answer never serves a whole-document
+    question). Answers built with someone's past conversation are only
+    reused for that same user.
+    """
+    started = time.monotonic()
+    try:
+        with db_connection() as conn:
+            c = conn.cursor()
+            c.execute("SET LOCAL statement_timeout = %s", (SEMANTIC_CACHE_TIMEOUT_MS,))
+            c.execute(
+                """
+                SELECT id, answer, context_keys, question_embedding <=> %s::vector AS distance
+                FROM chat_history
+                WHERE model = %s AND context_scope = %s AND question_embedding IS NOT NULL
+                  AND (rating IS NULL OR rating >= 3)
+                  AND (
+                    user_id IS NOT DISTINCT FROM (SELECT id FROM users WHERE token = %s)
+                    OR NOT EXISTS (SELECT 1 FROM unnest(context_keys) AS k WHERE k LIKE 'history:%%')
+                  )
+                ORDER BY question_embedding <=> %s::vector
+                LIMIT 5
+                """,
+                (question_embedding, model, context_scope, token, question_embedding),
+            )
+            rows = c.fetchall()
+    except Exception as e:
+        print(f"Semantic cache lookup failed: {e}")
+        semantic_cache_metrics.record_error()
+        return None
+    match = pick_semantic_match(
+        (
+            {"id": r[0], "answer": r[1], "context_keys": r[2], "distance": float(r[3])}
+            for r in rows
+        ),
+        context_keys,
+        SEMANTIC_CACHE_MAX_DISTANCE,
+        SEMANTIC_CACHE_MIN_OVERLAP,
+    )
+    semantic_cache_metrics.record_lookup(time.monotonic() - started, match is not None)
+    return match
 
 
 def is_summary_question(question: str) -> bool:
@@ -339,122 +781,137 @@ def is_summary_question(question: str) -> bool:
     return any(marker in normalized for marker in summary_markers)
 
 
+def _history_candidates(search, *args) -> List[dict]:
+    """Run one history_search query under the HISTORY_QUERY_TIMEOUT_MS budget."""
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute("SET LOCAL statement_timeout = %s", (HISTORY_QUERY_TIMEOUT_MS,))
+        return search(c, *args)
+
+
 def get_relevant_history(
-    question: str, selected_text: str, token: Optional[str] = None, limit: int = 3
+    question: str,
+    selected_text: str,
+    token: Optional[str] = None,
+    limit: int = 3,
+    question_embedding: Optional[List[float]] = None,
 ) -> List[dict]:
+    """
+    Past Q&A of the same user, searched over their whole history in the
+    database: stored question embeddings and full-text match on question
+    and selection, fused with RRF. Each query gets HISTORY_QUERY_TIMEOUT_MS;
+    a ranker that runs out of budget simply contributes no rows. Rows with
+    no stored question_embedding are only found by the full-text ranker
+    until the history_embedding_backfill job has embedded them.
+    """
     try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
-
         user_id = None
         if token:
-            c.execute("SELECT id FROM users WHERE token = %s", (token,))
-            row = c.fetchone()
-            if row:
-                user_id = row[0]
+            with db_connection() as conn:
+                c = conn.cursor()
+                c.execute("SELECT id FROM users WHERE token = %s", (token,))
+                row = c.fetchone()
+                if row:
+                    user_id = row[0]
 
-        if user_id:
-            c.execute(
-                "SELECT id, ts, selected_text, question, answer FROM chat_history WHERE user_id = %s ORDER BY id DESC LIMIT 20",
-                (user_id,),
+        q_vec = _usable_question_embedding(question, question_embedding)
+        candidates = max(limit, limit * HYBRID_CANDIDATE_MULTIPLIER)
+        results = _gather({
+            "Vector history": retrieval_executor.submit(
+                _history_candidates, vector_history_candidates, user_id, q_vec, candidates
+            ) if q_vec else None,
+            "Lexical history": retrieval_executor.submit(
+                _history_candidates, lexical_history_candidates,
+                user_id, f"{question} {selected_text or ''}", q_vec, candidates, OR_TSQUERY,
+            ),
+        })
+        entries = fuse_candidates(results["Vector history"], results["Lexical history"], limit)
+        for entry in entries:
+            entry["relevance_score"] = (
+                entry["similarity"] if entry["similarity"] is not None else entry["rrf_score"]
             )
-        else:
-            c.execute(
-                "SELECT id, ts, selected_text, question, answer FROM chat_history WHERE user_id IS NULL ORDER BY id DESC LIMIT 20"
-            )
-        rows = c.fetchall()
-        conn.close()
-
-        scored = []
-        for id, ts, sel, q, a in rows:
-            score = sum(
-                [1 if word in q.lower() else 0 for word in question.lower().split()]
-            ) + sum(
-                [
-                    2 if word in sel.lower() else 0
-                    for word in selected_text.lower().split()
-                ]
-            )
-            if score > 0:
-                scored.append(
-                    {
-                        "id": id,
-                        "timestamp": ts,
-                        "selected_text": sel,
-                        "question": q,
-                        "answer": a,
-                        "relevance_score": score,
-                    }
-                )
-
-        scored.sort(key=lambda x: x["relevance_score"], reverse=True)
-        return scored[:limit]
-    except Exception:
+        return entries
+    except Exception as e:
+        print(f"Error retrieving history: {e}")
         return []
 
 
-def get_relevant_knowledge_base(question: str, limit: int = 3) -> List[dict]:
-    """Retrieve relevant knowledge base entries using semantic similarity (pgvector)."""
-    try:
-        # Embed the incoming question
-        q_emb = embed_chunks([question])
-        if not q_emb or not q_emb[0]:
-            return []
-        q_vec = q_emb[0]
+def _kb_row(row) -> dict:
+    id_, kb_q, kb_ans, ctx, corrected_by, usage_count, sim = row[:7]
+    return {
+        "id": id_,
+        "question": kb_q,
+        "answer": kb_ans,
+        "context": ctx or "",
+        "corrected_by": corrected_by or "Unknown",
+        "usage_count": usage_count or 0,
+        "similarity": float(sim) if sim is not None else None,
+    }
+
 
-        conn = connect_to_postgres()
+def _vector_kb_candidates(q_vec, limit: int) -> List[dict]:
+    with db_connection() as conn:
         c = conn.cursor()
+        c.execute(
+            """
+            SELECT id, question, corrected_answer, context_text, corrected_by, usage_count,
+                   1 - (embedding <=> %s::vector) AS similarity
+            FROM knowledge_base
+            WHERE embedding IS NOT NULL
+            ORDER BY embedding <=> %s::vector
+            LIMIT %s
+            """,
+            (q_vec, q_vec, limit),
+        )
+        rows = c.fetchall()
+    # Only keep reasonably similar entries
+    return [_kb_row(row) for row in rows if row[6] >= 0.5]
 
-        # Try semantic search first
-        try:
-            c.execute(
-                """
-                SELECT id, question, corrected_answer, context_text, corrected_by, usage_count,
-                       1 - (embedding <=> %s::vector) AS similarity
-                FROM knowledge_base
-                WHERE embedding IS NOT NULL
-                ORDER BY embedding <=> %s::vector
-                LIMIT %s
-                """,
-                (q_vec, q_vec, limit),
-            )
-            rows = c.fetchall()
-            conn.close()
-
-            results = []
-            for row in rows:
-                id_, kb_q, kb_ans, ctx, corrected_by, usage_count, sim = row
-                if sim >= 0.5:   # Only return if reasonably similar
-                    results.append({
-                        "id": id_,
-                        "question": kb_q,
-                        "answer": kb_ans,
-                        "context": ctx or "",
-                        "corrected_by": corrected_by or "Unknown",
-                        "usage_count": usage_count or 0,
-                        "relevance_score": float(sim),
-                    })
-            return results
 
-        except Exception as e:
-            print(f"Semantic KB search failed, falling back to keyword: {e}")
-            conn.rollback()
-            # Fallback: keyword overlap
-            c.execute("SELECT id, question, corrected_answer, context_text, corrected_by, usage_count FROM knowledge_base")
-            rows = c.fetchall()
-            conn.close()
-            question_words = set(question.lower().split())
-            scored = []
-            for id_, kb_q, kb_ans, ctx, corrected_by, usage_count in rows:
-                overlap = len(question_words & set(kb_q.lower().split()))
-                if overlap > 0:
-                    scored.append({
-                        "id": id_, "question": kb_q, "answer": kb_ans,
-                        "context": ctx or "", "corrected_by": corrected_by or "Unknown",
-                        "usage_count": usage_count or 0, "relevance_score": float(overlap),
-                    })
-            scored.sort(key=lambda x: x["relevance_score"], reverse=True)
-            return scored[:limit]
+def _lexical_kb_candidates(question: str, q_vec, limit: int) -> List[dict]:
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            f"""
+            SELECT id, question, corrected_answer, context_text, corrected_by, usage_count,
+                   1 - (embedding <=> %s::vector) AS similarity,
+                   ts_rank_cd(question_tsv, q) AS rank
+            FROM knowledge_base, {AND_TSQUERY} AS q
+            WHERE question_tsv @@ q
+            ORDER BY rank DESC
+            LIMIT %s
+            """,
+            (q_vec, question, limit),
+        )
+        rows = c.fetchall()
+    return [dict(_kb_row(row), lexical_rank=float(row[7])) for row in rows]
+
+
+def get_relevant_knowledge_base(
+    question: str, limit: int = 3, question_embedding: Optional[List[float]] = None
+) -> List[dict]:
+    """
+    Retrieve relevant knowledge base entries: semantic (pgvector) and
+    full-text matches queried in parallel and fused with RRF. Full-text
+    alone is used when the question can't be embedded.
+    """
+    try:
+        q_vec = _usable_question_embedding(question, question_embedding)
+        candidates = max(limit, limit * HYBRID_CANDIDATE_MULTIPLIER)
+        results = _gather({
+            "Semantic KB": retrieval_executor.submit(
+                _vector_kb_candidates, q_vec, candidates
+            ) if q_vec else None,
+            "Keyword KB": retrieval_executor.submit(
+                _lexical_kb_candidates, question, q_vec, candidates
+            ),
+        })
+        entries = fuse_candidates(results["Semantic KB"], results["Keyword KB"], limit)
+        for entry in entries:
+            entry["relevance_score"] = (
+                entry["similarity"] if entry["similarity"] is not None else entry["rrf_score"]
+            )
+        return entries
 
     except Exception as e:
         print(f"Error retrieving knowledge base: {e}")
@@ -462,260 +919,487 @@ def get_relevant_knowledge_base(question: str, limit: int = 3) -> List[dict]:
 
 
 def increment_kb_usage(entry_ids: List[int]):
-    """Increment usage_count for KB entries that fired."""
-    if not entry_ids:
-        return
-    try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
-        c.execute(
-            "UPDATE knowledge_base SET usage_count = COALESCE(usage_count,0) + 1 WHERE id = ANY(%s)",
-            (entry_ids,)
-        )
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Error incrementing KB usage: {e}")
+    """Count a use of each KB entry that fired (flushed to the DB in batches)."""
+    if entry_ids:
+        usage_aggregator.record(entry_ids)
 
 
-def auto_save_to_kb(question: str, answer: str, source: str = "auto"):
+def auto_save_to_kb(
+    question: str,
+    answer: str,
+    source: str = "auto",
+    question_embedding: Optional[List[float]] = None,
+):
     """
-    Silently save a Q&A pair to the knowledge base after every query.
+    Save a Q&A pair to the knowledge base after a query.
     Skips if: answer is too short, looks like an error, or a duplicate already exists.
+    Runs as a background job; errors propagate so the queue can retry.
     """
-    try:
-        # Skip low quality answers
-        if len(answer.strip()) < 80:
-            return
-        error_phrases = ["i don't know", "i cannot", "not enough context",
-                         "insufficient", "unable to answer", "__error__"]
-        if any(p in answer.lower() for p in error_phrases):
-            return
+    # Skip low quality answers
+    if len(answer.strip()) < 80:
+        return
+    error_phrases = ["i don't know", "i cannot", "not enough context",
+                     "insufficient", "unable to answer", "__error__"]
+    if any(p in answer.lower() for p in error_phrases):
+        return
 
-        # Embed the question
+    # Embed the question unless the caller already did
+    if question_embedding is None:
         q_emb = embed_chunks([question])
-        if not q_emb or not q_emb[0]:
-            return
-        q_vec = q_emb[0]
+        question_embedding = q_emb[0] if q_emb else None
+    if not is_usable_embedding(question_embedding):
+        raise RuntimeError("Question embedding unavailable")
+    q_vec = question_embedding
 
-        conn = connect_to_postgres()
+    with db_connection() as conn:
         c = conn.cursor()
 
-        # Check for near-duplicate (similarity > 0.92 means essentially the same question)
-        try:
-            c.execute(
-                """
-                SELECT id FROM knowledge_base
-                WHERE embedding IS NOT NULL
-                  AND 1 - (embedding <=> %s::vector) > 0.92
-                LIMIT 1
-                """,
-                (q_vec,)
-            )
-            if c.fetchone():
-                conn.close()
-                return  # Already have a very similar entry
-        except Exception:
-            pass  # pgvector issue — still proceed with insert
+        if find_duplicate(c, question, q_vec, KB_DEDUP_SIMILARITY) is not None:
+            return  # Already have the same or a very similar entry
 
         c.execute(
             """
             INSERT INTO knowledge_base
               (question, original_answer, corrected_answer, created_at,
-               context_text, corrected_by, usage_count, embedding)
-            VALUES (%s, %s, %s, %s, %s, %s, 1, %s)
+               context_text, corrected_by, usage_count, embedding, question_hash)
+            VALUES (%s, %s, %s, %s, %s, %s, 1, %s, %s)
             """,
             (question, answer, answer,
              datetime.datetime.now().isoformat(),
-             "", source, q_vec)
+             "", source, q_vec, question_hash(question))
         )
         conn.commit()
-        conn.close()
-        print(f"[KB] Auto-saved Q&A: {question[:60]}...")
-    except Exception as e:
-        print(f"[KB] Auto-save failed (non-critical): {e}")
+    print(f"[KB] Auto-saved Q&A: {question[:60]}...")
 
 
 def generate_kb_from_document(doc_id: int, filename: str, text: str):
     """
     After a document is uploaded, use the LLM to generate Q&A pairs
     from the document text and seed them into the Knowledge Base.
-    Called in a background daemon thread — never blocks the upload response.
-    Uses Q:/A: plain-text format instead of JSON for reliable parsing.
+    Runs as a background job — never blocks the upload response; errors
+    propagate so the queue can retry.
+
+    The whole document is covered in section-sized windows, generated with
+    bounded concurrency; all questions are embedded in one batched call and
+    inserted in bulk. Uses Q:/A: plain-text format for reliable parsing.
     """
-    try:
-        if len(text.strip()) < 200:
-            return
+    if len(text.strip()) < 200:
+        return
 
-        try:
-            base_url = get_active_ollama_base_url()
-        except Exception:
-            print(f"[KB] Ollama not reachable — skipping KB generation for {filename}")
-            return
+    # Pick the preferred installed model from the registry (no inference probes)
+    active_model = model_registry.pick([KB_GENERATION_MODEL] + KB_GENERATION_FALLBACK_MODELS)
+    if not active_model:
+        raise RuntimeError(f"No text-generation model available for {filename}")
+    print(f"[KB] Using model '{active_model}' for KB generation")
+
+    started = time.monotonic()
+    windows = section_windows(text, KB_SECTION_CHARS, KB_MAX_SECTIONS)
 
-        # Find first available text-generation model
-        generation_models = [
-            "saul-instruct:latest", "llama3.1:latest", "llama3.1:8b",
-            "llama3:latest", "mistral:latest", "qwen2.5:latest",
-            "qwen2.5:7b", "phi3:latest", "gemma2:latest", "gemma:latest",
+    def generate_pairs(part: int, excerpt: str) -> List[dict]:
+        resp = post_ollama(
+            "/api/generate",
+            {
+                "model": active_model,
+                "prompt": QA_PROMPT.format(pairs=KB_PAIRS_PER_SECTION, part=part, excerpt=excerpt),
+                "stream": False,
+                "temperature": 0.2,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
+                "options": {"num_ctx": OLLAMA_NUM_CTX},
+            },
+            timeout=120,
+        )
+        resp.raise_for_status()
+        return parse_qa_pairs(resp.json().get("response", "").strip())
+
+    all_pairs = []
+    failed_sections = 0
+    with ThreadPoolExecutor(
+        max_workers=max(1, KB_GENERATION_CONCURRENCY), thread_name_prefix="kb-gen"
+    ) as executor:
+        futures = [
+            executor.submit(generate_pairs, i + 1, window)
+            for i, window in enumerate(windows)
         ]
-        active_model = None
-        for model in generation_models:
+        for i, future in enumerate(futures):
             try:
-                test = requests.post(
-                    f"{base_url}/api/generate",
-                    json={"model": model, "prompt": "Say OK", "stream": False},
-                    timeout=(3, 20),
-                )
-                if test.status_code == 200 and test.json().get("response"):
-                    active_model = model
-                    print(f"[KB] Using model '{model}' for KB generation")
-                    break
-            except Exception:
-                continue
+                all_pairs.extend(future.result())
+            except Exception as e:
+                print(f"[KB] LLM call failed for section {i+1}: {e}")
+                failed_sections += 1
 
-        if not active_model:
-            print(f"[KB] No text-generation model available for {filename}")
-            return
+    if windows and failed_sections == len(windows):
+        raise RuntimeError(f"LLM calls failed for {filename}")
 
-        # Split document into 2 segments for broader coverage
-        mid = min(len(text) // 2, 4000)
-        excerpts = [
-            text[:4000].strip(),
-            text[mid:mid + 4000].strip(),
-        ]
+    pairs = select_pairs(all_pairs)
+    if not pairs:
+        print(f"[KB] No Q&A pairs extracted from {filename}")
+        return {"saved": 0, "pairs": len(all_pairs), "sections": len(windows)}
 
-        all_pairs = []
+    embeddings = embed_chunks([pair["question"] for pair in pairs])
+    now = datetime.datetime.now().isoformat()
+    rows = []
+    accepted = []
 
-        for i, excerpt in enumerate(excerpts):
-            if len(excerpt) < 150:
+    with db_connection() as conn:
+        c = conn.cursor()
+        for pair, embedding in zip(pairs, embeddings):
+            embedding = embedding if is_usable_embedding(embedding) else None
+            # Near-duplicates within this batch, then against the existing KB
+            if embedding and any(
+                cosine_similarity(embedding, other) > KB_DEDUP_SIMILARITY for other in accepted
+            ):
                 continue
+            if find_duplicate(c, pair["question"], embedding, KB_DEDUP_SIMILARITY) is not None:
+                continue
+            if embedding:
+                accepted.append(embedding)
+            rows.append(
+                (pair["question"], pair["answer"], pair["answer"], now, filename,
+                 f"Auto-generated from: {filename}", 0, embedding,
+                 question_hash(pair["question"]))
+            )
+        if rows:
+            execute_values(
+                c,
+                """
+                INSERT INTO knowledge_base
+                  (question, original_answer, corrected_answer, created_at,
+                   context_text, corrected_by, usage_count, embedding, question_hash)
+                VALUES %s
+                """,
+                rows,
+                template="(%s, %s, %s, %s, %s, %s, %s, %s::vector, %s)",
+            )
+        conn.commit()
+
+    elapsed = time.monotonic() - started
+    result = {
+        "saved": len(rows),
+        "pairs": len(all_pairs),
+        "sections": len(windows),
+        "failed_sections": failed_sections,
+        "elapsed_seconds": round(elapsed, 2),
+        "pairs_per_minute": round(len(rows) / elapsed * 60, 1) if elapsed > 0 else None,
+    }
+    print(f"[KB] ✓ Final: saved {len(rows)}/{len(all_pairs)} KB entries from: {filename} "
+          f"({result['pairs_per_minute']} pairs/min)")
+    return result
 
-            prompt = f"""Read the document excerpt below and write 5 question-answer pairs.
 
-Format — use EXACTLY this pattern for each pair, nothing else:
-Q: <your question here>
-A: <your answer here (2-3 sentences)>
+def run_kb_from_document_job(payload: dict):
+    """Job handler: load the uploaded document and seed KB entries from it."""
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT content FROM documents WHERE id = %s", (payload["document_id"],))
+        row = c.fetchone()
+    if not row:
+        return {"skipped": "document deleted"}
+    return generate_kb_from_document(payload["document_id"], payload["filename"], row[0] or "")
 
-Q: <next question>
-A: <next answer>
 
-Rules:
-- Questions must be specific and answerable from the text
-- Answers must come directly from the text, 2-3 sentences each
-- Do not add any intro text, numbering, bullets, or JSON
+def generate_document_summaries(doc_id: int, filename: str, title: str, text: str):
+    """
+    Map-reduce summaries of an uploaded document (see doc_summaries.py),
+    stored per section and for the whole document so summary questions
+    can be answered from a small prompt. Runs as a background job; errors
+    propagate so the queue can retry.
+    """
+    if len(text.strip()) < 200:
+        return {"skipped": "document too short"}
 
-Document (part {i+1}):
-{excerpt}
+    active_model = model_registry.pick([KB_GENERATION_MODEL] + KB_GENERATION_FALLBACK_MODELS)
+    if not active_model:
+        raise RuntimeError(f"No text-generation model available for {filename}")
 
-Start with Q:"""
+    def generate(prompt: str) -> str:
+        resp = post_ollama(
+            "/api/generate",
+            {
+                "model": active_model,
+                "prompt": prompt,
+                "stream": False,
+                "temperature": 0.2,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
+                "options": {"num_ctx": OLLAMA_NUM_CTX},
+            },
+            timeout=180,
+        )
+        resp.raise_for_status()
+        return resp.json().get("response", "")
+
+    started = time.monotonic()
+    result = summarize_document(
+        text,
+        title or filename,
+        generate,
+        window_chars=SUMMARY_SECTION_CHARS,
+        max_sections=SUMMARY_MAX_SECTIONS,
+        reduce_chars=SUMMARY_REDUCE_CHARS,
+        concurrency=KB_GENERATION_CONCURRENCY,
+    )
+    rows = [(doc_id, "section", i, summary, active_model) for i, summary in enumerate(result["sections"])]
+    rows.append((doc_id, "document", -1, result["document"], active_model))
 
-            try:
-                resp = requests.post(
-                    f"{base_url}/api/generate",
-                    json={
-                        "model": active_model,
-                        "prompt": prompt,
-                        "stream": False,
-                        "temperature": 0.2,
-                    },
-                    timeout=(5, 120),
-                )
-                resp.raise_for_status()
-                raw = resp.json().get("response", "").strip()
-                print(f"[KB] Raw output part {i+1} (first 300 chars): {raw[:300]}")
-
-                # Parse Q:/A: pairs
-                # Split on lines starting with Q:
-                current_q = None
-                current_a_lines = []
-                for line in raw.splitlines():
-                    line = line.strip()
-                    if line.lower().startswith("q:"):
-                        # Save previous pair if any
-                        if current_q and current_a_lines:
-                            all_pairs.append({
-                                "question": current_q,
-                                "answer": " ".join(current_a_lines).strip()
-                            })
-                        current_q = line[2:].strip()
-                        current_a_lines = []
-                    elif line.lower().startswith("a:") and current_q:
-                        current_a_lines = [line[2:].strip()]
-                    elif current_a_lines and line:
-                        # Continuation of the answer
-                        current_a_lines.append(line)
-
-                # Don't forget last pair
-                if current_q and current_a_lines:
-                    all_pairs.append({
-                        "question": current_q,
-                        "answer": " ".join(current_a_lines).strip()
-                    })
-
-                print(f"[KB] Parsed {len(all_pairs)} pairs so far after part {i+1}")
+    with db_connection() as conn:
+        c = conn.cursor()
+        # Lock the document row so a concurrent delete can't race the insert,
+        # and skip copies a re-upload has already replaced
+        c.execute(
+            """
+            SELECT NOT EXISTS (
+                SELECT 1 FROM documents newer WHERE newer.filename = d.filename AND newer.id > d.id
+            )
+            FROM documents d WHERE d.id = %s FOR SHARE
+            """,
+            (doc_id,),
+        )
+        row = c.fetchone()
+        if not row:
+            return {"skipped": "document deleted"}
+        if not row[0]:
+            return {"skipped": "document replaced by a newer upload"}
+        c.execute("DELETE FROM document_summaries WHERE document_id = %s", (doc_id,))
+        execute_values(
+            c,
+            """
+            INSERT INTO document_summaries (document_id, level, section_index, summary, model)
+            VALUES %s
+            """,
+            rows,
+        )
+        conn.commit()
 
-            except Exception as e:
-                print(f"[KB] LLM call failed for excerpt {i+1}: {e}")
-                continue
+    elapsed = round(time.monotonic() - started, 2)
+    print(f"[summary] ✓ {filename}: {len(result['sections'])} sections summarized in {elapsed}s")
+    return {"sections": len(result["sections"]), "elapsed_seconds": elapsed}
 
-        if not all_pairs:
-            print(f"[KB] No Q&A pairs extracted from {filename}")
-            return
 
-        conn = connect_to_postgres()
+def run_document_summary_job(payload: dict):
+    """Job handler: load the uploaded document and store its summaries."""
+    with db_connection() as conn:
         c = conn.cursor()
-        saved = 0
-        seen = set()
+        c.execute("SELECT title, content FROM documents WHERE id = %s", (payload["document_id"],))
+        row = c.fetchone()
+    if not row:
+        return {"skipped": "document deleted"}
+    return generate_document_summaries(payload["document_id"], payload["filename"], row[0], row[1] or "")
 
-        for pair in all_pairs:
-            q = pair.get("question", "").strip()
-            a = pair.get("answer", "").strip()
 
-            if not q or not a or len(a) < 20:
-                print(f"[KB] Skip (too short/empty): q={q[:40]}")
-                continue
-            if q.lower() in seen:
-                print(f"[KB] Skip (duplicate in batch): {q[:50]}")
+def run_kb_auto_save_job(payload: dict):
+    """Job handler: save an answered question to the KB (re-embeds via the cache)."""
+    auto_save_to_kb(payload["question"], payload["answer"], payload.get("source", "auto"))
+
+
+job_queue.register("kb_from_document", run_kb_from_document_job)
+job_queue.register("kb_auto_save", run_kb_auto_save_job)
+def run_history_embedding_backfill_job(payload: dict):
+    """Job handler: embed chat_history questions stored without a question_embedding."""
+    after_id, scanned = payload.get("after_id", 0), 0
+    while True:
+        with db_connection() as conn:
+            last_id = backfill_question_embeddings(
+                conn.cursor(), embed_chunks, after_id, HISTORY_BACKFILL_BATCH_SIZE
+            )
+            conn.commit()
+        if last_id is None:
+            break
+        scanned += 1
+        after_id = last_id
+    if scanned:
+        print(f"[jobs] History embedding backfill done up to chat_history id {after_id}")
+    return {"batches": scanned, "last_id": after_id}
+
+
+job_queue.register("document_summary", run_document_summary_job)
+job_queue.register("history_embedding_backfill", run_history_embedding_backfill_job)
+
+
+
+def _batched(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_ingest_job(
+    job_id: str, filename: str, safe_filename: str, content: bytes, metadata: dict
+):
+    """
+    Extraction -> chunking -> embedding -> insert, pipelined: a producer
+    thread extracts pages while chunks from earlier pages are already being
+    embedded. Embedded batches are staged in a ChunkSpool, and a pooled
+    connection is only held to reserve the document id and for the final
+    transaction that inserts the document row and COPYs every chunk, so a
+    failed job leaves nothing behind and long uploads don't starve /ask.
+    """
+    ingest_jobs.update(job_id, status="running", stage="extracting")
+    progress = {
+        "segments_extracted": 0,
+        "chars_extracted": 0,
+        "chunks_created": 0,
+        "chunks_embedded": 0,
+        "chunks_inserted": 0,
+    }
+    done = object()
+    segment_queue = queue.Queue(maxsize=INGEST_SEGMENT_QUEUE_SIZE)
+    stop = Event()
+    text_parts = []
+    spool = None
+
+    def put(item) -> bool:
+        # Give up once the consumer has bailed out, instead of blocking forever.
+        while not stop.is_set():
+            try:
+                segment_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
                 continue
-            seen.add(q.lower())
+        return False
 
+    try:
+        stream = ExtractionStream(safe_filename, content)
+
+        def produce():
             try:
-                q_emb = embed_chunks([q])
-                q_vec = q_emb[0] if q_emb else None
-            except Exception:
-                q_vec = None
+                for segment in stream:
+                    if not put(segment):
+                        return
+                put(done)
+            except BaseException as e:
+                put(e)
+
+        def segments():
+            while True:
+                item = segment_queue.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                text_parts.append(item)
+                progress["segments_extracted"] += 1
+                progress["chars_extracted"] += len(item)
+                ingest_jobs.update(
+                    job_id, progress=progress, stage="extracting"
+                )
+                yield item
+
+        Thread(target=produce, daemon=True).start()
 
+        with db_connection() as conn:
+            doc_id = reserve_document_id(conn)
+            conn.commit()
+        spool = ChunkSpool(doc_id)
+        in_flight = deque()
+
+        def stage_next():
+            batch, future = in_flight.popleft()
+            embeddings = future.result()
+            spool.add(batch, embeddings)
+            progress["chunks_embedded"] += len(batch)
+            ingest_jobs.update(job_id, progress=progress, stage="embedding")
+
+        chunks = iter_chunks(segments(), max_chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+        for batch in _batched(chunks, INGEST_EMBED_BATCH_SIZE):
+            progress["chunks_created"] += len(batch)
+            in_flight.append((batch, ingest_embed_executor.submit(embed_chunks, batch)))
+            while len(in_flight) > INGEST_MAX_INFLIGHT_BATCHES:
+                stage_next()
+        while in_flight:
+            stage_next()
+
+        text = "".join(text_parts)
+        if not text.strip():
+            raise ExtractionError("Uploaded file is empty.", 422)
+
+        ingest_jobs.update(job_id, stage="finalizing")
+        with db_connection() as conn:
+            c = conn.cursor()
             c.execute(
                 """
-                INSERT INTO knowledge_base
-                  (question, original_answer, corrected_answer, created_at,
-                   context_text, corrected_by, usage_count, embedding)
-                VALUES (%s, %s, %s, %s, %s, %s, 0, %s)
+                INSERT INTO documents
+                (id, filename, upload_timestamp, content, author, title, publication_date, source, doi_url)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """,
-                (q, a, a,
-                 datetime.datetime.now().isoformat(),
-                 filename, f"Auto-generated from: {filename}", q_vec)
+                (
+                    doc_id,
+                    filename,
+                    datetime.datetime.now().isoformat(),
+                    text,
+                    metadata.get("author"),
+                    metadata.get("title"),
+                    metadata.get("publication_date"),
+                    metadata.get("source"),
+                    metadata.get("doi_url"),
+                ),
             )
-            saved += 1
-            print(f"[KB] ✓ Inserted pair {saved}: {q[:60]}")
-
-        conn.commit()
-        conn.close()
-        print(f"[KB] ✓ Final: saved {saved}/{len(all_pairs)} KB entries from: {filename}")
+            progress["chunks_inserted"] = spool.copy_into(conn)
+            # Queue KB generation in the same transaction as the document
+            job_queue.enqueue(
+                "kb_from_document",
+                {"document_id": doc_id, "filename": safe_filename},
+                priority=PRIORITY_NORMAL,
+                max_attempts=JOB_MAX_ATTEMPTS,
+                conn=conn,
+            )
+            # A re-upload replaces the file's summaries: drop the old copies'
+            # rows and summarize the new text
+            c.execute(
+                """
+                DELETE FROM document_summaries
+                WHERE document_id IN (SELECT id FROM documents WHERE filename = %s AND id <> %s)
+                """,
+                (filename, doc_id),
+            )
+            job_queue.enqueue(
+                "document_summary",
+                {"document_id": doc_id, "filename": safe_filename},
+                priority=PRIORITY_NORMAL,
+                max_attempts=JOB_MAX_ATTEMPTS,
+                conn=conn,
+            )
+            conn.commit()
 
+        ingest_jobs.update(
+            job_id,
+            status="completed",
+            stage="done",
+            progress=progress,
+            result={
+                "message": "Uploaded",
+                "filename": safe_filename,
+                "document_id": doc_id,
+                "chunks_count": progress["chunks_inserted"],
+                "page_count": stream.page_count,
+                "truncated": stream.truncated,
+                "warnings": stream.warnings,
+            },
+        )
+    except ExtractionError as e:
+        ingest_jobs.update(job_id, status="failed", stage="done", error=e.user_message)
+        return
     except Exception as e:
-        print(f"[KB] Document KB generation failed (non-critical): {e}")
+        print(f"[upload] Ingestion failed for {safe_filename}: {e}")
+        ingest_jobs.update(job_id, status="failed", stage="done", error=str(e))
+        return
+    finally:
+        stop.set()
+        if spool is not None:
+            spool.close()
 
 
-async def hash_password(password: str) -> str:
+def hash_password(password: str) -> str:
     salt = bcrypt.gensalt()
     return bcrypt.hashpw(password.encode("utf-8"), salt).decode()
 
 
 
 @app.post("/upload")
-async def upload_documents(
+def upload_documents(
     file: UploadFile = File(None),
     files: List[UploadFile] = File(None),
     author: Optional[str] = Form(None),
@@ -733,84 +1417,40 @@ async def upload_documents(
     else:
         raise HTTPException(400, "No files provided")
 
+    metadata = {
+        "author": author,
+        "title": title,
+        "publication_date": publication_date,
+        "source": source,
+        "doi_url": doi_url,
+    }
+
     results = []
     for f in upload_list:
+        safe_filename = sanitize_filename(f.filename)
         try:
-            content = await f.read()
-            safe_filename = sanitize_filename(f.filename)
+            content = f.file.read()
             try:
-                result = extract_text_from_upload(safe_filename, content)
-                text = result.text
+                validate_upload(safe_filename, content)
             except ExtractionError as e:
                 raise HTTPException(status_code=e.http_status, detail=e.user_message)
 
-            if not text.strip():
-                results.append({"error": "Empty file", "filename": safe_filename})
-                continue
-
-            chunks = chunk_text(text)
-            embeddings = embed_chunks(chunks)
-
-            conn = connect_to_postgres()
-            if conn is None:
-                raise HTTPException(500, "Failed to connect to PostgreSQL")
-            try:
-                c = conn.cursor()
-                c.execute(
-                    """
-                    INSERT INTO documents
-                    (filename, upload_timestamp, content, author, title, publication_date, source, doi_url)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id
-                    """,
-                    (
-                        f.filename,
-                        datetime.datetime.now().isoformat(),
-                        text,
-                        author,
-                        title,
-                        publication_date,
-                        source,
-                        doi_url,
-                    ),
-                )
-
-                doc_id = c.fetchone()[0]
-
-                for i, (chunk, emb) in enumerate(zip(chunks, embeddings)):
-                    c.execute(
-                        """
-                        INSERT INTO document_chunks
-                        (document_id, chunk_text, chunk_index, embedding)
-                        VALUES (%s, %s, %s, %s)
-                        """,
-                        (doc_id, chunk, i, emb),
-                    )
-
-                conn.commit()
-            finally:
-                conn.close()
-
+            job = ingest_jobs.create(safe_filename)
+            ingest_executor.submit(
+                run_ingest_job, job.id, f.filename, safe_filename, content, metadata
+            )
             results.append(
                 {
-                    "message": "Uploaded",
+                    "message": "Queued",
+                    # Not searchable until the job completes; its result carries the document_id
+                    "status": "processing",
                     "filename": safe_filename,
-                    "document_id": doc_id,
-                    "chunks_count": len(chunks),
+                    "job_id": job.id,
+                    "status_url": f"/upload/jobs/{job.id}",
+                    "events_url": f"/upload/jobs/{job.id}/events",
                 }
             )
 
-            # Auto-generate KB entries from this document in the background
-            try:
-                from threading import Thread
-                Thread(
-                    target=generate_kb_from_document,
-                    args=(doc_id, safe_filename, text),
-                    daemon=True
-                ).start()
-            except Exception:
-                pass
-
         except HTTPException:
             raise
         except Exception as e:
@@ -819,6 +1459,33 @@ async def upload_documents(
     return results
 
 
+@app.get("/upload/jobs/{job_id}")
+def get_upload_job(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Upload job not found")
+    return job
+
+
+@app.get("/upload/jobs/{job_id}/events")
+def stream_upload_job(job_id: str):
+    """Stream job progress as NDJSON until the job completes or fails"""
+    if ingest_jobs.get(job_id) is None:
+        raise HTTPException(404, "Upload job not found")
+
+    def events():
+        for event in ingest_jobs.follow(job_id):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
 
 @app.post("/ask")
 async def ask_question(request: AskRequest):
@@ -829,8 +1496,15 @@ async def ask_question(request: AskRequest):
         "Do not include internal tags, JSON, or the words CONTEXT/QUESTION in the answer."
     )
 
+    # Fail fast on uninstalled models unless OpenRouter can take over.
+    # An unknown model list (no backend probed yet) never rejects.
+    model_missing = (
+        not OPENROUTER_API_KEY and model_registry.is_available(request.model) is False
+    )
+
     answer_parts = []
     entry_id = None
+    ask_context = AskContext(request.question)
     selected_items = list(request.selections or [])
     raw_selected_text = (request.selected_text or "").strip()
     selected_document_names = []
@@ -842,34 +1516,46 @@ async def ask_question(request: AskRequest):
     if request.active_document_name and request.active_document_name not in selected_document_names:
         selected_document_names.append(request.active_document_name)
 
-    def build_context() -> tuple[str, List[dict], float, str]:
+    def build_context() -> tuple[str, List[dict], float, str, str]:
+        """(header, context chunks, best similarity, source, separator between chunks)"""
         if selected_items:
             prompt_text = "\n\n---\n\n".join(
                 f"[Selection {index + 1} from: {selection.document_name}]\n{selection.text}"
                 for index, selection in enumerate(selected_items)
             )
-            return prompt_text, [{"text": prompt_text, "similarity": 1.0}], 1.0, "selected_text"
+            return "", [{"text": prompt_text, "similarity": 1.0}], 1.0, "selected_text", ""
 
         if raw_selected_text:
-            return raw_selected_text, [{"text": raw_selected_text, "similarity": 1.0}], 1.0, "selected_text"
+            return "", [{"text": raw_selected_text, "similarity": 1.0}], 1.0, "selected_text", ""
 
-        if request.active_document_name:
-            documents = get_documents_by_filenames([request.active_document_name])
+        if request.active_document_name and not is_summary_question(request.question):
+            documents = get_documents_by_filenames([request.active_document_name], include_content=False)
             if documents:
                 document = documents[0]
-                document_text = document["content"] or ""
-                if len(document_text) > 14000:
+                display_name = document["title"] or document["filename"]
+                header = f"Document title: {display_name}\nDocument file: {document['filename']}\n\n"
+                passages = get_active_document_passages(
+                    request.active_document_name,
+                    request.question,
+                    question_embedding=ask_context.question_embedding,
+                )
+                if passages:
+                    best_similarity = max(passage["similarity"] for passage in passages)
+                    return header, passages, best_similarity, "active_document", "\n\n[...]\n\n"
+
+                # Not chunked yet: fall back to the start of the document
+                documents = get_documents_by_filenames([request.active_document_name])
+                document_text = (documents[0]["content"] if documents else "") or ""
+                max_chars = ACTIVE_DOC_TOKEN_BUDGET * 4
+                if len(document_text) > max_chars:
                     document_text = (
-                        document_text[:14000]
+                        document_text[:max_chars]
                         + "\n\n[Truncated to keep the prompt responsive.]"
                     )
-                display_name = document["title"] or document["filename"]
-                prompt_text = (
-                    f"Document title: {display_name}\n"
-                    f"Document file: {document['filename']}\n\n"
-                    f"{document_text}"
-                )
-                return prompt_text, [{"text": prompt_text, "similarity": 1.0}], 1.0, "active_document"
+                chunk = {"text": document_text, "similarity": 1.0}
+                if documents:
+                    chunk["document_id"] = documents[0]["id"]
+                return header, [chunk], 1.0, "active_document", ""
 
         scoped_names = [
             name for name in selected_document_names if name and name != request.active_document_name
@@ -878,40 +1564,60 @@ async def ask_question(request: AskRequest):
             scoped_names.insert(0, request.active_document_name)
 
         if scoped_names and is_summary_question(request.question):
-            scoped_documents = get_documents_by_filenames(scoped_names)
-            if scoped_documents:
-                parts = []
-                for document in scoped_documents:
+            # Precomputed summaries first; raw text only for files not summarized yet
+            summaries = get_document_summaries(scoped_names)
+            pending = [name for name in scoped_names if name not in summaries]
+            raw_documents = {
+                document["filename"]: document for document in get_documents_by_filenames(pending)
+            }
+            parts = []
+            for name in scoped_names:
+                if name in summaries:
+                    display_name = summaries[name]["title"] or name
+                    document_text = summaries[name]["summary"]
+                    document_id = summaries[name]["document_id"]
+                elif name in raw_documents:
+                    document = raw_documents[name]
+                    display_name = document["title"] or name
                     document_text = document["content"] or ""
+                    document_id = document["id"]
                     if len(document_text) > 12000:
                         document_text = (
                             document_text[:12000]
                             + "\n\n[Truncated to keep the prompt responsive.]"
                         )
-                    display_name = document["title"] or document["filename"]
-                    parts.append(
+                else:
+                    continue
+                parts.append({
+                    "text": (
                         f"Document title: {display_name}\n"
-                        f"Document file: {document['filename']}\n\n"
+                        f"Document file: {name}\n\n"
                         f"{document_text}"
-                    )
-                prompt_text = "\n\n---\n\n".join(parts)
-                return prompt_text, [{"text": part, "similarity": 1.0} for part in parts], 1.0, "summary_document"
+                    ),
+                    "similarity": 1.0,
+                    "document_id": document_id,
+                })
+            if parts:
+                return "", parts, 1.0, "summary_document", "\n\n---\n\n"
 
         if scoped_names:
             context_chunks = get_relevant_chunks(
-                request.question, top_k=4, document_names=scoped_names
+                request.question,
+                top_k=4,
+                document_names=scoped_names,
+                question_embedding=ask_context.question_embedding,
             )
         else:
-            context_chunks = get_relevant_chunks(request.question, top_k=4)
-
-        prompt_text = ""
-        for chunk_data in context_chunks:
-            prompt_text += f"\n\n{chunk_data['text']}"
+            context_chunks = get_relevant_chunks(
+                request.question,
+                top_k=4,
+                question_embedding=ask_context.question_embedding,
+            )
 
         best_similarity = max(
             (chunk["similarity"] for chunk in context_chunks), default=0.0
         )
-        return prompt_text, context_chunks, best_similarity, "retrieval"
+        return "", context_chunks, best_similarity, "retrieval", "\n\n"
 
     def build_prompt(prompt_text: str) -> str:
         return f"""<context>
@@ -930,24 +1636,122 @@ Keep the answer concise, structured, and directly responsive to the question."""
 
     def stream_generate():
         nonlocal answer_parts, entry_id
+        if model_missing:
+            available = ", ".join(sorted(model_registry.models()))
+            yield f"__ERROR__Model '{request.model}' is not installed in Ollama. Available: {available}__"
+            return
         yield "__SEARCHING__\n"
 
         stream_error = None
         try:
-            prompt_text, context_chunks, best_similarity, context_source = build_context()
+            # Signed-in users' past Q&A is looked up while the context is built
+            history_future = history_executor.submit(
+                get_relevant_history,
+                request.question,
+                raw_selected_text,
+                request.auth_token,
+                3,
+                ask_context.question_embedding,
+            ) if request.auth_token and ASK_INCLUDE_HISTORY else None
+            header, context_chunks, best_similarity, context_source, separator = build_context()
 
             # ── Knowledge Base injection ──────────────────────────────────
-            kb_entries = get_relevant_knowledge_base(request.question, limit=3)
-            kb_ids_fired = [e["id"] for e in kb_entries]
-            if kb_entries:
-                kb_block = "\n\n<knowledge_base_corrections>\n"
-                for e in kb_entries:
-                    kb_block += f"Q: {e['question']}\nA: {e['answer']}\n---\n"
-                kb_block += "</knowledge_base_corrections>"
-                prompt_text = prompt_text + kb_block
+            kb_entries = get_relevant_knowledge_base(
+                request.question,
+                limit=3,
+                question_embedding=ask_context.question_embedding,
+            )
+            # Earlier asks of this same question add nothing to the prompt, and
+            # would change the answer-cache fingerprint on every repeat
+            normalized_question = normalize_question(request.question)
+            history_entries = [
+                h for h in (history_future.result() if history_future else [])
+                if (h["similarity"] or 0.0) >= HISTORY_MIN_SIMILARITY
+                and normalize_question(h["question"] or "") != normalized_question
+            ]
+
+            # ── Token budget: drop the lowest-scoring items until it fits ──
+            context_section = "selection" if context_source == "selected_text" else "context"
+            items = [
+                PromptItem(context_section, chunk["text"], chunk["similarity"], data=chunk)
+                for chunk in context_chunks
+            ] + [
+                PromptItem("kb", f"Q: {e['question']}\nA: {e['answer']}\n---\n", e["relevance_score"], data=e)
+                for e in kb_entries
+            ] + [
+                PromptItem("history", f"Q: {h['question']}\nA: {h['answer']}\n---\n", h["relevance_score"], data=h)
+                for h in history_entries
+            ]
+            overhead = token_counter.count(build_prompt(
+                header
+                + "\n\n<knowledge_base_corrections>\n</knowledge_base_corrections>"
+                + "\n\n<previous_conversation>\n</previous_conversation>"
+            ))
+            kept, token_usage = assemble(
+                items,
+                prompt_token_budget(request.model) - overhead,
+                token_counter,
+                {"kb": PROMPT_KB_SHARE, "history": PROMPT_HISTORY_SHARE},
+            )
+            token_usage["prompt_tokens"] = token_usage["used"] + overhead
+
+            context_chunks = [
+                dict(item.data, text=item.text) for item in kept if item.section == context_section
+            ]
+            prompt_text = header + separator.join(chunk["text"] for chunk in context_chunks)
+            kb_kept = [item for item in kept if item.section == "kb"]
+            kb_ids_fired = [item.data["id"] for item in kb_kept]
+            if kb_kept:
+                prompt_text += (
+                    "\n\n<knowledge_base_corrections>\n"
+                    + "".join(item.text for item in kb_kept)
+                    + "</knowledge_base_corrections>"
+                )
+            history_kept = [item for item in kept if item.section == "history"]
+            if history_kept:
+                prompt_text += (
+                    "\n\n<previous_conversation>\n"
+                    + "".join(item.text for item in history_kept)
+                    + "</previous_conversation>"
+                )
             # ─────────────────────────────────────────────────────────────
 
             prompt = build_prompt(prompt_text)
+
+            # Same model, question and context as an earlier answer: reuse it
+            context_keys = [
+                f"{item.section}:{item.data['id']}" if "id" in item.data
+                else f"{item.section}:{text_digest(item.text)}"
+                for item in kept
+            ]
+            context_scope = text_digest(f"{context_source}\0{header}")
+            fingerprint = context_fingerprint([f"scope:{context_scope}"] + context_keys)
+            cache_key = AnswerCache.key(request.model, request.question, fingerprint)
+            cached_answer = answer_cache.get(cache_key)
+            cache_match = {"type": "exact"} if cached_answer is not None else None
+
+            # Otherwise a stored answer to a paraphrase over overlapping context
+            if cached_answer is None and SEMANTIC_CACHE_ENABLED:
+                question_vector = ask_context.question_embedding
+                if not request.use_semantic_cache:
+                    semantic_cache_metrics.record_opt_out()
+                elif question_vector:
+                    match = find_semantic_answer(
+                        request.model, question_vector, context_keys, context_scope, request.auth_token
+                    )
+                    if match:
+                        cached_answer = CachedAnswer(match["answer"], {}, time.time())
+                        cache_match = {
+                            "type": "semantic",
+                            "chat_id": match["id"],
+                            "distance": round(match["distance"], 4),
+                            "overlap": round(match["overlap"], 3),
+                        }
+            cache_tags = {
+                "document": {item.data["document_id"] for item in kept if item.data.get("document_id")},
+                "kb": set(kb_ids_fired),
+            }
+
             fallback_messages = [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt},
@@ -957,6 +1761,9 @@ Keep the answer concise, structured, and directly responsive to the question."""
                 "similarity_score": best_similarity,
                 "context_source": context_source,
                 "active_document_name": request.active_document_name,
+                "token_usage": token_usage,
+                "cached": cached_answer is not None,
+                "cache_match": cache_match,
             }
 
             yield f"__CONTEXT__{json.dumps(context_data)}__\n\n"
@@ -969,71 +1776,78 @@ Keep the answer concise, structured, and directly responsive to the question."""
                 "temperature": 0.7,
                 "stream": True,
                 "keep_alive": OLLAMA_KEEP_ALIVE,
+                "options": {"num_ctx": OLLAMA_NUM_CTX},
             }
         except Exception as e:
             yield f"__ERROR__Failed to build document context: {e}__"
             return
 
-        try:
-            with post_ollama("/api/generate", payload, stream=True, timeout=60) as r:
-                r.raise_for_status()
-                buffer = ""
-                token_count = 0
-                for chunk in r.iter_content(decode_unicode=True, chunk_size=32):
-                    if chunk:
-                        if isinstance(chunk, bytes):
-                            chunk = chunk.decode("utf-8")
-                        buffer += chunk
-                        # Process complete JSON objects (lines ending with \n)
-                        while "\n" in buffer:
-                            line, buffer = buffer.split("\n", 1)
-                            if line:
-                                try:
-                                    data = json.loads(line)
-                                    token = data.get("response", "")
-                                    if token:
-                                        token_count += 1
-                                        answer_parts.append(token)
-                                        yield token
-                                except Exception as e:
-                                    print(f"DEBUG: JSON parse error: {e}")
-                                    continue
-                # Handle any remaining buffered data
-                if buffer:
+        used_fallback = False
+        if cached_answer is not None:
+            answer_parts.append(cached_answer.answer)
+            yield cached_answer.answer
+        else:
+            try:
+                with post_ollama("/api/generate", payload, stream=True, timeout=60) as r:
+                    r.raise_for_status()
+                    buffer = ""
+                    token_count = 0
+                    for chunk in r.iter_content(decode_unicode=True, chunk_size=32):
+                        if chunk:
+                            if isinstance(chunk, bytes):
+                                chunk = chunk.decode("utf-8")
+                            buffer += chunk
+                            # Process complete JSON objects (lines ending with \n)
+                            while "\n" in buffer:
+                                line, buffer = buffer.split("\n", 1)
+                                if line:
+                                    try:
+                                        data = json.loads(line)
+                                        token = data.get("response", "")
+                                        if token:
+                                            token_count += 1
+                                            answer_parts.append(token)
+                                            yield token
+                                    except Exception as e:
+                                        print(f"DEBUG: JSON parse error: {e}")
+                                        continue
+                    # Handle any remaining buffered data
+                    if buffer:
+                        try:
+                            data = json.loads(buffer)
+                            token = data.get("response", "")
+                            if token:
+                                token_count += 1
+                                answer_parts.append(token)
+                                yield token
+                        except Exception:
+                            pass
+                    print(f"DEBUG: Streaming complete. Total tokens: {token_count}")
+            except Exception as e:
+                stream_error = str(e)
+                if OPENROUTER_API_KEY:
                     try:
-                        data = json.loads(buffer)
-                        token = data.get("response", "")
-                        if token:
-                            token_count += 1
+                        answer_parts.clear()
+                        for token in stream_openrouter_chat(
+                            fallback_messages, model=OPENROUTER_MODEL
+                        ):
                             answer_parts.append(token)
                             yield token
-                    except Exception:
-                        pass
-                print(f"DEBUG: Streaming complete. Total tokens: {token_count}")
-        except Exception as e:
-            stream_error = str(e)
-            if OPENROUTER_API_KEY:
-                try:
-                    answer_parts.clear()
-                    for token in stream_openrouter_chat(
-                        fallback_messages, model=OPENROUTER_MODEL
-                    ):
-                        answer_parts.append(token)
-                        yield token
-                    stream_error = None
-                except Exception as fallback_error:
-                    print(f"DEBUG: OpenRouter fallback failed: {fallback_error}")
-                    response = getattr(fallback_error, "response", None)
+                        stream_error = None
+                        used_fallback = True
+                    except Exception as fallback_error:
+                        print(f"DEBUG: OpenRouter fallback failed: {fallback_error}")
+                        response = getattr(fallback_error, "response", None)
+                        if response is not None:
+                            yield f"__ERROR__LLM request failed with HTTP {response.status_code}. Check model access in OpenRouter.__"
+                        else:
+                            yield "__ERROR__The local LLM server is not reachable and OpenRouter fallback is unavailable.__"
+                else:
+                    response = getattr(e, "response", None)
                     if response is not None:
-                        yield f"__ERROR__LLM request failed with HTTP {response.status_code}. Check model access in OpenRouter.__"
+                        yield f"__ERROR__LLM request failed with HTTP {response.status_code}. Check that model '{request.model}' is installed in Ollama.__"
                     else:
-                        yield "__ERROR__The local LLM server is not reachable and OpenRouter fallback is unavailable.__"
-            else:
-                response = getattr(e, "response", None)
-                if response is not None:
-                    yield f"__ERROR__LLM request failed with HTTP {response.status_code}. Check that model '{request.model}' is installed in Ollama.__"
-                else:
-                    yield "__ERROR__The local LLM server is not reachable. Start Ollama or update OLLAMA_BASE_URL / OLLAMA_PORT in .env.__"
+                        yield "__ERROR__The local LLM server is not reachable. Start Ollama or update OLLAMA_BASE_URL / OLLAMA_PORT in .env.__"
 
         # Increment KB usage counts for entries that fired this query
         if kb_ids_fired:
@@ -1044,47 +1858,59 @@ Keep the answer concise, structured, and directly responsive to the question."""
 
         full_answer = "".join(answer_parts)
         try:
-            conn = connect_to_postgres()
-            c = conn.cursor()
-
-            user_id = None
-            if request.auth_token:
-                c.execute("SELECT id FROM users WHERE token = %s", (request.auth_token,))
-                row = c.fetchone()
-                if row:
-                    user_id = row[0]
-
-            c.execute(
-                """
-                INSERT INTO chat_history (ts, selected_text, question, answer, user_id)
-                VALUES (%s, %s, %s, %s, %s)
-                RETURNING id
-                """,
-                (
-                    datetime.datetime.now().isoformat(),
-                    request.selected_text or "",
-                    request.question,
-                    full_answer,
-                    user_id,
+            # Stored for history retrieval; usually already computed for the context
+            question_embedding = ask_context.question_embedding
+            with db_connection() as conn:
+                c = conn.cursor()
+
+                user_id = None
+                if request.auth_token:
+                    c.execute("SELECT id FROM users WHERE token = %s", (request.auth_token,))
+                    row = c.fetchone()
+                    if row:
+                        user_id = row[0]
+
+                c.execute(
+                    """
+                    INSERT INTO chat_history
+                      (ts, selected_text, question, answer, user_id, question_embedding,
+                       model, context_keys, context_scope)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                    """,
+                    (
+                        datetime.datetime.now().isoformat(),
+                        request.selected_text or "",
+                        request.question,
+                        full_answer,
+                        user_id,
+                        question_embedding,
+                        # OpenRouter answers aren't attributed to the requested model
+                        None if used_fallback else request.model,
+                        context_keys,
+                        context_scope,
+                    )
                 )
-            )
 
-            entry_id = c.fetchone()[0]
-            conn.commit()
-            conn.close()
+                entry_id = c.fetchone()[0]
+
+                # Auto-save this Q&A to the Knowledge Base in the background
+                # (a cached answer was already offered to the KB the first time)
+                if cached_answer is None:
+                    job_queue.enqueue(
+                        "kb_auto_save",
+                        {"question": request.question, "answer": full_answer, "source": "auto-query"},
+                        priority=PRIORITY_LOW,
+                        max_attempts=JOB_MAX_ATTEMPTS,
+                        conn=conn,
+                    )
+                conn.commit()
 
-            yield f"\n\n__ENTRY_ID__{entry_id}__"
+            # OpenRouter answers came from a different model than the key names
+            if cached_answer is None and not used_fallback:
+                answer_cache.put(cache_key, full_answer, context_data, cache_tags)
 
-            # Auto-save this Q&A to the Knowledge Base in the background
-            try:
-                from threading import Thread
-                Thread(
-                    target=auto_save_to_kb,
-                    args=(request.question, full_answer, "auto-query"),
-                    daemon=True
-                ).start()
-            except Exception:
-                pass
+            yield f"\n\n__ENTRY_ID__{entry_id}__"
 
         except Exception:
             yield "__ERROR__Database error__"
@@ -1101,33 +1927,31 @@ Keep the answer concise, structured, and directly responsive to the question."""
 
 
 @app.post("/history", response_model=List[HistoryItem])
-async def get_history(request: HistoryRequest):
+def get_history(request: HistoryRequest):
     user_id = None
     if request.token:
-        conn = connect_to_postgres()
-        c = conn.cursor()
-        c.execute(
-        "SELECT id FROM users WHERE token = %s",
-        (request.token,)
-        )
-        row = c.fetchone()
-        if row:
-            user_id = row[0]
-        conn.close()
-    try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
-        if user_id:
-            c.execute(
-                "SELECT id, ts, selected_text, question, answer FROM chat_history WHERE user_id = %s ORDER BY id DESC LIMIT 20",
-                (user_id,),
-            )
-        else:
+        with db_connection() as conn:
+            c = conn.cursor()
             c.execute(
-                "SELECT id, ts, selected_text, question, answer FROM chat_history WHERE user_id IS NULL ORDER BY id DESC LIMIT 20"
+            "SELECT id FROM users WHERE token = %s",
+            (request.token,)
             )
-        rows = c.fetchall()
-        conn.close()
+            row = c.fetchone()
+            if row:
+                user_id = row[0]
+    try:
+        with db_connection() as conn:
+            c = conn.cursor()
+            if user_id:
+                c.execute(
+                    "SELECT id, ts, selected_text, question, answer FROM chat_history WHERE user_id = %s ORDER BY id DESC LIMIT 20",
+                    (user_id,),
+                )
+            else:
+                c.execute(
+                    "SELECT id, ts, selected_text, question, answer FROM chat_history WHERE user_id IS NULL ORDER BY id DESC LIMIT 20"
+                )
+            rows = c.fetchall()
         return [
             HistoryItem(
                 id=r[0], timestamp=r[1], selected_text=r[2], question=r[3], answer=r[4]
@@ -1139,15 +1963,14 @@ async def get_history(request: HistoryRequest):
 
 
 @app.get("/documents")
-async def get_documents():
+def get_documents():
     try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
-        c.execute("""SELECT id, filename, upload_timestamp, author, title, publication_date, source, doi_url,
-                     (SELECT COUNT(*) FROM document_chunks WHERE document_id = documents.id)
-                     FROM documents ORDER BY upload_timestamp DESC""")
-        rows = c.fetchall()
-        conn.close()
+        with db_connection() as conn:
+            c = conn.cursor()
+            c.execute("""SELECT id, filename, upload_timestamp, author, title, publication_date, source, doi_url,
+                         (SELECT COUNT(*) FROM document_chunks WHERE document_id = documents.id)
+                         FROM documents ORDER BY upload_timestamp DESC""")
+            rows = c.fetchall()
         return [
             {
                 "id": r[0],
@@ -1171,34 +1994,31 @@ class DeleteDocumentRequest(BaseModel):
 
 
 @app.delete("/documents/delete")
-async def delete_document(request: DeleteDocumentRequest):
+def delete_document(request: DeleteDocumentRequest):
     """Delete a document and its chunks from the database"""
-    conn = None
     try:
-        conn = connect_to_postgres()
-        if conn is None:
-            raise HTTPException(500, "Failed to connect to PostgreSQL")
-        c = conn.cursor()
-        
-        # First, find the document by filename
-        c.execute("SELECT id FROM documents WHERE filename = %s", (request.filename,))
-        row = c.fetchone()
-        
-        if not row:
-            conn.close()
-            raise HTTPException(404, f"Document '{request.filename}' not found")
-        
-        doc_id = row[0]
-        
-        # Delete associated chunks first (foreign key constraint)
-        c.execute("DELETE FROM document_chunks WHERE document_id = %s", (doc_id,))
-        chunks_deleted = c.rowcount
-        
-        # Delete the document
-        c.execute("DELETE FROM documents WHERE id = %s", (doc_id,))
-        
-        conn.commit()
-        
+        with db_connection() as conn:
+            c = conn.cursor()
+
+            # First, find the document by filename
+            c.execute("SELECT id FROM documents WHERE filename = %s", (request.filename,))
+            row = c.fetchone()
+
+            if not row:
+                raise HTTPException(404, f"Document '{request.filename}' not found")
+
+            doc_id = row[0]
+
+            # Delete associated chunks first (foreign key constraint)
+            c.execute("DELETE FROM document_chunks WHERE document_id = %s", (doc_id,))
+            chunks_deleted = c.rowcount
+
+            # Delete the document
+            c.execute("DELETE FROM documents WHERE id = %s", (doc_id,))
+
+            conn.commit()
+        answer_cache.invalidate("document", [doc_id])
+
         return {
             "message": "Document deleted successfully",
             "filename": request.filename,
@@ -1209,37 +2029,31 @@ async def delete_document(request: DeleteDocumentRequest):
         raise
     except Exception as e:
         raise HTTPException(500, str(e))
-    finally:
-        if conn is not None:
-            conn.close()
 
 
 @app.put("/put_ratings")
-async def put_ratings(request: RatingRequest):
+def put_ratings(request: RatingRequest):
     try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
-        c.execute("UPDATE chat_history SET rating = %s, comment = %s WHERE id = %s", (request.rating, request.comment, request.id))
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE chat_history SET rating = %s, comment = %s WHERE id = %s", (request.rating, request.comment, request.id))
+            conn.commit()
         return {"message": "Rating updated", "id": request.id}
     except Exception as e:
         raise HTTPException(500, str(e))
 
 
 @app.post("/register")
-async def register(request: RegisterRequest):
-    conn = connect_to_postgres()
-    c = conn.cursor()
-    c.execute("SELECT id FROM users WHERE username = %s OR email = %s", (request.username,request.email))
-    if c.fetchone():
-        conn.close()
-        raise HTTPException(400, "Username or email already exists")
-    hashed = await hash_password(request.password)
-    token = secrets.token_hex(32)
-    c.execute("INSERT INTO users (username, password, token,email) VALUES (%s, %s, %s)", (request.username, hashed, token,request.email))
-    conn.commit()
-    conn.close()
+def register(request: RegisterRequest):
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id FROM users WHERE username = %s OR email = %s", (request.username,request.email))
+        if c.fetchone():
+            raise HTTPException(400, "Username or email already exists")
+        hashed = hash_password(request.password)
+        token = secrets.token_hex(32)
+        c.execute("INSERT INTO users (username, password, token,email) VALUES (%s, %s, %s)", (request.username, hashed, token,request.email))
+        conn.commit()
 
     params = { # improve on this message later
     "from": "Synerge <no-reply@synergereader.ai>",
@@ -1270,35 +2084,33 @@ async def register(request: RegisterRequest):
 
 
 @app.post("/forgot-password")
-async def forgot_password(request: ForgotPasswordRequest):
-    conn = connect_to_postgres()
-    c = conn.cursor()
+def forgot_password(request: ForgotPasswordRequest):
+    with db_connection() as conn:
+        c = conn.cursor()
 
-    c.execute(
-        "SELECT id, email FROM users WHERE email = %s",
-        (request.email,)
-    )
-    user = c.fetchone()
+        c.execute(
+            "SELECT id, email FROM users WHERE email = %s",
+            (request.email,)
+        )
+        user = c.fetchone()
 
-    if not user:
-        conn.close()
-        raise HTTPException(400, "User not found")
+        if not user:
+            raise HTTPException(400, "User not found")
 
-    user_id, email = user
+        user_id, email = user
 
-    new_password = ''.join(
-        secrets.choice(string.ascii_letters + string.digits)
-        for _ in range(12)
-    )
+        new_password = ''.join(
+            secrets.choice(string.ascii_letters + string.digits)
+            for _ in range(12)
+        )
 
-    hashed = await hash_password(new_password)
+        hashed = hash_password(new_password)
 
-    c.execute(
-        "UPDATE users SET password = %s WHERE id = %s",
-        (hashed, user_id)
-    )
-    conn.commit()
-    conn.close()
+        c.execute(
+            "UPDATE users SET password = %s WHERE id = %s",
+            (hashed, user_id)
+        )
+        conn.commit()
 
     params = {
     "from": "Synerge <no-reply@synergereader.ai>",
@@ -1317,19 +2129,18 @@ async def forgot_password(request: ForgotPasswordRequest):
 
 
 @app.post("/login")
-async def login(request: LoginRequest):
-    conn = connect_to_postgres()
-    c = conn.cursor()
-    c.execute("SELECT password, token FROM users WHERE username = %s", (request.username,))
-    row = c.fetchone()
-    conn.close()
+def login(request: LoginRequest):
+    with db_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT password, token FROM users WHERE username = %s", (request.username,))
+        row = c.fetchone()
     if not row or not bcrypt.checkpw(request.password.encode(), row[0].encode()):
         raise HTTPException(400, "Invalid username or password")
     return {"message": "Login successful", "token": row[1]}
 
 
 @app.post("/google-login")
-async def google_login(request: GoogleLoginRequest):
+def google_login(request: GoogleLoginRequest):
     """
     Google OAuth 2.0 Login Endpoint
 
@@ -1359,23 +2170,22 @@ async def google_login(request: GoogleLoginRequest):
             raise HTTPException(400, "Email not provided by Google")
 
         # Connect to database
-        conn = connect_to_postgres()
-        c = conn.cursor()
+        with db_connection() as conn:
+            c = conn.cursor()
 
-        # Check if user already exists
-        c.execute("SELECT id, token FROM users WHERE username = %s", (email,))
-        row = c.fetchone()
+            # Check if user already exists
+            c.execute("SELECT id, token FROM users WHERE username = %s", (email,))
+            row = c.fetchone()
+
+            if row:
+                # User exists, return their token
+                return {
+                    "message": "Login successful",
+                    "token": row[1],
+                    "email": email,
+                    "name": name,
+                }
 
-        if row:
-            # User exists, return their token
-            conn.close()
-            return {
-                "message": "Login successful",
-                "token": row[1],
-                "email": email,
-                "name": name,
-            }
-        else:
             # Create new user with Google email as username
             # Password is not needed for Google users, we can use a placeholder
             app_token = secrets.token_hex(32)
@@ -1383,7 +2193,6 @@ async def google_login(request: GoogleLoginRequest):
 
             c.execute("INSERT INTO users (username, password, token) VALUES (%s, %s, %s)", (email, placeholder_password, app_token))
             conn.commit()
-            conn.close()
 
             return {
                 "message": "Registration and login successful",
@@ -1399,56 +2208,69 @@ async def google_login(request: GoogleLoginRequest):
         raise HTTPException(500, f"Google login error: {str(e)}")
 
 @app.post("/submit_correction")
-async def submit_correction(request: CorrectionRequest):
+def submit_correction(request: CorrectionRequest):
     try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
+        with db_connection() as conn:
+            c = conn.cursor()
 
-        # Get original question and answer
-        c.execute("SELECT question, answer FROM chat_history WHERE id = %s", (request.chat_id,))
-        row = c.fetchone()
-        if not row:
-            conn.close()
-            raise HTTPException(404, "Chat ID not found")
+            # Get original question and answer
+            c.execute("SELECT question, answer FROM chat_history WHERE id = %s", (request.chat_id,))
+            row = c.fetchone()
+            if not row:
+                raise HTTPException(404, "Chat ID not found")
 
-        question, original_answer = row
+            question, original_answer = row
 
-        # Update chat history
-        c.execute("UPDATE chat_history SET answer = %s, comment = %s WHERE id = %s", (request.corrected_answer, request.comment, request.chat_id))
+            # Update chat history
+            c.execute("UPDATE chat_history SET answer = %s, comment = %s WHERE id = %s", (request.corrected_answer, request.comment, request.chat_id))
 
-        # Insert into knowledge base
-        # Embed the question for semantic matching
-        try:
-            q_emb = embed_chunks([question])
-            q_vec = q_emb[0] if q_emb else None
-        except Exception:
-            q_vec = None
+            # Insert into knowledge base
+            # Embed the question for semantic matching
+            try:
+                q_emb = embed_chunks([question])
+                q_vec = q_emb[0] if q_emb and is_usable_embedding(q_emb[0]) else None
+            except Exception:
+                q_vec = None
 
-        c.execute(
-            "INSERT INTO knowledge_base (question, original_answer, corrected_answer, created_at, chat_history_id, corrected_by, usage_count, embedding) VALUES (%s, %s, %s, %s, %s, %s, 0, %s)",
-            (question, original_answer, request.corrected_answer, datetime.datetime.now().isoformat(), request.chat_id, getattr(request, 'corrected_by', 'User'), q_vec)
-        )
+            corrected_by = getattr(request, 'corrected_by', 'User')
+            # A correction supersedes an existing entry for the same question.
+            # Merely similar questions (another year, another section number)
+            # keep their own answers, so only an exact match is replaced.
+            existing_id = find_exact_duplicate(c, question)
+            if existing_id is not None:
+                c.execute(
+                    "UPDATE knowledge_base SET corrected_answer = %s, chat_history_id = %s, corrected_by = %s WHERE id = %s",
+                    (request.corrected_answer, request.chat_id, corrected_by, existing_id)
+                )
+            else:
+                c.execute(
+                    "INSERT INTO knowledge_base (question, original_answer, corrected_answer, created_at, chat_history_id, corrected_by, usage_count, embedding, question_hash) VALUES (%s, %s, %s, %s, %s, %s, 0, %s, %s)",
+                    (question, original_answer, request.corrected_answer, datetime.datetime.now().isoformat(), request.chat_id, corrected_by, q_vec, question_hash(question))
+                )
 
-        conn.commit()
-        conn.close()
+            conn.commit()
+        answer_cache.invalidate_question(question)
+        if existing_id is not None:
+            answer_cache.invalidate("kb", [existing_id])
         return {
             "message": "Correction submitted and saved to KB",
             "chat_id": request.chat_id,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, str(e))
 
 
 @app.get("/knowledge_base")
-async def knowledge_base():
+def knowledge_base():
     try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
-        c.execute("""SELECT id, question, original_answer, corrected_answer, created_at,
-                            chat_history_id, corrected_by, COALESCE(usage_count,0)
-                     FROM knowledge_base ORDER BY COALESCE(usage_count,0) DESC, id DESC""")
-        rows = c.fetchall()
-        conn.close()
+        with db_connection() as conn:
+            c = conn.cursor()
+            c.execute("""SELECT id, question, original_answer, corrected_answer, created_at,
+                                chat_history_id, corrected_by, COALESCE(usage_count,0)
+                         FROM knowledge_base ORDER BY COALESCE(usage_count,0) DESC, id DESC""")
+            rows = c.fetchall()
         return [
             {
                 "id": r[0],
@@ -1467,38 +2289,62 @@ async def knowledge_base():
 
 
 @app.post("/knowledge_base")
-async def add_knowledge(request: KnowledgeInsertRequest):
+def add_knowledge(request: KnowledgeInsertRequest):
     """Add knowledge items directly to knowledge base (admin/manual entry)"""
     try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
+        try:
+            q_vecs = embed_chunks([item.question for item in request.items])
+        except Exception:
+            q_vecs = [None] * len(request.items)
+        added = updated = 0
+        updated_ids = []
+        skipped = []
+        with db_connection() as conn:
+            c = conn.cursor()
+            for item, q_vec in zip(request.items, q_vecs):
+                q_vec = q_vec if is_usable_embedding(q_vec) else None
+                # Manual entries replace the answer of an entry for the exact same question
+                existing_id = find_exact_duplicate(c, item.question)
+                if existing_id is not None:
+                    c.execute(
+                        "UPDATE knowledge_base SET corrected_answer = %s, context_text = %s, corrected_by = %s WHERE id = %s",
+                        (item.answer, item.source or "", "Manual Entry", existing_id)
+                    )
+                    updated += 1
+                    updated_ids.append(existing_id)
+                    continue
+                # A near-duplicate keeps its own answer; report it rather than add a rival entry
+                similar_id = find_similar(c, q_vec, KB_DEDUP_SIMILARITY)
+                if similar_id is not None:
+                    skipped.append({"question": item.question, "similar_to": similar_id})
+                    continue
+                c.execute(
+                    "INSERT INTO knowledge_base (question, original_answer, corrected_answer, created_at, context_text, corrected_by, usage_count, embedding, question_hash) VALUES (%s, %s, %s, %s, %s, %s, 0, %s, %s)",
+                    (item.question, "", item.answer, datetime.datetime.now().isoformat(), item.source or "", "Manual Entry", q_vec, question_hash(item.question))
+                )
+                added += 1
+            conn.commit()
+        answer_cache.invalidate("kb", updated_ids)
         for item in request.items:
-            try:
-                q_emb = embed_chunks([item.question])
-                q_vec = q_emb[0] if q_emb else None
-            except Exception:
-                q_vec = None
-            c.execute(
-                "INSERT INTO knowledge_base (question, original_answer, corrected_answer, created_at, context_text, corrected_by, usage_count, embedding) VALUES (%s, %s, %s, %s, %s, %s, 0, %s)",
-                (item.question, "", item.answer, datetime.datetime.now().isoformat(), item.source or "", "Manual Entry", q_vec)
-            )
-        conn.commit()
-        conn.close()
-        return {"message": f"{len(request.items)} knowledge items added"}
+            answer_cache.invalidate_question(item.question)
+        return {
+            "message": f"{added} knowledge items added, {updated} updated, {len(skipped)} skipped as near-duplicates",
+            "skipped": skipped,
+        }
     except Exception as e:
         raise HTTPException(500, str(e))
 
 
 @app.delete("/knowledge_base/{entry_id}")
-async def delete_knowledge(entry_id: int):
+def delete_knowledge(entry_id: int):
     """Delete a knowledge base entry by ID"""
     try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
-        c.execute("DELETE FROM knowledge_base WHERE id = %s RETURNING id", (entry_id,))
-        deleted = c.fetchone()
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            c = conn.cursor()
+            c.execute("DELETE FROM knowledge_base WHERE id = %s RETURNING id", (entry_id,))
+            deleted = c.fetchone()
+            conn.commit()
+        answer_cache.invalidate("kb", [entry_id])
         if not deleted:
             raise HTTPException(404, "Entry not found")
         return {"message": f"Entry {entry_id} deleted"}
@@ -1514,26 +2360,38 @@ class KBUpdateRequest(BaseModel):
 
 
 @app.put("/knowledge_base/{entry_id}")
-async def update_knowledge(entry_id: int, request: KBUpdateRequest):
+def update_knowledge(entry_id: int, request: KBUpdateRequest):
     """Edit a knowledge base entry"""
     try:
         # Re-embed if question changed
         try:
             q_emb = embed_chunks([request.question])
-            q_vec = q_emb[0] if q_emb else None
+            q_vec = q_emb[0] if q_emb and is_usable_embedding(q_emb[0]) else None
         except Exception:
             q_vec = None
-        conn = connect_to_postgres()
-        c = conn.cursor()
-        c.execute(
-            "UPDATE knowledge_base SET question=%s, corrected_answer=%s, embedding=%s WHERE id=%s RETURNING id",
-            (request.question, request.answer, q_vec, entry_id)
-        )
-        updated = c.fetchone()
-        conn.commit()
-        conn.close()
-        if not updated:
-            raise HTTPException(404, "Entry not found")
+        with db_connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT question FROM knowledge_base WHERE id = %s FOR UPDATE", (entry_id,))
+            row = c.fetchone()
+            if not row:
+                raise HTTPException(404, "Entry not found")
+            old_question = row[0]
+
+            # Don't let an edit turn this entry into a copy of another one
+            other_id = find_exact_duplicate(c, request.question, exclude_id=entry_id)
+            if other_id is None:
+                other_id = find_similar(c, q_vec, KB_DEDUP_SIMILARITY, exclude_id=entry_id)
+            if other_id is not None:
+                raise HTTPException(409, f"Entry {other_id} already covers this question")
+
+            c.execute(
+                "UPDATE knowledge_base SET question=%s, corrected_answer=%s, embedding=%s, question_hash=%s WHERE id=%s",
+                (request.question, request.answer, q_vec, question_hash(request.question), entry_id)
+            )
+            conn.commit()
+        answer_cache.invalidate("kb", [entry_id])
+        answer_cache.invalidate_question(old_question)
+        answer_cache.invalidate_question(request.question)
         return {"message": f"Entry {entry_id} updated"}
     except HTTPException:
         raise
@@ -1542,17 +2400,16 @@ async def update_knowledge(entry_id: int, request: KBUpdateRequest):
 
 
 @app.get("/admin/check")
-async def check_admin_status(token: Optional[str] = None):
+def check_admin_status(token: Optional[str] = None):
     """Check if user with given token is admin"""
     if not token:
         return {"is_admin": False}
 
     try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
-        c.execute("SELECT is_admin FROM users WHERE token = %s", (token,))
-        row = c.fetchone()
-        conn.close()
+        with db_connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT is_admin FROM users WHERE token = %s", (token,))
+            row = c.fetchone()
 
         if row:
             return {"is_admin": bool(row[0])}
@@ -1562,43 +2419,41 @@ async def check_admin_status(token: Optional[str] = None):
 
 
 @app.get("/admin/ratings")
-async def get_all_ratings(token: Optional[str] = None):
+def get_all_ratings(token: Optional[str] = None):
     """Get all ratings and feedback from responses"""
     if not token:
         raise HTTPException(401, "Unauthorized")
 
     try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
+        with db_connection() as conn:
+            c = conn.cursor()
 
-        # Check if user is admin
-        c.execute("SELECT is_admin FROM users WHERE token = %s", (token,))
-        row = c.fetchone()
+            # Check if user is admin
+            c.execute("SELECT is_admin FROM users WHERE token = %s", (token,))
+            row = c.fetchone()
 
-        if not row or not row[0]:
-            conn.close()
-            raise HTTPException(403, "Forbidden: Admin access required")
-
-        # Fetch all ratings from chat history
-        c.execute("""
-            SELECT 
-                ch.id,
-                ch.user_id,
-                u.username,
-                ch.ts,
-                ch.question,
-                ch.answer,
-                ch.rating,
-                ch.comment,
-                ch.selected_text
-            FROM chat_history ch
-            LEFT JOIN users u ON ch.user_id = u.id
-            WHERE ch.rating IS NOT NULL
-            ORDER BY ch.ts DESC
-        """)
+            if not row or not row[0]:
+                raise HTTPException(403, "Forbidden: Admin access required")
 
-        rows = c.fetchall()
-        conn.close()
+            # Fetch all ratings from chat history
+            c.execute("""
+                SELECT
+                    ch.id,
+                    ch.user_id,
+                    u.username,
+                    ch.ts,
+                    ch.question,
+                    ch.answer,
+                    ch.rating,
+                    ch.comment,
+                    ch.selected_text
+                FROM chat_history ch
+                LEFT JOIN users u ON ch.user_id = u.id
+                WHERE ch.rating IS NOT NULL
+                ORDER BY ch.ts DESC
+            """)
+
+            rows = c.fetchall()
 
         ratings = []
         for row in rows:
@@ -1624,47 +2479,45 @@ async def get_all_ratings(token: Optional[str] = None):
 
 
 @app.get("/admin/ratings/stats")
-async def get_rating_stats(token: Optional[str] = None):
+def get_rating_stats(token: Optional[str] = None):
     """Get statistics about ratings"""
     if not token:
         raise HTTPException(401, "Unauthorized")
 
     try:
-        conn = connect_to_postgres()
-        c = conn.cursor()
+        with db_connection() as conn:
+            c = conn.cursor()
 
-        # Check if user is admin
-        c.execute("SELECT is_admin FROM users WHERE token = %s", (token,))
-        row = c.fetchone()
+            # Check if user is admin
+            c.execute("SELECT is_admin FROM users WHERE token = %s", (token,))
+            row = c.fetchone()
+
+            if not row or not row[0]:
+                raise HTTPException(403, "Forbidden: Admin access required")
 
-        if not row or not row[0]:
-            conn.close()
-            raise HTTPException(403, "Forbidden: Admin access required")
-
-        # Get rating statistics
-        c.execute("""
-            SELECT 
-                COUNT(*) as total_ratings,
-                AVG(rating) as average_rating,
-                MIN(rating) as min_rating,
-                MAX(rating) as max_rating
-            FROM chat_history
-            WHERE rating IS NOT NULL
-        """)
-
-        stats_row = c.fetchone()
-
-        # Get rating distribution
-        c.execute("""
-            SELECT rating, COUNT(*) as count
-            FROM chat_history
-            WHERE rating IS NOT NULL
-            GROUP BY rating
-            ORDER BY rating
-        """)
-
-        distribution_rows = c.fetchall()
-        conn.close()
+            # Get rating statistics
+            c.execute("""
+                SELECT
+                    COUNT(*) as total_ratings,
+                    AVG(rating) as average_rating,
+                    MIN(rating) as min_rating,
+                    MAX(rating) as max_rating
+                FROM chat_history
+                WHERE rating IS NOT NULL
+            """)
+
+            stats_row = c.fetchone()
+
+            # Get rating distribution
+            c.execute("""
+                SELECT rating, COUNT(*) as count
+                FROM chat_history
+                WHERE rating IS NOT NULL
+                GROUP BY rating
+                ORDER BY rating
+            """)
+
+            distribution_rows = c.fetchall()
 
         distribution = {}
         for rating, count in distribution_rows:
@@ -1683,6 +2536,129 @@ async def get_rating_stats(token: Optional[str] = None):
         raise HTTPException(500, str(e))
 
 
+def require_admin(c, token: Optional[str]):
+    """Raise 401/403 unless the token belongs to an admin user."""
+    if not token:
+        raise HTTPException(401, "Unauthorized")
+    c.execute("SELECT is_admin FROM users WHERE token = %s", (token,))
+    row = c.fetchone()
+    if not row or not row[0]:
+        raise HTTPException(403, "Forbidden: Admin access required")
+
+
+@app.get("/admin/vector_indexes")
+def get_vector_index_status(
+    token: Optional[str] = None, sample_size: int = 20, top_k: int = 10
+):
+    """Report ANN index status and recall@k against exact search"""
+    sample_size = max(0, min(sample_size, 200))
+    top_k = max(1, min(top_k, 100))
+    try:
+        with db_connection() as conn:
+            c = conn.cursor()
+            require_admin(c, token)
+
+            indexes = vector_index_status(conn)
+            recall = []
+            if sample_size:
+                for table, column in VECTOR_INDEXES:
+                    recall.append(
+                        measure_vector_recall(conn, table, column, sample_size, top_k)
+                    )
+
+        return {"indexes": indexes, "recall": recall}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+
+@app.get("/admin/embedding_cache")
+def get_embedding_cache_stats(token: Optional[str] = None):
+    """Embedding cache hit/miss counters and request batching stats"""
+    try:
+        with db_connection() as conn:
+            require_admin(conn.cursor(), token)
+        return {**embedding_cache.stats(), "batcher": embedding_batcher.stats()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+
+@app.get("/admin/answer_cache")
+def get_answer_cache_stats(token: Optional[str] = None):
+    """Exact-answer cache size and hit/miss counters, plus semantic cache metrics"""
+    try:
+        with db_connection() as conn:
+            require_admin(conn.cursor(), token)
+        return {
+            **answer_cache.stats(),
+            "semantic": {"enabled": SEMANTIC_CACHE_ENABLED, **semantic_cache_metrics.stats()},
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+
+@app.get("/admin/http_clients")
+def get_http_client_stats(token: Optional[str] = None):
+    """Upstream HTTP connection reuse"""
+    try:
+        with db_connection() as conn:
+            require_admin(conn.cursor(), token)
+        return {"clients": [ollama_http.stats(), openrouter_http.stats()]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+
+@app.get("/admin/ollama")
+def get_ollama_backends(token: Optional[str] = None):
+    """Per-backend circuit state, load and resident models"""
+    try:
+        with db_connection() as conn:
+            require_admin(conn.cursor(), token)
+        return {**ollama_router.stats(), "models": sorted(model_registry.models())}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+
+@app.get("/admin/kb_usage")
+def get_kb_usage(token: Optional[str] = None, minutes: int = 60, limit: int = 20):
+    """Hot knowledge base entries and usage flush stats"""
+    minutes = max(1, min(minutes, 7 * 24 * 60))
+    limit = max(1, min(limit, 100))
+    try:
+        with db_connection() as conn:
+            require_admin(conn.cursor(), token)
+        return {
+            "hot_entries": usage_aggregator.hot_entries(minutes, limit),
+            "aggregator": usage_aggregator.stats(),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+
+@app.get("/admin/jobs")
+def get_job_queue_stats(token: Optional[str] = None):
+    """Background job queue depth and latency"""
+    try:
+        with db_connection() as conn:
+            require_admin(conn.cursor(), token)
+        return job_queue.stats()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+
 @app.get("/test")
 async def test_endpoint():
     return {"message": "SynergeReader API is running successfully!"}
@@ -1691,16 +2667,87 @@ async def test_endpoint():
 # ------------------- Startup -------------------
 
 
+@app.on_event("startup")
+async def configure_event_loop():
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_MAX_WORKERS
+    if EVENT_LOOP_LAG_WARN_MS > 0:
+        app.state.loop_lag_monitor = asyncio.create_task(
+            monitor_event_loop_lag(EVENT_LOOP_LAG_INTERVAL, EVENT_LOOP_LAG_WARN_MS)
+        )
+
+
+@app.on_event("startup")
+def start_job_workers():
+    job_queue.start()
+    try:
+        # Older rows predate question embeddings; cheap no-op once all are filled
+        job_queue.enqueue(
+            "history_embedding_backfill", {}, priority=PRIORITY_LOW, max_attempts=JOB_MAX_ATTEMPTS
+        )
+    except Exception as e:
+        print(f"[jobs] Could not queue the history embedding backfill: {e}")
+
+
+@app.on_event("startup")
+def load_tokenizer():
+    # In the background: /ask estimates token counts until the encoding is ready
+    Thread(target=token_counter.load, name="tokenizer-load", daemon=True).start()
+
+
+@app.on_event("startup")
+def start_ollama_probes():
+    ollama_router.start()
+
+
+@app.on_event("startup")
+def start_kb_usage_flusher():
+    usage_aggregator.start()
+
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    # Registered first: in-flight ingests and jobs finish while the pool,
+    # the embedding batcher and the HTTP clients they use are still open.
+    # Queued-but-unstarted uploads are cancelled.
+    ingest_executor.shutdown(wait=True, cancel_futures=True)
+    job_queue.stop(timeout=None)
+    ingest_embed_executor.shutdown(wait=True, cancel_futures=True)
+    retrieval_executor.shutdown(wait=True, cancel_futures=True)
+    history_executor.shutdown(wait=True, cancel_futures=True)
+    embedding_batcher.close()
+
+
+@app.on_event("shutdown")
+def flush_kb_usage():
+    usage_aggregator.stop()
+
+
+@app.on_event("shutdown")
+def shutdown_db_pool():
+    close_pool()
+
+
+@app.on_event("shutdown")
+def shutdown_pdf_workers():
+    shutdown_pdf_executor()
+
+
+@app.on_event("shutdown")
+def shutdown_http_clients():
+    ollama_router.stop()
+    ollama_http.close()
+    openrouter_http.close()
+
 
 @app.post("/convert-docx")
-async def convert_docx_to_pdf(file: UploadFile = File(...)):
+def convert_docx_to_pdf(file: UploadFile = File(...)):
     """Convert a DOCX file to PDF using LibreOffice headless."""
     if not file.filename.lower().endswith(".docx"):
         raise HTTPException(400, "Only .docx files are supported")
     tmp_dir = tempfile.mkdtemp()
     try:
         docx_path = os.path.join(tmp_dir, sanitize_filename(file.filename))
-        content   = await file.read()
+        content   = file.file.read()
         with open(docx_path, "wb") as f:
             f.write(content)
         result = subprocess.run(
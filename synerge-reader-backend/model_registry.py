@@ -0,0 +1,94 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+def normalize_model_name(name: str) -> str:
+    """Ollama treats "llama3" and "llama3:latest" as the same model."""
+    name = (name or "").strip()
+    return name if ":" in name else f"{name}:latest"
+
+
+def context_length_from_show(info: dict) -> Optional[int]:
+    """Trained context length from an /api/show response ("<arch>.context_length")."""
+    for key, value in (info.get("model_info") or {}).items():
+        if key.endswith(".context_length") and isinstance(value, int) and value > 0:
+            return value
+    return None
+
+
+class ModelRegistry:
+    """
+    TTL-cached set of installed Ollama models.
+
+    ``fetch_models`` returns the model names currently available (as listed
+    by /api/tags). A failed refresh keeps the previous list; until one
+    succeeds the registry is "unknown" and callers should not reject models.
+
+    ``fetch_context_length`` (optional) returns a model's context window, or
+    None if unknown; results are cached per model, failures for ``ttl``.
+    """
+
+    def __init__(
+        self,
+        fetch_models: Callable[[], Iterable[str]],
+        ttl: float = 60,
+        fetch_context_length: Optional[Callable[[str], Optional[int]]] = None,
+    ):
+        self._fetch_models = fetch_models
+        self._fetch_context_length = fetch_context_length
+        self.ttl = ttl
+        self._models: Optional[Set[str]] = None
+        self._fetched_at = 0.0
+        self._context_lengths: Dict[str, Tuple[Optional[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def models(self) -> Set[str]:
+        with self._lock:
+            if self._models is None or time.monotonic() - self._fetched_at >= self.ttl:
+                try:
+                    fetched = {normalize_model_name(m) for m in self._fetch_models() if m}
+                    # An empty answer usually means no backend has been probed yet
+                    if fetched or self._models is None:
+                        self._models = fetched
+                    self._fetched_at = time.monotonic()
+                except Exception as e:
+                    print(f"[models] Refresh failed: {e}")
+            return set(self._models or ())
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = 0.0
+            self._context_lengths.clear()
+
+    def context_length(self, model: str) -> Optional[int]:
+        if self._fetch_context_length is None:
+            return None
+        name = normalize_model_name(model)
+        with self._lock:
+            cached = self._context_lengths.get(name)
+        if cached and (cached[0] is not None or time.monotonic() - cached[1] < self.ttl):
+            return cached[0]
+        try:
+            value = self._fetch_context_length(name)
+        except Exception as e:
+            print(f"[models] Context length lookup failed for {name}: {e}")
+            value = None
+        with self._lock:
+            self._context_lengths[name] = (value, time.monotonic())
+        return value
+
+    def is_available(self, model: str) -> Optional[bool]:
+        """True/False when the model list is known, None when it isn't."""
+        models = self.models()
+        if not models:
+            return None
+        return normalize_model_name(model) in models
+
+    def pick(self, preferred: List[str]) -> Optional[str]:
+        """First installed model from ``preferred``, else None."""
+        models = self.models()
+        for name in preferred:
+            if name and normalize_model_name(name) in models:
+                return name
+        return None
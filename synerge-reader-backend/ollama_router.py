@@ -0,0 +1,348 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+# Endpoints that make Ollama load the requested model into memory
+LOADING_ENDPOINTS = ("/api/generate", "/api/chat", "/api/embed", "/api/embeddings")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitBreaker:
+    """
+    Per-backend circuit breaker. Not thread-safe on its own; the router
+    calls it under its lock.
+
+    closed: traffic flows; ``failure_threshold`` consecutive failures open it.
+    open: no traffic; after ``reset_timeout`` seconds (or a successful
+        background probe) it becomes half-open.
+    half_open: one trial request at a time; success closes, failure reopens.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30, clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self.opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self.trial_in_flight = False
+        return self._state
+
+    def allows_request(self) -> bool:
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and not self.trial_in_flight)
+
+    def on_request(self):
+        if self.state == HALF_OPEN:
+            self.trial_in_flight = True
+
+    def record_success(self):
+        self._state = CLOSED
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self):
+        self._state = OPEN
+        self.opened_at = self._clock()
+        self.trial_in_flight = False
+
+    def probe_succeeded(self):
+        # The server answers again; let real traffic confirm it.
+        if self.state == OPEN:
+            self._state = HALF_OPEN
+            self.trial_in_flight = False
+
+
+class OllamaBackend:
+    """Routing state for one Ollama server."""
+
+    def __init__(self, url: str, priority: int, breaker: CircuitBreaker):
+        self.url = url
+        self.priority = priority
+        self.breaker = breaker
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.models = set()                    # pulled (/api/tags)
+        self.loaded = set()                    # resident in memory (/api/ps)
+        self.requests = 0
+        self.failures = 0
+        self.last_probe_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def has_model(self, model: Optional[str]) -> bool:
+        return bool(model) and model in self.models
+
+    def has_loaded(self, model: Optional[str]) -> bool:
+        return bool(model) and model in self.loaded
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.url,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "in_flight": self.in_flight,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "models": sorted(self.models),
+            "loaded_models": sorted(self.loaded),
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_probe_at": self.last_probe_at,
+            "last_error": self.last_error,
+        }
+
+
+class OllamaRouter:
+    """
+    Spread Ollama calls across several servers.
+
+    A background thread polls /api/tags and /api/ps on every backend and
+    feeds a circuit breaker per backend; request paths only read that
+    cached state. Each call goes to a backend whose breaker admits it,
+    preferring one with the model already resident, then one that has it
+    pulled, and among those the lowest (in_flight + 1) * latency EWMA.
+    Ties go to the configured order.
+
+    With ``balance=False`` the URLs are aliases for the same server rather
+    than a pool: calls always go to the first one whose breaker admits
+    them, and the rest are failover only.
+
+    A call that fails with one of ``retry_exceptions`` (connection refused,
+    timeout) is retried once on each remaining candidate.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        client,
+        probe_interval: float = 10,
+        probe_timeout: tuple = (1.5, 5),
+        ewma_alpha: float = 0.3,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30,
+        balance: bool = True,
+        retry_exceptions: tuple = (ConnectionError, TimeoutError),
+    ):
+        if not urls:
+            raise ValueError("At least one Ollama URL is required")
+        self.backends = [
+            OllamaBackend(url.rstrip("/"), i, CircuitBreaker(failure_threshold, reset_timeout))
+            for i, url in enumerate(urls)
+        ]
+        self._client = client
+        self.balance = balance
+        self.retry_exceptions = retry_exceptions
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---- health probing ----
+
+    def start(self):
+        """Probe every backend once (so routing starts from real health), then keep probing in the background."""
+        if self._thread is None:
+            self._stop.clear()
+            self._probe_round()
+            self._thread = threading.Thread(
+                target=self._probe_loop, name="ollama-probe", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _probe_round(self, executor: Optional[ThreadPoolExecutor] = None):
+        # Probe backends concurrently so one dead host can't delay the rest
+        if executor is None:
+            with ThreadPoolExecutor(
+                max_workers=len(self.backends), thread_name_prefix="ollama-probe"
+            ) as executor:
+                list(executor.map(self.probe, self.backends))
+        else:
+            list(executor.map(self.probe, self.backends))
+
+    def _probe_loop(self):
+        with ThreadPoolExecutor(
+            max_workers=len(self.backends), thread_name_prefix="ollama-probe"
+        ) as executor:
+            while not self._stop.wait(self.probe_interval):
+                self._probe_round(executor)
+
+    def probe_all(self):
+        for backend in self.backends:
+            self.probe(backend)
+
+    def probe(self, backend: OllamaBackend):
+        try:
+            resp = self._client.get(f"{backend.url}/api/tags", timeout=self.probe_timeout)
+            resp.raise_for_status()
+            models = {m.get("name") for m in resp.json().get("models", []) if m.get("name")}
+        except Exception as e:
+            with self._lock:
+                # An unreachable server is a strong signal: open straight away
+                backend.breaker.trip()
+                backend.last_error = str(e)
+                backend.last_probe_at = time.time()
+            return
+
+        loaded = None
+        try:
+            resp = self._client.get(f"{backend.url}/api/ps", timeout=self.probe_timeout)
+            resp.raise_for_status()
+            loaded = {m.get("name") for m in resp.json().get("models", []) if m.get("name")}
+        except Exception:
+            pass  # older Ollama versions have no /api/ps
+
+        with self._lock:
+            backend.breaker.probe_succeeded()
+            backend.last_error = None
+            backend.models = models
+            if loaded is not None:
+                backend.loaded = loaded
+            backend.last_probe_at = time.time()
+
+    # ---- routing ----
+
+    def candidates(self, model: Optional[str] = None) -> List[OllamaBackend]:
+        """Backends worth trying for ``model``, best first."""
+        with self._lock:
+            return self._ranked(model)
+
+    def _ranked(self, model: Optional[str]) -> List[OllamaBackend]:
+        usable = [b for b in self.backends if b.breaker.allows_request()]
+        if not self.balance:
+            return usable
+        default_latency = min(
+            (b.latency_ewma for b in usable if b.latency_ewma is not None), default=1.0
+        )
+        return sorted(
+            usable,
+            key=lambda b: (
+                not b.has_loaded(model),
+                not b.has_model(model),
+                (b.in_flight + 1) * (b.latency_ewma if b.latency_ewma is not None else default_latency),
+                b.priority,
+            ),
+        )
+
+    def choose(self, model: Optional[str] = None) -> OllamaBackend:
+        candidates = self.candidates(model)
+        if not candidates:
+            raise self._unreachable()
+        return candidates[0]
+
+    def _unreachable(self) -> RuntimeError:
+        errors = " | ".join(f"{b.url}: {b.last_error}" for b in self.backends)
+        return RuntimeError("Ollama is not reachable. Checked " + errors)
+
+    def _reserve(self, model: Optional[str], exclude=()) -> OllamaBackend:
+        with self._lock:
+            # Ranked and reserved under one lock so only one caller gets a half-open trial
+            ranked = [b for b in self._ranked(model) if b not in exclude]
+            if ranked:
+                backend = ranked[0]
+                backend.breaker.on_request()
+                backend.in_flight += 1
+                backend.requests += 1
+                return backend
+        raise self._unreachable()
+
+    def _release(self, backend: OllamaBackend, model, elapsed: float, error=None):
+        with self._lock:
+            backend.in_flight -= 1
+            if error is not None:
+                backend.failures += 1
+                backend.last_error = str(error)
+                backend.breaker.record_failure()
+                return
+            backend.breaker.record_success()
+            if backend.latency_ewma is None:
+                backend.latency_ewma = elapsed
+            else:
+                backend.latency_ewma += self.ewma_alpha * (elapsed - backend.latency_ewma)
+            if model:
+                # Ollama loads a model on first use, so it is resident now
+                backend.loaded.add(model)
+                backend.models.add(model)
+
+    def post(self, endpoint: str, payload: dict, *, stream: bool = False, timeout=None):
+        """
+        POST to the best backend. For streamed responses the backend stays
+        reserved until the response is closed (use it as a context manager).
+        """
+        model = payload.get("model")
+        tried = []
+        while True:
+            backend = self._reserve(model, exclude=tried)
+            started = time.monotonic()
+            try:
+                resp = self._client.post(
+                    f"{backend.url}{endpoint}", json=payload, stream=stream, timeout=timeout
+                )
+                break
+            except Exception as e:
+                self._release(backend, model, time.monotonic() - started, error=e)
+                tried.append(backend)
+                if not isinstance(e, self.retry_exceptions) or not self._has_untried(model, tried):
+                    raise
+                print(f"[ollama] {backend.url} failed ({e}), trying the next backend")
+
+        if resp.status_code >= 500:
+            self._release(
+                backend, model, time.monotonic() - started,
+                error=RuntimeError(f"HTTP {resp.status_code}"),
+            )
+            return resp
+        if resp.status_code >= 400 or endpoint not in LOADING_ENDPOINTS:
+            model = None  # e.g. model not found, or /api/show; don't mark it resident
+        if not stream:
+            self._release(backend, model, time.monotonic() - started)
+            return resp
+
+        # Latency is time to response headers; the slot is held until close()
+        elapsed = time.monotonic() - started
+        close = resp.close
+        released = False
+
+        def close_and_release():
+            nonlocal released
+            if not released:
+                released = True
+                self._release(backend, model, elapsed)
+            close()
+
+        resp.close = close_and_release
+        return resp
+
+    def _has_untried(self, model: Optional[str], tried) -> bool:
+        with self._lock:
+            return any(b not in tried for b in self._ranked(model))
+
+    def available_models(self) -> set:
+        """Models pulled on any backend currently admitting traffic."""
+        with self._lock:
+            return set().union(
+                *(b.models for b in self.backends if b.breaker.allows_request())
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"balance": self.balance, "backends": [b.snapshot() for b in self.backends]}
@@ -0,0 +1,147 @@
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from retrieval import estimate_tokens
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens with tiktoken when it is installed, otherwise with
+    retrieval.estimate_tokens (~4 characters per token). BPE vocabularies differ
+    between models, so either way the count is approximate, though far
+    closer than raw character cutoffs.
+
+    Call ``load`` once at startup: tiktoken may download its BPE file on
+    first use, and until that finishes counts fall back to the estimator
+    instead of waiting on it.
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the encoding (blocking); failures leave the estimator in use."""
+        with self._lock:
+            return self._load_locked()
+
+    def _load(self):
+        if self._loaded:
+            return self._encoding
+        # Another thread is loading (possibly downloading): don't wait for it
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return self._load_locked()
+        finally:
+            self._lock.release()
+
+    def _load_locked(self):
+        if not self._loaded:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                print(f"[prompt] tiktoken unavailable ({e}), estimating tokens from length")
+            self._loaded = True
+        return self._encoding
+
+    @property
+    def backend(self) -> str:
+        return "tiktoken" if self._load() is not None else "heuristic"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        encoding = self._load()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut ``text`` to at most ``max_tokens`` tokens."""
+        if max_tokens <= 0:
+            return ""
+        encoding = self._load()
+        if encoding is not None:
+            tokens = encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+        return text[: max_tokens * 4]
+
+
+@dataclass
+class PromptItem:
+    section: str                  # e.g. "context", "selection", "kb", "history"
+    text: str
+    score: float = 0.0            # higher is kept first
+    data: dict = field(default_factory=dict)
+    tokens: int = 0
+
+
+def assemble(
+    items: List[PromptItem],
+    budget: int,
+    counter: TokenCounter,
+    section_shares: Optional[Dict[str, float]] = None,
+) -> Tuple[List[PromptItem], dict]:
+    """
+    Fit ``items`` into ``budget`` tokens.
+
+    Each section may use at most its share of the budget (default: all of
+    it); an item larger than its section's share is truncated to fit. Then
+    the lowest-scoring items are dropped, per section and overall, until
+    everything fits. Kept items are returned in their original order, with
+    a usage report.
+    """
+    section_shares = section_shares or {}
+    budget = max(0, budget)
+    caps = {
+        section: int(budget * section_shares.get(section, 1.0))
+        for section in {item.section for item in items}
+    }
+
+    truncated = 0
+    for item in items:
+        item.tokens = counter.count(item.text)
+        cap = caps[item.section]
+        if item.tokens > cap:
+            item.text = counter.truncate(item.text, cap)
+            item.tokens = counter.count(item.text)
+            truncated += 1
+
+    # Lowest score first; among equal scores, later items go first
+    drop_order = sorted(range(len(items)), key=lambda i: (items[i].score, -i))
+    # Items truncated to nothing (a zero budget) are dropped outright
+    kept = {i for i, item in enumerate(items) if item.text}
+    used_by_section = {section: 0 for section in caps}
+    for i in kept:
+        used_by_section[items[i].section] += items[i].tokens
+
+    for i in drop_order:
+        section = items[i].section
+        if i in kept and used_by_section[section] > caps[section]:
+            kept.discard(i)
+            used_by_section[section] -= items[i].tokens
+    for i in drop_order:
+        if sum(used_by_section.values()) <= budget:
+            break
+        if i in kept:
+            kept.discard(i)
+            used_by_section[items[i].section] -= items[i].tokens
+
+    selected = [item for i, item in enumerate(items) if i in kept]
+    usage = {
+        "budget": budget,
+        "used": sum(item.tokens for item in selected),
+        "by_section": {
+            section: sum(item.tokens for item in selected if item.section == section)
+            for section in caps
+        },
+        "dropped": len(items) - len(selected),
+        "truncated": truncated,
+        "tokenizer": counter.backend,
+    }
+    return selected, usage
@@ -0,0 +1,143 @@
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# Standard RRF damping constant (Cormack et al.); larger values flatten ranks.
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Hashable]],
+    k: int = RRF_K,
+    weights: Optional[Sequence[float]] = None,
+) -> List[Tuple[Hashable, float]]:
+    """
+    Fuse several best-first rankings of ids into one.
+
+    Each id scores sum(weight / (k + rank)) over the rankings it appears in
+    (rank starts at 1). Ties keep the order in which ids were first seen.
+    """
+    if weights is None:
+        weights = [1.0] * len(rankings)
+    scores: Dict[Hashable, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def fuse_candidates(
+    vector_rows: Sequence[dict],
+    lexical_rows: Sequence[dict],
+    limit: int,
+    k: int = RRF_K,
+) -> List[dict]:
+    """
+    Merge vector and lexical candidate rows (dicts with an "id") by RRF.
+    Returned rows carry "rrf_score" and "match" ("vector", "lexical" or "both").
+    """
+    by_id = {}
+    for row in lexical_rows:
+        by_id[row["id"]] = dict(row, match="lexical")
+    for row in vector_rows:
+        merged = dict(by_id.get(row["id"], {}), **row)
+        merged["match"] = "both" if row["id"] in by_id else "vector"
+        by_id[row["id"]] = merged
+
+    fused = reciprocal_rank_fusion(
+        [[row["id"] for row in vector_rows], [row["id"] for row in lexical_rows]], k=k
+    )
+    results = []
+    for key, score in fused[:limit]:
+        row = by_id[key]
+        row["rrf_score"] = score
+        results.append(row)
+    return results
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def neighbour_keys(hits: Sequence[Tuple[int, int]], window: int) -> List[Tuple[int, int]]:
+    """(document_id, chunk_index) keys of every hit and its +-``window`` neighbours."""
+    keys = []
+    for document_id, chunk_index in hits:
+        for offset in range(-window, window + 1):
+            key = (document_id, chunk_index + offset)
+            if key[1] >= 0 and key not in keys:
+                keys.append(key)
+    return keys
+
+
+def select_with_neighbours(
+    hits: Sequence[Tuple[int, int]],
+    texts: Dict[Tuple[int, int], str],
+    window: int,
+    token_budget: int,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+) -> List[Tuple[int, int]]:
+    """
+    Pick chunks for the prompt within ``token_budget``: hits best-first, each
+    followed by its nearest neighbours (index -1, +1, -2, ...). A hit that
+    doesn't fit is skipped along with its neighbours. Returns keys in
+    document order.
+    """
+    selected = set()
+    used = 0
+    for document_id, chunk_index in hits:
+        hit = (document_id, chunk_index)
+        if hit not in texts:
+            continue
+        if hit not in selected:
+            cost = count_tokens(texts[hit])
+            if used + cost > token_budget:
+                continue
+            selected.add(hit)
+            used += cost
+        for distance in range(1, window + 1):
+            for key in ((document_id, chunk_index - distance), (document_id, chunk_index + distance)):
+                if key in selected or key not in texts:
+                    continue
+                cost = count_tokens(texts[key])
+                if used + cost <= token_budget:
+                    selected.add(key)
+                    used += cost
+    return sorted(selected)
+
+
+def contiguous_runs(keys: Sequence[Tuple[int, int]]) -> List[List[Tuple[int, int]]]:
+    """Group sorted (document_id, chunk_index) keys into runs of adjacent chunks."""
+    runs: List[List[Tuple[int, int]]] = []
+    for key in keys:
+        if runs and runs[-1][-1][0] == key[0] and runs[-1][-1][1] + 1 == key[1]:
+            runs[-1].append(key)
+        else:
+            runs.append([key])
+    return runs
+
+
+def _overlap_length(previous: str, text: str, max_overlap: int) -> int:
+    """Length of the longest whole-word prefix of ``text`` that ``previous`` ends with."""
+    for k in range(min(max_overlap, len(previous), len(text)), 0, -1):
+        if text[k:k + 1] not in ("", " ") or previous[-k - 1:-k] not in ("", " "):
+            continue
+        if previous.endswith(text[:k]):
+            return k
+    return 0
+
+
+def stitch_chunks(texts: Sequence[str], max_overlap: int, separator: str = "\n\n") -> str:
+    """
+    Join adjacent chunks of one document, dropping the leading words each
+    chunk repeats from the end of the previous one (the chunker's overlap,
+    at most ``max_overlap`` characters). Chunks without overlap are joined
+    with ``separator``.
+    """
+    stitched = ""
+    for text in texts:
+        if not stitched:
+            stitched = text
+            continue
+        k = _overlap_length(stitched, text, max_overlap)
+        stitched = stitched + text[k:] if k else stitched + separator + text
+    return stitched
@@ -14,6 +14,8 @@ class AskRequest(BaseModel):
     auth_token: Optional[str] = None
     active_document_name: Optional[str] = None
     selections: List[SelectionContext] = Field(default_factory=list)
+    # Set to False to always generate a fresh answer (skips the semantic cache)
+    use_semantic_cache: bool = True
 
 
 class AskResponse(BaseModel):
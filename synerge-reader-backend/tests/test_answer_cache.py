@@ -0,0 +1,108 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from answer_cache import AnswerCache, SemanticCacheMetrics, context_fingerprint, jaccard, pick_semantic_match
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_fingerprint_ignores_order_and_duplicates():
+    assert context_fingerprint(["chunk:1", "kb:2"]) == context_fingerprint(["kb:2", "chunk:1", "kb:2"])
+    assert context_fingerprint(["chunk:1"]) != context_fingerprint(["chunk:2"])
+
+
+def test_key_normalizes_question():
+    assert AnswerCache.key("llama3", "What is RAG?", "f") == AnswerCache.key("llama3", "  what is rag ", "f")
+    assert AnswerCache.key("llama3", "What is RAG?", "f") != AnswerCache.key("mistral", "What is RAG?", "f")
+
+
+def test_hit_miss_and_ttl():
+    clock = FakeClock()
+    cache = AnswerCache(max_entries=10, ttl=60, clock=clock)
+    key = AnswerCache.key("m", "q", "f")
+    assert cache.get(key) is None
+    cache.put(key, "answer", {"context_source": "retrieval"})
+    assert cache.get(key).answer == "answer"
+    clock.now = 61
+    assert cache.get(key) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 0)
+
+
+def test_lru_eviction():
+    cache = AnswerCache(max_entries=2, ttl=60)
+    a, b, c = (AnswerCache.key("m", q, "f") for q in ("a", "b", "c"))
+    cache.put(a, "A", {})
+    cache.put(b, "B", {})
+    cache.get(a)
+    cache.put(c, "C", {})
+    assert cache.get(b) is None
+    assert cache.get(a).answer == "A"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_by_tag_and_question():
+    cache = AnswerCache(max_entries=10, ttl=60)
+    doc_key = AnswerCache.key("m", "q1", "f")
+    kb_key = AnswerCache.key("m", "q2", "f")
+    other = AnswerCache.key("m", "Q2?", "g")
+    cache.put(doc_key, "A", {}, {"document": [7], "kb": []})
+    cache.put(kb_key, "B", {}, {"document": [8], "kb": [3]})
+    cache.put(other, "C", {}, {})
+
+    assert cache.invalidate("document", [7]) == 1
+    assert cache.get(doc_key) is None
+    assert cache.invalidate("kb", [3]) == 1
+    assert cache.invalidate_question("q2") == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_disabled_cache_stores_nothing():
+    cache = AnswerCache(max_entries=0)
+    key = AnswerCache.key("m", "q", "f")
+    cache.put(key, "A", {})
+    assert cache.get(key) is None
+
+
+def test_jaccard():
+    assert jaccard(["a", "b"], ["b", "c"]) == 1 / 3
+    assert jaccard([], []) == 1.0
+    assert jaccard(["a"], []) == 0.0
+
+
+def test_pick_semantic_match_needs_distance_and_overlap():
+    candidates = [
+        {"id": 1, "distance": 0.02, "context_keys": ["context:9"]},
+        {"id": 2, "distance": 0.05, "context_keys": ["context:1", "context:2", "kb:3"]},
+        {"id": 3, "distance": 0.30, "context_keys": ["context:1", "context:2"]},
+    ]
+    match = pick_semantic_match(candidates, ["context:1", "context:2"], max_distance=0.1, min_overlap=0.6)
+    assert match["id"] == 2
+    assert match["overlap"] == 2 / 3
+    assert pick_semantic_match(candidates, ["context:7"], 0.1, 0.6) is None
+    assert pick_semantic_match(candidates[2:], ["context:1", "context:2"], 0.1, 0.6) is None
+
+
+def test_pick_semantic_match_handles_rows_without_keys():
+    candidates = [{"id": 1, "distance": 0.0, "context_keys": None}]
+    assert pick_semantic_match(candidates, ["context:1"], 0.1, 0.5) is None
+
+
+def test_semantic_metrics():
+    metrics = SemanticCacheMetrics()
+    metrics.record_lookup(0.010, hit=True)
+    metrics.record_lookup(0.030, hit=False)
+    metrics.record_opt_out()
+    stats = metrics.stats()
+    assert (stats["hits"], stats["misses"], stats["opt_outs"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+    assert stats["avg_lookup_ms"] == 20.0
+    assert stats["max_lookup_ms"] == 30.0
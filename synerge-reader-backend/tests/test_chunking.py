@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from chunking import iter_chunks
+
+
+def test_empty_text_yields_nothing():
+    assert list(iter_chunks("   \n\n  ")) == []
+
+
+def test_short_text_is_one_chunk():
+    assert list(iter_chunks("Hello   world.\nBye.")) == ["Hello world. Bye."]
+
+
+def test_chunks_respect_max_size():
+    text = " ".join(f"word{i}" for i in range(2000))
+    chunks = list(iter_chunks(text, max_chunk_size=100, overlap=20))
+    assert chunks
+    assert all(len(c) <= 100 for c in chunks)
+
+
+def test_no_overlap_preserves_every_word_once():
+    words = [f"w{i}" for i in range(500)]
+    chunks = list(iter_chunks(" ".join(words), max_chunk_size=60))
+    assert " ".join(chunks).split() == words
+
+
+def test_overlap_repeats_tail_of_previous_chunk():
+    text = " ".join(f"w{i}" for i in range(200))
+    chunks = list(iter_chunks(text, max_chunk_size=50, overlap=10))
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert nxt.split()[0] in prev.split()
+
+
+def test_prefers_sentence_boundaries():
+    text = "Alpha beta gamma delta. Epsilon zeta eta theta iota kappa lambda mu."
+    chunks = list(iter_chunks(text, max_chunk_size=40))
+    assert chunks[0] == "Alpha beta gamma delta."
+
+
+def test_prefers_paragraph_over_sentence_boundaries():
+    text = "One two three four.\n\nFive six. Seven eight nine ten eleven twelve."
+    chunks = list(iter_chunks(text, max_chunk_size=40, min_fill=0.4))
+    assert chunks[0] == "One two three four."
+
+
+def test_segments_are_streamed_in_order():
+    pages = ["[Page 1] first page text.", "[Page 2] second page text."]
+    assert list(iter_chunks(iter(pages), max_chunk_size=30)) == [
+        "[Page 1] first page text.",
+        "[Page 2] second page text.",
+    ]
+
+
+def test_invalid_overlap_raises():
+    with pytest.raises(ValueError):
+        list(iter_chunks("text", max_chunk_size=10, overlap=10))
@@ -0,0 +1,335 @@
+import io
+import os
+import struct
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("pgvector")
+pytest.importorskip("dotenv")
+
+import psycopg2
+import psycopg2.pool
+
+import dbSetup
+from dbSetup import (
+    ChunkSpool,
+    VectorConnectionPool,
+    _encode_chunk_rows,
+    apply_vector_search_settings,
+    copy_document_chunks,
+    db_connection,
+    ensure_vector_indexes,
+)
+
+
+def decode_copy(data: bytes):
+    """Parse binary COPY output back into (document_id, text, chunk_index, embedding) rows."""
+    buf = io.BytesIO(data)
+    assert buf.read(11) == b"PGCOPY\n\xff\r\n\x00"
+    flags, extension_length = struct.unpack("!ii", buf.read(8))
+    assert (flags, extension_length) == (0, 0)
+    rows = []
+    while True:
+        (field_count,) = struct.unpack("!h", buf.read(2))
+        if field_count == -1:
+            assert buf.read() == b""
+            return rows
+        assert field_count == 4
+        fields = []
+        for _ in range(field_count):
+            (length,) = struct.unpack("!i", buf.read(4))
+            fields.append(None if length == -1 else buf.read(length))
+        document_id = struct.unpack("!i", fields[0])[0]
+        text = fields[1].decode("utf-8")
+        chunk_index = struct.unpack("!i", fields[2])[0]
+        embedding = None
+        if fields[3] is not None:
+            dim, unused = struct.unpack("!hh", fields[3][:4])
+            assert unused == 0
+            assert len(fields[3]) == 4 + 4 * dim
+            embedding = list(struct.unpack(f"!{dim}f", fields[3][4:]))
+        rows.append((document_id, text, chunk_index, embedding))
+
+
+def test_encoded_rows_round_trip_with_header_nulls_and_vector_layout():
+    rows = [
+        (7, "first chunk", 0, [0.5, -1.0, 2.25]),
+        (7, "naïve \x00text", 1, None),
+    ]
+    decoded = decode_copy(_encode_chunk_rows(rows).getvalue())
+    assert decoded == [
+        (7, "first chunk", 0, [0.5, -1.0, 2.25]),
+        # NUL bytes are not allowed in text columns and are dropped
+        (7, "naïve text", 1, None),
+    ]
+
+
+def test_empty_batch_is_just_header_and_trailer():
+    assert decode_copy(_encode_chunk_rows([]).getvalue()) == []
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.copied = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy_expert(self, sql, file):
+        self.copied.append((sql, file.read()))
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.cursor_obj = RecordingCursor()
+
+    def cursor(self):
+        return self.cursor_obj
+
+
+def test_copy_document_chunks_numbers_rows_from_start_index():
+    conn = RecordingConnection()
+    assert copy_document_chunks(conn, 3, ["a", "b"], [[1.0], [2.0]], start_index=5) == 2
+    sql, data = conn.cursor_obj.copied[0]
+    assert "FORMAT binary" in sql
+    assert decode_copy(data) == [(3, "a", 5, [1.0]), (3, "b", 6, [2.0])]
+    assert copy_document_chunks(conn, 3, [], []) == 0
+    assert len(conn.cursor_obj.copied) == 1
+
+
+def test_chunk_spool_stages_batches_and_copies_them_once():
+    spool = ChunkSpool(9, max_memory=16)  # tiny limit: rolls over to disk
+    spool.add(["a", "b"], [[1.0], None])
+    spool.add(["c"], [[3.0]])
+    conn = RecordingConnection()
+    assert spool.copy_into(conn) == 3
+    spool.close()
+    _, data = conn.cursor_obj.copied[0]
+    assert decode_copy(data) == [(9, "a", 0, [1.0]), (9, "b", 1, None), (9, "c", 2, [3.0])]
+
+
+def test_empty_spool_copies_nothing():
+    conn = RecordingConnection()
+    spool = ChunkSpool(1)
+    assert spool.copy_into(conn) == 0
+    spool.close()
+    assert conn.cursor_obj.copied == []
+
+
+class FakeDbCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.queries.append((sql, params))
+        if not self.conn.healthy:
+            raise psycopg2.OperationalError("server closed the connection")
+
+
+class FakeDbConnection:
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.closed = 0
+        self.queries = []
+        self.rollbacks = 0
+        self.commits = 0
+
+    def cursor(self):
+        return FakeDbCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def commit(self):
+        self.commits += 1
+
+
+class FakePool:
+    def __init__(self, connections):
+        self.idle = list(connections)
+        self.returned = []
+        self.discarded = []
+
+    def getconn(self):
+        return self.idle.pop(0)
+
+    def putconn(self, conn, close=False):
+        (self.discarded if close else self.returned).append(conn)
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    def install(*connections):
+        pool = FakePool(connections)
+        monkeypatch.setattr(dbSetup, "_pool", pool)
+        monkeypatch.setattr(dbSetup, "_pool_slots", threading.BoundedSemaphore(1))
+        monkeypatch.setattr(dbSetup, "_last_used", {})
+        return pool
+    return install
+
+
+def test_stale_connection_is_discarded_and_its_replacement_checked(fake_pool):
+    stale, also_stale, healthy = FakeDbConnection(False), FakeDbConnection(False), FakeDbConnection()
+    pool = fake_pool(stale, also_stale, healthy)
+    with db_connection() as conn:
+        assert conn is healthy
+    assert pool.discarded == [stale, also_stale]
+    assert pool.returned == [healthy]
+    # Pinged before use, rolled back on return
+    assert healthy.queries == [("SELECT 1", None)]
+    assert id(healthy) in dbSetup._last_used
+
+
+def test_checkout_gives_up_after_bounded_attempts(fake_pool, monkeypatch):
+    monkeypatch.setattr(dbSetup, "DB_POOL_CHECKOUT_ATTEMPTS", 2)
+    pool = fake_pool(FakeDbConnection(False), FakeDbConnection(False), FakeDbConnection())
+    with pytest.raises(psycopg2.pool.PoolError):
+        with db_connection():
+            pass
+    assert len(pool.discarded) == 2
+    assert len(pool.idle) == 1
+    # The pool slot was released
+    assert dbSetup._pool_slots.acquire(blocking=False)
+
+
+def test_recently_used_connection_is_not_pinged(fake_pool):
+    conn = FakeDbConnection()
+    fake_pool(conn)
+    dbSetup._last_used[id(conn)] = time.monotonic()
+    with db_connection() as borrowed:
+        assert borrowed is conn
+    assert conn.queries == []
+
+
+def test_vector_search_settings_are_applied_and_failures_rolled_back(monkeypatch):
+    monkeypatch.setattr(dbSetup, "VECTOR_HNSW_EF_SEARCH", 64)
+    monkeypatch.setattr(dbSetup, "VECTOR_IVFFLAT_PROBES", 7)
+    conn = FakeDbConnection()
+    apply_vector_search_settings(conn)
+    assert conn.queries == [("SET hnsw.ef_search = %s", (64,)), ("SET ivfflat.probes = %s", (7,))]
+
+    broken = FakeDbConnection(healthy=False)
+    apply_vector_search_settings(broken)
+    assert broken.rollbacks == 1
+
+
+def test_new_pooled_connections_register_vector_and_apply_settings(monkeypatch):
+    conn = FakeDbConnection()
+    registered = []
+    monkeypatch.setattr(psycopg2.pool.AbstractConnectionPool, "_connect", lambda self, key=None: conn)
+    monkeypatch.setattr(dbSetup, "register_vector", registered.append)
+    pool = VectorConnectionPool(0, 1, "dbname=unused")
+    assert pool._connect() is conn
+    assert registered == [conn]
+    assert [sql for sql, _ in conn.queries] == ["SET hnsw.ef_search = %s", "SET ivfflat.probes = %s"]
+    assert conn.commits == 1
+
+
+class IndexCatalogConnection:
+    """Answers the pg_class/pg_am lookup from ``existing`` (index name -> row); fails CREATEs in ``broken``."""
+
+    def __init__(self, existing=None, broken=()):
+        self.existing = existing or {}
+        self.broken = set(broken)
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+        self._row = None
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        if "FROM pg_class" in sql:
+            self._row = self.existing.get(params[0])
+            return
+        self.statements.append(" ".join(sql.split()))
+        if any(sql.startswith("CREATE") and f" {name} " in sql for name in self.broken):
+            raise psycopg2.ProgrammingError("operator class does not exist")
+
+    def fetchone(self):
+        return self._row
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def hnsw_settings(monkeypatch):
+    monkeypatch.setattr(dbSetup, "VECTOR_INDEX_TYPE", "hnsw")
+    monkeypatch.setattr(dbSetup, "VECTOR_HNSW_M", 16)
+    monkeypatch.setattr(dbSetup, "VECTOR_HNSW_EF_CONSTRUCTION", 64)
+    monkeypatch.setattr(dbSetup, "VECTOR_INDEXES", {("document_chunks", "embedding"): "document_chunks_embedding_idx"})
+
+
+def test_missing_vector_index_is_built_with_cosine_ops(hnsw_settings):
+    conn = IndexCatalogConnection()
+    ensure_vector_indexes(conn)
+    assert conn.statements == [
+        "CREATE INDEX IF NOT EXISTS document_chunks_embedding_idx ON document_chunks "
+        "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+    ]
+    assert conn.commits == 1
+
+
+def test_matching_vector_index_is_left_alone(hnsw_settings):
+    conn = IndexCatalogConnection({"document_chunks_embedding_idx": ("hnsw", ["ef_construction=64", "m=16"], True)})
+    ensure_vector_indexes(conn)
+    assert conn.statements == []
+
+
+@pytest.mark.parametrize("row", [
+    ("ivfflat", ["lists=100"], True),               # index type changed
+    ("hnsw", ["m=8", "ef_construction=64"], True),  # build options changed
+    ("hnsw", ["m=16", "ef_construction=64"], False),  # interrupted concurrent build
+])
+def test_outdated_vector_index_is_rebuilt(hnsw_settings, row):
+    conn = IndexCatalogConnection({"document_chunks_embedding_idx": row})
+    ensure_vector_indexes(conn)
+    assert conn.statements[0] == "DROP INDEX IF EXISTS document_chunks_embedding_idx"
+    assert conn.statements[1].startswith("CREATE INDEX IF NOT EXISTS document_chunks_embedding_idx")
+
+
+def test_failed_vector_index_build_rolls_back_and_continues(hnsw_settings, monkeypatch):
+    monkeypatch.setattr(dbSetup, "VECTOR_INDEXES", {
+        ("document_chunks", "embedding"): "document_chunks_embedding_idx",
+        ("knowledge_base", "embedding"): "knowledge_base_embedding_idx",
+    })
+    conn = IndexCatalogConnection(broken={"document_chunks_embedding_idx"})
+    ensure_vector_indexes(conn)
+    assert conn.rollbacks == 1
+    assert conn.commits == 1
+    assert "knowledge_base_embedding_idx" in conn.statements[-1]
+
+
+def test_ivfflat_index_uses_lists(monkeypatch, hnsw_settings):
+    monkeypatch.setattr(dbSetup, "VECTOR_INDEX_TYPE", "ivfflat")
+    monkeypatch.setattr(dbSetup, "VECTOR_IVFFLAT_LISTS", 50)
+    conn = IndexCatalogConnection()
+    ensure_vector_indexes(conn)
+    assert conn.statements[0].endswith("USING ivfflat (embedding vector_cosine_ops) WITH (lists = 50)")
+
+
+def test_unknown_vector_index_type_is_skipped(monkeypatch, hnsw_settings):
+    monkeypatch.setattr(dbSetup, "VECTOR_INDEX_TYPE", "diskann")
+    conn = IndexCatalogConnection()
+    ensure_vector_indexes(conn)
+    assert conn.statements == []
@@ -0,0 +1,76 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from doc_summaries import group_summaries, summarize_document
+
+
+def paragraphs(count: int, size: int = 400) -> str:
+    return "\n\n".join(f"Paragraph {i}. " + "word " * (size // 5) for i in range(count))
+
+
+class FakeModel:
+    """Answers section prompts with a short summary and counts reduce calls."""
+
+    def __init__(self, fail_sections=()):
+        self.fail_sections = set(fail_sections)
+        self.reduce_prompts = []
+        self.lock = threading.Lock()
+
+    def __call__(self, prompt: str) -> str:
+        if prompt.startswith("Summarize the following section"):
+            part = int(prompt.split("Section ")[1].split(" of")[0])
+            if part in self.fail_sections:
+                raise RuntimeError("model timeout")
+            return f" section {part} summary "
+        with self.lock:
+            self.reduce_prompts.append(prompt)
+        return f"combined {len(self.reduce_prompts)}"
+
+
+def test_group_summaries_respects_max_chars():
+    assert group_summaries(["aaaa", "bbbb", "cc", "dddddd"], max_chars=8) == [
+        ["aaaa", "bbbb"], ["cc", "dddddd"]
+    ]
+    assert group_summaries(["x" * 20], max_chars=8) == [["x" * 20]]
+
+
+def test_summarize_document_maps_then_reduces_once_when_it_fits():
+    model = FakeModel()
+    result = summarize_document(paragraphs(12), "Title", model, window_chars=1000, concurrency=3)
+
+    assert len(result["sections"]) > 1
+    assert result["sections"][0] == "section 1 summary"
+    assert len(model.reduce_prompts) == 1
+    assert 'titled "Title"' in model.reduce_prompts[0]
+    assert result["document"] == "combined 1"
+
+
+def test_summarize_document_reduces_hierarchically():
+    model = FakeModel()
+    result = summarize_document(paragraphs(12), "T", model, window_chars=1000, reduce_chars=40)
+
+    # Several group summaries, then a final pass over those
+    assert len(model.reduce_prompts) > 2
+    assert result["document"] == f"combined {len(model.reduce_prompts)}"
+
+
+def test_summarize_document_skips_failed_sections():
+    model = FakeModel(fail_sections={1})
+    result = summarize_document(paragraphs(12), "T", model, window_chars=1000)
+    assert "section 1 summary" not in result["sections"]
+    assert result["sections"][0] == "section 2 summary"
+
+
+def test_summarize_document_raises_when_every_section_fails():
+    model = FakeModel(fail_sections=range(1, 100))
+    with pytest.raises(RuntimeError):
+        summarize_document(paragraphs(12), "T", model, window_chars=1000)
+
+
+def test_summarize_document_empty_text():
+    assert summarize_document("", "T", FakeModel()) == {"sections": [], "document": ""}
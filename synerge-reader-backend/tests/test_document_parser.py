@@ -11,6 +11,7 @@ from document_parser import (
     ExtractionError,
     UnsupportedFileTypeError,
     _detect_file_type,
+    _page_ranges,
     extract_text_from_upload,
     looks_like_text,
 )
@@ -110,3 +111,17 @@ def test_docx_extraction():
     result = extract_text_from_upload("test.docx", content)
     assert result.file_type == "docx"
     assert "Hello DOCX world" in result.text
+
+
+def test_page_ranges_cover_all_pages_in_order():
+    ranges = _page_ranges(150, 4)
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == 150
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert len(ranges) == 8
+
+
+def test_page_ranges_small_documents():
+    assert _page_ranges(0, 4) == []
+    assert _page_ranges(3, 4) == [(0, 1), (1, 2), (2, 3)]
+    assert _page_ranges(5, 1) == [(0, 3), (3, 5)]
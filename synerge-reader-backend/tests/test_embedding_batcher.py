@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from embedding_batcher import EmbeddingBatcher
+
+
+class FakeFetch:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, texts, model):
+        with self.lock:
+            self.calls.append((model, list(texts)))
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def test_concurrent_callers_share_one_batch():
+    fetch = FakeFetch()
+    batcher = EmbeddingBatcher(fetch, max_batch_size=16, max_wait_ms=200)
+    results = {}
+
+    def call(i):
+        results[i] = batcher.embed("m", [f"text {i}"])
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert len(fetch.calls) < 8
+    assert results[3] == [[6.0, 1.0]]
+
+
+def test_full_batch_is_sent_without_waiting_and_split_by_size():
+    fetch = FakeFetch()
+    batcher = EmbeddingBatcher(fetch, max_batch_size=3, max_wait_ms=300)
+    futures = batcher.submit("m", ["a", "bb", "ccc", "dddd"])
+    futures[0].result(timeout=0.2)
+    assert futures[3].result(timeout=5) == [4.0, 1.0]
+    batcher.close()
+    assert [len(texts) for _, texts in fetch.calls] == [3, 1]
+
+
+def test_duplicate_texts_are_embedded_once():
+    fetch = FakeFetch()
+    batcher = EmbeddingBatcher(fetch, max_batch_size=8, max_wait_ms=50)
+    assert batcher.embed("m", ["x", "x", "y"]) == [[1.0, 1.0], [1.0, 1.0], [1.0, 1.0]]
+    batcher.close()
+    assert fetch.calls == [("m", ["x", "y"])]
+    assert batcher.stats()["coalesced_duplicates"] == 1
+
+
+def test_models_are_never_mixed_in_one_call():
+    fetch = FakeFetch()
+    batcher = EmbeddingBatcher(fetch, max_batch_size=8, max_wait_ms=50)
+    futures = batcher.submit("a", ["1"]) + batcher.submit("b", ["2"]) + batcher.submit("a", ["3"])
+    [f.result(timeout=5) for f in futures]
+    batcher.close()
+    assert sorted(fetch.calls) == [("a", ["1", "3"]), ("b", ["2"])]
+
+
+def test_fetch_errors_propagate_to_every_caller():
+    def failing(texts, model):
+        raise RuntimeError("ollama down")
+
+    batcher = EmbeddingBatcher(failing, max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.embed("m", ["a", "b"])
+    batcher.close()
+    assert batcher.stats()["errors"] == 1
+
+
+def test_close_fails_texts_still_waiting_for_a_batch():
+    fetch = FakeFetch()
+    batcher = EmbeddingBatcher(fetch, max_batch_size=16, max_wait_ms=60_000)
+    futures = batcher.submit("m", ["a", "b"])
+    batcher.close()
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="closed"):
+            future.result(timeout=1)
+    assert fetch.calls == []
+    with pytest.raises(RuntimeError):
+        batcher.submit("m", ["c"])
@@ -0,0 +1,61 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from embedding_cache import EmbeddingCache, text_digest
+
+
+class FakeStore:
+    def __init__(self):
+        self.rows = {}
+
+    def get_many(self, model, digests):
+        return {d: self.rows[(model, d)] for d in digests if (model, d) in self.rows}
+
+    def put_many(self, model, embeddings):
+        for digest, emb in embeddings.items():
+            self.rows[(model, digest)] = list(emb)
+
+
+def test_miss_then_memory_hit():
+    cache = EmbeddingCache(max_entries=10)
+    assert cache.get_many("m", ["hello"]) == {}
+    cache.put_many("m", {"hello": [0.5, 1.0]})
+    assert cache.get_many("m", ["hello"]) == {"hello": [0.5, 1.0]}
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["memory_hits"] == 1
+
+
+def test_key_includes_model():
+    cache = EmbeddingCache(max_entries=10)
+    cache.put_many("a", {"hello": [1.0]})
+    assert cache.get_many("b", ["hello"]) == {}
+
+
+def test_lru_evicts_least_recently_used():
+    cache = EmbeddingCache(max_entries=2)
+    cache.put_many("m", {"one": [1.0], "two": [2.0]})
+    cache.get_many("m", ["one"])
+    cache.put_many("m", {"three": [3.0]})
+    assert set(cache.get_many("m", ["one", "two", "three"])) == {"one", "three"}
+
+
+def test_zero_vectors_are_not_cached():
+    store = FakeStore()
+    cache = EmbeddingCache(max_entries=10, store=store)
+    cache.put_many("m", {"failed": [0.0, 0.0]})
+    assert cache.get_many("m", ["failed"]) == {}
+    assert store.rows == {}
+
+
+def test_persistent_tier_backfills_memory():
+    store = FakeStore()
+    store.rows[("m", text_digest("hello"))] = [0.25, 0.75]
+    cache = EmbeddingCache(max_entries=10, store=store)
+    assert cache.get_many("m", ["hello"]) == {"hello": [0.25, 0.75]}
+    assert cache.get_many("m", ["hello"]) == {"hello": [0.25, 0.75]}
+    stats = cache.stats()
+    assert stats["store_hits"] == 1
+    assert stats["memory_hits"] == 1
@@ -0,0 +1,86 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from history_search import (
+    backfill_question_embeddings,
+    lexical_history_candidates,
+    vector_history_candidates,
+)
+
+OR_TSQUERY = "replace(plainto_tsquery('english', %s)::text, '&', '|')::tsquery"
+
+
+class FakeCursor:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.sql = None
+        self.params = None
+        self.updates = []
+
+    def execute(self, sql, params=None):
+        self.sql = " ".join(sql.split())
+        self.params = list(params)
+
+    def executemany(self, sql, seq):
+        self.updates.extend(seq)
+
+    def fetchall(self):
+        return self.rows
+
+
+def row(id_, similarity, rank=None):
+    base = (id_, "2024-01-01", "sel", f"q{id_}", f"a{id_}", similarity)
+    return base if rank is None else base + (rank,)
+
+
+def test_vector_lookup_is_an_exact_search_over_the_owners_rows():
+    cursor = FakeCursor([row(1, 0.9), row(2, 0.4)])
+    results = vector_history_candidates(cursor, 42, [0.1, 0.2], 6)
+    assert "WITH mine AS MATERIALIZED" in cursor.sql
+    assert "WHERE user_id = %s AND question_embedding IS NOT NULL" in cursor.sql
+    assert cursor.params == [42, [0.1, 0.2], [0.1, 0.2], 6]
+    # Matches below MIN_VECTOR_SIMILARITY are dropped
+    assert [r["id"] for r in results] == [1]
+    assert results[0]["similarity"] == 0.9
+
+
+def test_signed_out_history_only_matches_signed_out_rows():
+    cursor = FakeCursor()
+    vector_history_candidates(cursor, None, [0.1], 3)
+    assert "WHERE user_id IS NULL AND question_embedding IS NOT NULL" in cursor.sql
+    assert cursor.params == [[0.1], [0.1], 3]
+
+
+def test_lexical_lookup_finds_rows_without_embeddings():
+    cursor = FakeCursor([row(5, None, 0.3)])
+    results = lexical_history_candidates(cursor, 42, "deadline date", None, 6, OR_TSQUERY)
+    assert "question_embedding IS NOT NULL" not in cursor.sql
+    assert "plainto_tsquery('english', %s)" in cursor.sql
+    assert cursor.params == [None, "deadline date", 42, 6]
+    assert results == [{
+        "id": 5, "timestamp": "2024-01-01", "selected_text": "sel", "question": "q5",
+        "answer": "a5", "similarity": None, "lexical_rank": 0.3,
+    }]
+
+
+def test_backfill_stores_usable_embeddings_and_skips_failures():
+    cursor = FakeCursor([(3, "first?"), (8, "second?")])
+    embedded = []
+
+    def embed(texts):
+        embedded.extend(texts)
+        return [[0.5, 0.5], [0.0, 0.0]]  # the second failed (all zeros)
+
+    assert backfill_question_embeddings(cursor, embed, after_id=1, batch_size=2) == 8
+    assert "FOR UPDATE SKIP LOCKED" in cursor.sql
+    assert cursor.params == [1, 2]
+    assert embedded == ["first?", "second?"]
+    assert cursor.updates == [([0.5, 0.5], 3)]
+
+
+def test_backfill_reports_when_nothing_is_left():
+    cursor = FakeCursor()
+    assert backfill_question_embeddings(cursor, lambda texts: [], after_id=8) is None
+    assert cursor.updates == []
@@ -0,0 +1,44 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+pytest.importorskip("requests")
+
+from http_clients import UpstreamClient
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_connections_are_reused_across_requests():
+    server = HTTPServer(("127.0.0.1", 0), OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = UpstreamClient("test", pool_maxsize=2)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/"
+        for _ in range(5):
+            assert client.get(url, timeout=5).text == "ok"
+        stats = client.stats()
+    finally:
+        client.close()
+        server.shutdown()
+
+    assert stats["requests"] == 5
+    assert stats["connections_opened"] == 1
+    assert stats["connection_reuse_ratio"] == 0.8
@@ -0,0 +1,44 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ingest_jobs import IngestJobRegistry
+
+
+def test_create_and_update_snapshot():
+    jobs = IngestJobRegistry()
+    job = jobs.create("doc.pdf")
+    jobs.update(job.id, status="running", stage="extracting", progress={"chars_extracted": 10})
+    snapshot = jobs.get(job.id)
+    assert snapshot["status"] == "running"
+    assert snapshot["progress"] == {"chars_extracted": 10}
+
+
+def test_unknown_job_is_none():
+    assert IngestJobRegistry().get("missing") is None
+
+
+def test_follow_replays_and_streams_until_finished():
+    jobs = IngestJobRegistry()
+    job = jobs.create("doc.txt")
+    jobs.update(job.id, status="running")
+
+    def finish():
+        jobs.update(job.id, progress={"chunks_inserted": 3})
+        jobs.update(job.id, status="completed", result={"document_id": 1})
+
+    threading.Timer(0.05, finish).start()
+    events = list(jobs.follow(job.id, heartbeat=5))
+    assert [e["seq"] for e in events] == [0, 1, 2, 3]
+    assert events[-1]["status"] == "completed"
+
+
+def test_finished_jobs_are_pruned_beyond_capacity():
+    jobs = IngestJobRegistry(max_jobs=2)
+    first = jobs.create("a")
+    jobs.update(first.id, status="completed")
+    jobs.create("b")
+    jobs.create("c")
+    assert jobs.get(first.id) is None
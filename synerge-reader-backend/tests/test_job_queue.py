@@ -0,0 +1,126 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from job_queue import JobQueue, retry_delay
+
+
+class RecordingQueue(JobQueue):
+    """JobQueue with the DB writes replaced by in-memory records."""
+
+    def __init__(self):
+        super().__init__(connection_factory=None, workers=0)
+        self.finished = []
+        self.failed = []
+
+    def _finish(self, job_id, result, locked_by):
+        self.finished.append((job_id, result))
+
+    def _fail(self, job_id, attempts, max_attempts, error, locked_by):
+        self.failed.append((job_id, attempts, max_attempts, error))
+
+
+def test_retry_delay_grows_exponentially_and_is_capped():
+    assert [retry_delay(n, 10, 60) for n in range(1, 6)] == [10, 20, 40, 60, 60]
+
+
+def test_execute_dispatches_to_registered_handler():
+    jobs = RecordingQueue()
+    jobs.register("echo", lambda payload: {"got": payload["value"]})
+    jobs._execute(1, "echo", {"value": 3}, 1, 3, "w:1")
+    assert jobs.finished == [(1, {"got": 3})]
+    assert jobs.failed == []
+
+
+def test_handler_errors_and_unknown_kinds_are_recorded_as_failures():
+    jobs = RecordingQueue()
+
+    def boom(payload):
+        raise RuntimeError("upstream down")
+
+    jobs.register("boom", boom)
+    jobs._execute(1, "boom", {}, 2, 3, "w:1")
+    jobs._execute(2, "missing", {}, 1, 3, "w:2")
+    assert [f[0] for f in jobs.failed] == [1, 2]
+    assert "upstream down" in jobs.failed[0][3]
+    assert jobs.finished == []
+
+
+class FakeCursor:
+    def __init__(self, results=(), rowcount=1):
+        self.results = list(results)
+        self.queries = []
+        self.params = []
+        self.rowcount = rowcount
+
+    def execute(self, sql, params=None):
+        self.queries.append(" ".join(sql.split()))
+        self.params.append(params)
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        pass
+
+
+def test_stats_filters_the_aggregate_and_maps_rows():
+    cursor = FakeCursor([
+        [("kb_auto_save", "queued", 4, 12.34), ("kb_auto_save", "done", 9, None)],
+        [("kb_auto_save", 9, 0.5, 2.25, 7.0)],
+    ])
+    jobs = JobQueue(connection_factory=lambda: FakeConnection(cursor), workers=0)
+    stats = jobs.stats()
+
+    # FILTER must follow the aggregate call itself, not the EXTRACT around it
+    assert "MIN(created_at) FILTER (WHERE status = 'queued'))" in cursor.queries[0]
+    assert ") FILTER" not in cursor.queries[0].replace("MIN(created_at) FILTER", "")
+    assert stats["depth"][0] == {
+        "kind": "kb_auto_save", "status": "queued", "count": 4, "oldest_queued_seconds": 12.3,
+    }
+    assert stats["depth"][1]["oldest_queued_seconds"] is None
+    assert stats["latency"][0]["avg_run_seconds"] == 2.25
+
+
+def test_claim_fails_exhausted_expired_jobs_instead_of_reclaiming_them():
+    cursor = FakeCursor([None])
+    jobs = JobQueue(connection_factory=lambda: FakeConnection(cursor), workers=0)
+    assert jobs._claim() is None
+
+    expire, claim = cursor.queries
+    assert "SET status = 'failed'" in expire
+    assert "locked_until < now() AND attempts >= max_attempts" in expire
+    assert "locked_until < now() AND attempts < max_attempts" in claim
+    # Every claim gets its own lease token
+    assert cursor.params[1][0].startswith(jobs._worker_id + ":")
+
+
+def test_finish_and_fail_only_apply_to_the_current_lease_holder():
+    cursor = FakeCursor(rowcount=0)
+    jobs = JobQueue(connection_factory=lambda: FakeConnection(cursor), workers=0)
+    assert jobs._finish(7, {"ok": True}, "w:old") is False
+    assert jobs._fail(7, 1, 3, "boom", "w:old") is False
+    for query, params in zip(cursor.queries, cursor.params):
+        assert "WHERE id = %s AND status = 'running' AND locked_by = %s" in query
+        assert params[-2:] == (7, "w:old")
+
+    cursor.rowcount = 1
+    assert jobs._finish(7, None, "w:new") is True
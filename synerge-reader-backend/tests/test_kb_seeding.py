@@ -0,0 +1,58 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from kb_seeding import parse_qa_pairs, section_windows, select_pairs
+
+
+def test_parse_qa_pairs_handles_multiline_answers():
+    raw = """Q: What is covered?
+A: The scope of the statute.
+It applies statewide.
+
+Q: Who enforces it?
+A: The attorney general."""
+    assert parse_qa_pairs(raw) == [
+        {"question": "What is covered?", "answer": "The scope of the statute. It applies statewide."},
+        {"question": "Who enforces it?", "answer": "The attorney general."},
+    ]
+
+
+def test_parse_qa_pairs_ignores_preamble_and_unanswered_questions():
+    assert parse_qa_pairs("Sure! Here you go.\nQ: Dangling?\n") == []
+
+
+def test_section_windows_cover_whole_document():
+    paragraphs = [f"Paragraph {i} " + "word " * 60 + "end." for i in range(40)]
+    windows = section_windows("\n\n".join(paragraphs), window_chars=1000, max_windows=0)
+    assert "Paragraph 0" in windows[0]
+    assert "Paragraph 39" in windows[-1]
+    assert all(len(w) <= 1000 for w in windows)
+
+
+def test_section_windows_are_capped_with_even_spread():
+    paragraphs = [f"Paragraph {i} " + "word " * 60 + "end." for i in range(40)]
+    windows = section_windows("\n\n".join(paragraphs), window_chars=400, max_windows=4)
+    assert len(windows) == 4
+    assert "Paragraph 0" in windows[0]
+    assert "Paragraph 0" not in windows[-1]
+
+
+def test_select_pairs_drops_short_and_duplicate_questions():
+    pairs = [
+        {"question": "What?", "answer": "Too short"},
+        {"question": "Why is it so?", "answer": "Because the text says so clearly."},
+        {"question": "why is it so?", "answer": "A duplicate answer that is long enough."},
+    ]
+    assert select_pairs(pairs) == [
+        {"question": "Why is it so?", "answer": "Because the text says so clearly."}
+    ]
+
+
+def test_select_pairs_treats_punctuation_variants_as_duplicates():
+    pairs = [
+        {"question": "What is the deadline?", "answer": "Thirty days after the notice is served."},
+        {"question": "what is the  deadline", "answer": "Another answer that is long enough."},
+    ]
+    assert len(select_pairs(pairs)) == 1
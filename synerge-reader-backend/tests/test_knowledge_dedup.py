@@ -0,0 +1,87 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from knowledge_dedup import (
+    cosine_similarity,
+    find_duplicate,
+    find_exact_duplicate,
+    find_similar,
+    normalize_question,
+    question_hash,
+)
+
+
+class FakeCursor:
+    """Answers the hash lookup, then the nearest-neighbour lookup, from canned rows."""
+
+    def __init__(self, hash_row=None, nearest_row=None):
+        self.rows = [hash_row, nearest_row]
+        self.queries = []
+
+    def execute(self, sql, params):
+        self.queries.append(sql)
+        self.params = params
+
+    def fetchone(self):
+        return self.rows[len(self.queries) - 1]
+
+
+def test_normalize_ignores_case_punctuation_and_spacing():
+    assert normalize_question("  What's the DEADLINE?? ") == "what s the deadline"
+    assert question_hash("What is it?") == question_hash("what is it")
+
+
+def test_cosine_similarity():
+    assert cosine_similarity([1, 0], [1, 0]) == 1.0
+    assert cosine_similarity([1, 0], [0, 1]) == 0.0
+    assert cosine_similarity([0, 0], [1, 0]) == 0.0
+
+
+def test_exact_hash_match_skips_vector_search():
+    cursor = FakeCursor(hash_row=(7,))
+    assert find_duplicate(cursor, "Q?", [0.1, 0.2]) == 7
+    assert len(cursor.queries) == 1
+
+
+def test_nearest_neighbour_is_checked_against_threshold():
+    assert find_duplicate(FakeCursor(nearest_row=(3, 0.05)), "Q?", [0.1], threshold=0.92) == 3
+    assert find_duplicate(FakeCursor(nearest_row=(3, 0.2)), "Q?", [0.1], threshold=0.92) is None
+
+
+def test_nearest_neighbour_query_orders_by_distance():
+    cursor = FakeCursor(nearest_row=None)
+    assert find_duplicate(cursor, "Q?", [0.1]) is None
+    assert "ORDER BY embedding <=>" in cursor.queries[1]
+    assert "LIMIT 1" in cursor.queries[1]
+
+
+def test_without_embedding_only_exact_matches_count():
+    cursor = FakeCursor()
+    assert find_duplicate(cursor, "Q?", None) is None
+    assert len(cursor.queries) == 1
+
+
+def test_exact_duplicate_never_falls_back_to_vectors():
+    assert find_exact_duplicate(FakeCursor(hash_row=(4,)), "Q?") == 4
+    cursor = FakeCursor(nearest_row=(3, 0.01))
+    assert find_exact_duplicate(cursor, "Q?") is None
+    assert len(cursor.queries) == 1
+
+
+def test_lookups_can_exclude_the_entry_being_edited():
+    cursor = FakeCursor()
+    assert find_exact_duplicate(cursor, "Q?", exclude_id=5) is None
+    assert cursor.params == (question_hash("Q?"), 5)
+    assert "id IS DISTINCT FROM %s" in cursor.queries[0]
+
+    cursor = FakeCursor(hash_row=(3, 0.05))  # first query is the vector lookup here
+    assert find_similar(cursor, [0.1], threshold=0.92, exclude_id=5) == 3
+    assert cursor.params == ([0.1], 5, [0.1])
+
+
+def test_similar_needs_an_embedding():
+    cursor = FakeCursor()
+    assert find_similar(cursor, None) is None
+    assert cursor.queries == []
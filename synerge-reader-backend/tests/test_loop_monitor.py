@@ -0,0 +1,39 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from loop_monitor import monitor_event_loop_lag
+
+
+async def run_monitor(warn_ms, workload):
+    reports = []
+    monitor = asyncio.create_task(monitor_event_loop_lag(0.01, warn_ms, reports.append))
+    await asyncio.sleep(0.02)
+    await workload()
+    await asyncio.sleep(0.05)
+    monitor.cancel()
+    try:
+        await monitor
+    except asyncio.CancelledError:
+        pass
+    return reports
+
+
+def test_blocking_call_on_the_loop_is_reported():
+    async def blocking():
+        time.sleep(0.2)  # the kind of call user code must not make on the loop
+
+    reports = asyncio.run(run_monitor(50, blocking))
+    assert len(reports) == 1
+    assert reports[0].startswith("[loop] Event loop blocked for")
+    assert int(reports[0].split()[-2]) >= 150
+
+
+def test_work_moved_off_the_loop_is_not_reported():
+    async def offloaded():
+        await asyncio.get_running_loop().run_in_executor(None, time.sleep, 0.2)
+
+    assert asyncio.run(run_monitor(50, offloaded)) == []
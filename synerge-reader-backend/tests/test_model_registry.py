@@ -0,0 +1,80 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from model_registry import ModelRegistry, context_length_from_show, normalize_model_name
+
+
+def test_normalize_adds_latest_tag():
+    assert normalize_model_name("llama3") == "llama3:latest"
+    assert normalize_model_name("llama3.1:8b") == "llama3.1:8b"
+
+
+def test_models_are_cached_until_ttl_expires():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return ["llama3:latest"]
+
+    registry = ModelRegistry(fetch, ttl=60)
+    registry.models()
+    registry.models()
+    assert len(calls) == 1
+    registry.invalidate()
+    registry.models()
+    assert len(calls) == 2
+
+
+def test_unknown_registry_never_rejects():
+    registry = ModelRegistry(lambda: [], ttl=60)
+    assert registry.is_available("anything") is None
+
+
+def test_is_available_matches_untagged_names():
+    registry = ModelRegistry(lambda: ["llama3:latest", "mistral:7b"], ttl=60)
+    assert registry.is_available("llama3") is True
+    assert registry.is_available("mistral") is False
+
+
+def test_pick_prefers_configured_order():
+    registry = ModelRegistry(lambda: ["phi3:latest", "mistral:latest"], ttl=60)
+    assert registry.pick(["saul-instruct:latest", "mistral:latest", "phi3:latest"]) == "mistral:latest"
+    assert registry.pick(["missing:1b"]) is None
+
+
+def test_failed_refresh_keeps_previous_models():
+    results = [["llama3:latest"]]
+
+    def fetch():
+        if not results:
+            raise ConnectionError("down")
+        return results.pop()
+
+    registry = ModelRegistry(fetch, ttl=0)
+    assert registry.models() == {"llama3:latest"}
+    assert registry.models() == {"llama3:latest"}
+
+
+def test_context_length_from_show_reads_model_info():
+    info = {"model_info": {"general.architecture": "llama", "llama.context_length": 131072}}
+    assert context_length_from_show(info) == 131072
+    assert context_length_from_show({}) is None
+
+
+def test_context_length_is_cached_and_failures_retried_after_ttl():
+    calls = []
+
+    def fetch(name):
+        calls.append(name)
+        if len(calls) == 1:
+            raise ConnectionError("down")
+        return 8192
+
+    registry = ModelRegistry(lambda: [], ttl=0, fetch_context_length=fetch)
+    assert registry.context_length("llama3") is None
+    assert registry.context_length("llama3") == 8192
+    assert registry.context_length("llama3:latest") == 8192
+    assert calls == ["llama3:latest", "llama3:latest"]
+    assert ModelRegistry(lambda: []).context_length("llama3") is None
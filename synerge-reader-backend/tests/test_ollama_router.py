@@ -0,0 +1,201 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from ollama_router import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, OllamaRouter
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, data=None):
+        self.status_code = status_code
+        self._data = data or {}
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def json(self):
+        return self._data
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    """Serves /api/tags and /api/ps per host; hosts in ``down`` refuse connections."""
+
+    def __init__(self, tags=None, ps=None, down=()):
+        self.tags = tags or {}
+        self.ps = ps or {}
+        self.down = set(down)
+        self.posts = []
+
+    def _host(self, url):
+        return url.split("/api/")[0]
+
+    def get(self, url, timeout=None):
+        host = self._host(url)
+        if host in self.down:
+            raise ConnectionError("refused")
+        source = self.tags if url.endswith("/api/tags") else self.ps
+        return FakeResponse(data={"models": [{"name": n} for n in source.get(host, [])]})
+
+    def post(self, url, json=None, stream=False, timeout=None):
+        host = self._host(url)
+        if host in self.down:
+            raise ConnectionError("refused")
+        self.posts.append(host)
+        return FakeResponse()
+
+
+A, B, C = "http://a:11434", "http://b:11434", "http://c:11434"
+
+
+def test_prefers_backend_with_model_resident():
+    client = FakeClient(tags={A: ["llama3"], B: ["llama3"]}, ps={B: ["llama3"]})
+    router = OllamaRouter([A, B], client)
+    router.probe_all()
+    assert router.choose("llama3").url == B
+    assert router.choose("other").url == A
+
+
+def test_unhealthy_backends_are_skipped():
+    client = FakeClient(tags={B: ["m"]}, down={A})
+    router = OllamaRouter([A, B], client)
+    router.probe_all()
+    router.post("/api/generate", {"model": "m"})
+    assert client.posts == [B]
+
+
+def test_no_healthy_backend_raises():
+    router = OllamaRouter([A], FakeClient(down={A}))
+    router.probe_all()
+    with pytest.raises(RuntimeError):
+        router.choose("m")
+
+
+def test_streamed_response_holds_slot_until_closed():
+    client = FakeClient(tags={A: ["m"], B: ["m"]})
+    router = OllamaRouter([A, B], client)
+    router.probe_all()
+    resp = router.post("/api/generate", {"model": "m"}, stream=True)
+    assert router.backends[0].in_flight == 1
+    # A is busy, so the next call goes to B
+    router.post("/api/generate", {"model": "m"})
+    assert client.posts == [A, B]
+    resp.close()
+    assert resp.closed
+    assert router.backends[0].in_flight == 0
+
+
+def test_without_balancing_backends_are_failover_only():
+    client = FakeClient(tags={A: ["m"], B: ["m"]}, ps={B: ["m"]})
+    router = OllamaRouter([A, B], client, balance=False)
+    router.probe_all()
+    resp = router.post("/api/generate", {"model": "m"}, stream=True)
+    # A stays first despite B having the model resident and A being busy
+    router.post("/api/generate", {"model": "m"})
+    resp.close()
+    client.down.add(A)
+    router.probe_all()
+    router.post("/api/generate", {"model": "m"})
+    assert client.posts == [A, A, B]
+
+
+def test_connection_errors_fail_over_to_the_next_backend():
+    # No probe yet: every breaker is closed and the dead primary ranks first
+    client = FakeClient(down={A})
+    router = OllamaRouter([A, B], client, balance=False)
+    router.post("/api/generate", {"model": "m"})
+    assert client.posts == [B]
+    assert router.backends[0].failures == 1
+
+
+def test_non_retryable_errors_are_raised():
+    client = FakeClient(down={A})
+    router = OllamaRouter([A, B], client, retry_exceptions=(TimeoutError,))
+    with pytest.raises(ConnectionError):
+        router.post("/api/generate", {"model": "m"})
+    assert client.posts == []
+
+
+def test_start_probes_before_routing():
+    client = FakeClient(tags={B: ["m"]}, down={A})
+    router = OllamaRouter([A, B], client, balance=False, probe_interval=3600)
+    router.start()
+    try:
+        assert router.backends[0].breaker.state == OPEN
+        assert router.choose("m").url == B
+    finally:
+        router.stop()
+
+
+def test_failed_post_counts_against_backend():
+    client = FakeClient(tags={A: ["m"]})
+    router = OllamaRouter([A], client)
+    router.probe_all()
+    client.down.add(A)
+    with pytest.raises(ConnectionError):
+        router.post("/api/embed", {"model": "m"})
+    assert router.backends[0].failures == 1
+    assert router.backends[0].in_flight == 0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_consecutive_failures_and_half_opens_after_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allows_request()
+    clock.now = 31
+    assert breaker.state == HALF_OPEN
+    assert breaker.allows_request()
+
+
+def test_half_open_admits_one_trial_and_closes_on_success():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=5, clock=clock)
+    breaker.record_failure()
+    clock.now = 6
+    breaker.on_request()
+    assert not breaker.allows_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_failure_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=5, clock=clock)
+    breaker.trip()
+    breaker.probe_succeeded()
+    assert breaker.state == HALF_OPEN
+    breaker.on_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_router_routes_around_open_circuit_without_probing():
+    client = FakeClient(tags={A: ["m"], B: ["m"]})
+    router = OllamaRouter([A, B], client, failure_threshold=1)
+    router.probe_all()
+    client.down.add(A)
+    # The failed call itself fails over to B
+    router.post("/api/generate", {"model": "m"})
+    client.down.clear()
+    router.post("/api/generate", {"model": "m"})
+    assert client.posts == [B, B]
+    assert router.backends[0].breaker.state == OPEN
@@ -0,0 +1,86 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from prompt_budget import PromptItem, TokenCounter, assemble
+
+
+class HeuristicCounter(TokenCounter):
+    """Length-based counting regardless of whether tiktoken is installed."""
+
+    def _load(self):
+        return None
+
+
+def item(section, tokens, score, name=None):
+    return PromptItem(section, "x" * (tokens * 4), score, data={"name": name})
+
+
+def names(items):
+    return [i.data["name"] for i in items]
+
+
+def test_heuristic_counter_counts_and_truncates():
+    counter = HeuristicCounter()
+    assert counter.backend == "heuristic"
+    assert counter.count("") == 0
+    assert counter.count("abcdefgh") == 2
+    assert counter.truncate("abcdefgh", 1) == "abcd"
+    assert counter.truncate("abcd", 0) == ""
+
+
+def test_counts_do_not_wait_for_a_loading_encoding():
+    counter = TokenCounter()
+    counter._lock.acquire()  # as if load() were still downloading
+    try:
+        assert counter.count("abcdefgh") == 2
+        assert counter.backend == "heuristic"
+    finally:
+        counter._lock.release()
+
+
+def test_everything_kept_when_it_fits():
+    items = [item("context", 10, 0.9, "a"), item("kb", 10, 0.5, "b")]
+    kept, usage = assemble(items, 100, HeuristicCounter())
+    assert names(kept) == ["a", "b"]
+    assert usage["used"] == 20
+    assert usage["dropped"] == 0
+    assert usage["by_section"] == {"context": 10, "kb": 10}
+
+
+def test_lowest_scores_dropped_first_and_order_kept():
+    items = [
+        item("context", 30, 0.9, "best"),
+        item("context", 30, 0.2, "worst"),
+        item("context", 30, 0.5, "middle"),
+    ]
+    kept, usage = assemble(items, 65, HeuristicCounter())
+    assert names(kept) == ["best", "middle"]
+    assert usage["dropped"] == 1
+    assert usage["used"] == 60
+
+
+def test_section_share_caps_a_section():
+    items = [
+        item("context", 20, 0.3, "chunk"),
+        item("kb", 20, 0.9, "kb1"),
+        item("kb", 20, 0.8, "kb2"),
+    ]
+    kept, _ = assemble(items, 100, HeuristicCounter(), {"kb": 0.25})
+    assert names(kept) == ["chunk", "kb1"]
+
+
+def test_oversized_item_is_truncated_to_fit():
+    items = [item("selection", 500, 1.0, "selection")]
+    kept, usage = assemble(items, 100, HeuristicCounter())
+    assert names(kept) == ["selection"]
+    assert kept[0].tokens == 100
+    assert usage["truncated"] == 1
+
+
+def test_non_positive_budget_keeps_nothing():
+    kept, usage = assemble([item("context", 5, 1.0, "a")], -10, HeuristicCounter())
+    assert kept == []
+    assert usage["budget"] == 0
+    assert usage["used"] == 0
@@ -0,0 +1,95 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from retrieval import (
+    RRF_K,
+    contiguous_runs,
+    estimate_tokens,
+    fuse_candidates,
+    neighbour_keys,
+    reciprocal_rank_fusion,
+    select_with_neighbours,
+    stitch_chunks,
+)
+from chunking import iter_chunks
+
+
+def test_rrf_rewards_ids_ranked_by_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]])
+    order = [key for key, _ in fused]
+    assert order[0] == "b"
+    assert set(order) == {"a", "b", "c", "d"}
+    assert dict(fused)["b"] == 1 / (RRF_K + 2) + 1 / (RRF_K + 1)
+
+
+def test_rrf_weights_scale_contribution():
+    fused = dict(reciprocal_rank_fusion([["a"], ["b"]], weights=[1.0, 2.0]))
+    assert fused["b"] == 2 * fused["a"]
+
+
+def test_rrf_ties_keep_first_seen_order():
+    fused = reciprocal_rank_fusion([["a"], ["b"]])
+    assert [key for key, _ in fused] == ["a", "b"]
+
+
+def test_fuse_candidates_merges_rows_and_labels_source():
+    vector = [{"id": 1, "text": "one", "similarity": 0.9}, {"id": 2, "text": "two", "similarity": 0.8}]
+    lexical = [{"id": 3, "text": "three", "similarity": 0.1, "lexical_rank": 0.5},
+               {"id": 2, "text": "two", "similarity": 0.8, "lexical_rank": 0.4}]
+    rows = fuse_candidates(vector, lexical, limit=3)
+
+    assert [r["id"] for r in rows] == [2, 1, 3]
+    assert [r["match"] for r in rows] == ["both", "vector", "lexical"]
+    assert rows[0]["lexical_rank"] == 0.4
+    assert rows[0]["rrf_score"] > rows[1]["rrf_score"]
+
+
+def test_fuse_candidates_lexical_only_and_limit():
+    lexical = [{"id": i, "text": str(i)} for i in range(5)]
+    rows = fuse_candidates([], lexical, limit=2)
+    assert [r["id"] for r in rows] == [0, 1]
+    assert all(r["match"] == "lexical" for r in rows)
+
+
+def test_neighbour_keys_skip_negative_indexes_and_duplicates():
+    keys = neighbour_keys([(1, 0), (1, 1)], window=1)
+    assert keys == [(1, 0), (1, 1), (1, 2)]
+
+
+def test_select_with_neighbours_fills_budget_best_hit_first():
+    texts = {(1, i): "x" * 40 for i in range(10)}  # 10 tokens each
+    selected = select_with_neighbours([(1, 5), (1, 1)], texts, window=1, token_budget=40)
+    # Hit 5 with both neighbours, then hit 1 alone; its neighbours don't fit
+    assert selected == [(1, 1), (1, 4), (1, 5), (1, 6)]
+
+
+def test_select_with_neighbours_skips_hit_over_budget():
+    texts = {(1, 0): "x" * 400, (1, 1): "x" * 40, (1, 2): "x" * 40}
+    assert select_with_neighbours([(1, 0), (1, 2)], texts, window=1, token_budget=30) == [(1, 1), (1, 2)]
+
+
+def test_contiguous_runs_split_on_gaps_and_documents():
+    runs = contiguous_runs([(1, 1), (1, 2), (1, 4), (2, 5), (2, 6)])
+    assert runs == [[(1, 1), (1, 2)], [(1, 4)], [(2, 5), (2, 6)]]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abc") == 1
+    assert estimate_tokens("x" * 400) == 100
+
+
+def test_stitch_chunks_drops_the_chunker_overlap():
+    text = " ".join(f"word{i}" for i in range(200))
+    chunks = list(iter_chunks(text, max_chunk_size=120, overlap=30))
+    assert len(chunks) > 2
+    assert stitch_chunks(chunks, 30) == text
+
+
+def test_stitch_chunks_keeps_separator_without_overlap():
+    assert stitch_chunks(["alpha beta", "gamma delta"], 30) == "alpha beta\n\ngamma delta"
+    # Partial-word matches are not overlap
+    assert stitch_chunks(["alpha beta", "eta gamma"], 30) == "alpha beta\n\neta gamma"
+    assert stitch_chunks(["only"], 30) == "only"
@@ -0,0 +1,54 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from usage_aggregator import UsageAggregator, bucket_start
+
+
+class RecordingAggregator(UsageAggregator):
+    def __init__(self, fail=False):
+        super().__init__(connection_factory=None)
+        self.fail = fail
+        self.writes = []
+
+    def _write(self, counts, bucket):
+        if self.fail:
+            raise ConnectionError("db down")
+        self.writes.append(counts)
+
+
+def test_bucket_start_rounds_down():
+    assert bucket_start(1_000_123, 300) == datetime.datetime.fromtimestamp(
+        999_900, tz=datetime.timezone.utc
+    )
+
+
+def test_counts_are_aggregated_into_one_sorted_write():
+    usage = RecordingAggregator()
+    usage.record([5, 2])
+    usage.record([5])
+    assert usage.flush() == 2
+    assert usage.writes == [{2: 1, 5: 2}]
+    assert list(usage.writes[0]) == [2, 5]
+    assert usage.flush() == 0
+
+
+def test_failed_flush_keeps_counts_for_retry():
+    usage = RecordingAggregator(fail=True)
+    usage.record([1, 1])
+    assert usage.flush() == 0
+    usage.record([1])
+    usage.fail = False
+    usage.flush()
+    assert usage.writes == [{1: 3}]
+    assert usage.stats()["errors"] == 1
+
+
+def test_stop_flushes_pending_counts():
+    usage = RecordingAggregator()
+    usage.start()
+    usage.record([9])
+    usage.stop()
+    assert usage.writes == [{9: 1}]
@@ -0,0 +1,151 @@
+import datetime
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List
+
+
+def bucket_start(timestamp: float, bucket_seconds: int) -> datetime.datetime:
+    start = int(timestamp // bucket_seconds) * bucket_seconds
+    return datetime.datetime.fromtimestamp(start, tz=datetime.timezone.utc)
+
+
+class UsageAggregator:
+    """
+    Write-behind counter for knowledge_base.usage_count.
+
+    ``record`` only bumps an in-memory counter. A background thread flushes
+    the accumulated counts every ``flush_interval`` seconds with one
+    UPDATE ... FROM (VALUES ...) and adds them to the time-bucketed
+    kb_usage_history table. Failed flushes are merged back and retried;
+    ``stop`` performs a final flush.
+    """
+
+    def __init__(
+        self,
+        connection_factory: Callable,
+        flush_interval: float = 5.0,
+        bucket_seconds: int = 300,
+    ):
+        self._connection_factory = connection_factory
+        self.flush_interval = flush_interval
+        self.bucket_seconds = max(1, int(bucket_seconds))
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._flushes = 0
+        self._rows_flushed = 0
+        self._errors = 0
+        self._last_flush_at = None
+
+    def record(self, entry_ids: Iterable[int]):
+        with self._lock:
+            self._pending.update(entry_ids)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="kb-usage", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> int:
+        """Write pending counts; returns the number of entries flushed."""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._pending = self._pending, Counter()
+            if not counts:
+                return 0
+            try:
+                # Sorted ids keep row-lock order consistent across processes
+                self._write(dict(sorted(counts.items())), bucket_start(time.time(), self.bucket_seconds))
+            except Exception as e:
+                print(f"[KB] Usage flush failed, will retry: {e}")
+                with self._lock:
+                    self._pending.update(counts)
+                    self._errors += 1
+                return 0
+            with self._lock:
+                self._flushes += 1
+                self._rows_flushed += len(counts)
+                self._last_flush_at = time.time()
+            return len(counts)
+
+    def _write(self, counts: Dict[int, int], bucket: datetime.datetime):
+        from psycopg2.extras import execute_values
+
+        with self._connection_factory() as conn:
+            c = conn.cursor()
+            execute_values(
+                c,
+                """
+                UPDATE knowledge_base AS kb
+                SET usage_count = COALESCE(kb.usage_count, 0) + v.uses
+                FROM (VALUES %s) AS v(id, uses)
+                WHERE kb.id = v.id
+                """,
+                list(counts.items()),
+            )
+            # Join on knowledge_base so entries deleted meanwhile are skipped
+            execute_values(
+                c,
+                """
+                INSERT INTO kb_usage_history (entry_id, bucket_start, uses)
+                SELECT v.id, v.bucket, v.uses
+                FROM (VALUES %s) AS v(id, bucket, uses)
+                JOIN knowledge_base kb ON kb.id = v.id
+                ON CONFLICT (entry_id, bucket_start)
+                DO UPDATE SET uses = kb_usage_history.uses + EXCLUDED.uses
+                """,
+                [(entry_id, bucket, uses) for entry_id, uses in counts.items()],
+                template="(%s, %s::timestamptz, %s)",
+            )
+            conn.commit()
+
+    def hot_entries(self, minutes: int = 60, limit: int = 20) -> List[dict]:
+        """Most-used KB entries over the last ``minutes`` (flushed counts only)."""
+        with self._connection_factory() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                SELECT h.entry_id, kb.question, SUM(h.uses) AS uses,
+                       COALESCE(kb.usage_count, 0)
+                FROM kb_usage_history h
+                JOIN knowledge_base kb ON kb.id = h.entry_id
+                WHERE h.bucket_start >= now() - make_interval(mins => %s)
+                GROUP BY h.entry_id, kb.question, kb.usage_count
+                ORDER BY uses DESC
+                LIMIT %s
+                """,
+                (minutes, limit),
+            )
+            rows = c.fetchall()
+        return [
+            {"id": r[0], "question": r[1], "recent_uses": int(r[2]), "usage_count": r[3]}
+            for r in rows
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending_entries": len(self._pending),
+                "pending_uses": sum(self._pending.values()),
+                "flushes": self._flushes,
+                "entries_flushed": self._rows_flushed,
+                "errors": self._errors,
+                "last_flush_at": self._last_flush_at,
+                "flush_interval": self.flush_interval,
+                "bucket_seconds": self.bucket_seconds,
+            }
@@ -10,6 +10,20 @@ GlobalWorkerOptions.workerSrc = new URL(
 
 const BACKEND = process.env.REACT_APP_BACKEND_URL || "http://localhost:5000";
 
+// Poll an /upload job until ingestion finishes; resolves with the job result
+async function waitForUploadJob(statusUrl, interval = 1000, timeout = 10 * 60 * 1000) {
+  const deadline = Date.now() + timeout;
+  while (Date.now() < deadline) {
+    const res = await fetch(`${BACKEND}${statusUrl}`);
+    if (!res.ok) throw new Error(`job status ${res.status}`);
+    const job = await res.json();
+    if (job.status === "completed") return job.result;
+    if (job.status === "failed") throw new Error(job.error || "ingestion failed");
+    await new Promise(resolve => setTimeout(resolve, interval));
+  }
+  throw new Error("timed out waiting for indexing");
+}
+
 // ─────────────────────────────────────────────────────────────────────────────
 // CONFIG
 // ─────────────────────────────────────────────────────────────────────────────
@@ -677,20 +691,22 @@ export default function GridApp() {
         const blob = new Blob([parsed.text], { type: "text/plain" });
         fd.append("files", blob, file.name);
 
-        let docId = null;
+        // /upload only queues ingestion; the document is searchable once its job completes
+        let uploadJob = null;
         try {
           const res = await fetch(`${BACKEND}/upload`, { method: "POST", body: fd });
           if (res.ok) {
             const data = await res.json();
-            if (Array.isArray(data) && data[0]?.document_id) docId = data[0].document_id;
+            if (Array.isArray(data) && data[0]?.status_url) uploadJob = data[0];
           }
         } catch (_) {}
 
         const docType = /contract|agreement/i.test(file.name) ? "contract"
           : /code|statute|regulation/i.test(file.name) ? "statute" : "case";
 
+        const localId = Date.now();
         const newDoc = {
-          id:                docId || Date.now(),
+          id:                localId,
           name:              file.name,
           text:              parsed.text,
           pages:             parsed.pages,
@@ -701,6 +717,7 @@ export default function GridApp() {
           arrayBuffer:       parsed.arrayBuffer        || null,
           convertedFromDocx: parsed.convertedFromDocx  || false,
           type:              docType,
+          indexing:          !!uploadJob,
         };
 
         setDocs(prev => [...prev, newDoc]);
@@ -709,7 +726,7 @@ export default function GridApp() {
         setSuggestions([]);
         setMessages([{
           id: Date.now(), role: "assistant", model: task?.model,
-          text: `"${file.name}" processed — ${parsed.pages} page${parsed.pages !== 1 ? "s" : ""} indexed. Ask a question or click a suggested question above.`,
+          text: `"${file.name}" processed — ${parsed.pages} page${parsed.pages !== 1 ? "s" : ""}${uploadJob ? ", indexing for search" : " indexed"}. Ask a question or click a suggested question above.`,
           citations: [],
         }]);
 
@@ -717,6 +734,19 @@ export default function GridApp() {
         fetchSuggestions(parsed.text.slice(0, 2500), file.name, task?.model || "llama3.1:8b");
         searchPrecedents(parsed.text.slice(0, 300), file.name);
 
+        if (uploadJob) {
+          waitForUploadJob(uploadJob.status_url)
+            .then(result => {
+              const docId = result?.document_id ?? localId;
+              setDocs(prev => prev.map(d => d.id === localId ? { ...d, id: docId, indexing: false } : d));
+              setActiveDocId(prev => prev === localId ? docId : prev);
+            })
+            .catch(err => {
+              setDocs(prev => prev.map(d => d.id === localId ? { ...d, indexing: false } : d));
+              setUploadErr(`Indexing ${file.name} failed: ${err.message}`);
+            });
+        }
+
       } catch (err) {
         setUploadErr(`Error processing ${file.name}: ${err.message}`);
       }
@@ -1130,7 +1160,7 @@ export default function GridApp() {
                     wordBreak: "break-word", marginBottom: "2px",
                   }}>{doc.name}</div>
                   <div style={{ fontSize: "10px", color: "#9ca3af", fontFamily: "'Courier New',monospace" }}>
-                    {doc.pages} page{doc.pages !== 1 ? "s" : ""}
+                    {doc.pages} page{doc.pages !== 1 ? "s" : ""}{doc.indexing ? " · indexing…" : ""}
                   </div>
                 </div>
               );